@@ -1,4 +1,4 @@
 __version__ = '1.0.17'
 VERSION = __version__
 
-__all__ = ['app', 'lib']
+__all__ = ['app', 'lib', 'sim']
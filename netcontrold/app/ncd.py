@@ -20,14 +20,14 @@ __all__ = ['ncd_main']
 # import system libraries
 import re
 import signal
-import time
 import argparse
 import sys
-import socket
 import os
 import logging
 import threading
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
 
@@ -36,6 +36,20 @@ from netcontrold.lib import config
 from netcontrold.lib import dataif
 from netcontrold.lib import util
 from netcontrold.lib import error
+from netcontrold.lib import rebal
+from netcontrold.lib import ovsdb
+from netcontrold.lib import detect
+from netcontrold.lib import sched
+from netcontrold.lib import hifreq
+from netcontrold.lib import rollup
+from netcontrold.lib import tsstore
+from netcontrold.lib import capture
+from netcontrold.lib import perf
+from netcontrold.lib import profile
+from netcontrold.lib import memtrack
+from netcontrold.lib import overhead
+from netcontrold.lib import journal
+from netcontrold.lib import snapshot
 
 
 class RebalContext(dataif.Context):
@@ -44,19 +58,84 @@ class RebalContext(dataif.Context):
     rebal_tick = 0
     rebal_tick_n = 0
     apply_rebal = False
+    rebal_ctrl = None
+    shift_detect = None
+    shift_trigger = False
+    sample_interval = 0
+    sample_sched = None
+    samples_req = 0
 
 
 class TraceContext(dataif.Context):
     trace_mode = False
 
 
+class HiFreqContext(dataif.Context):
+    hf_sampler = None
+
+
+class RollupContext(dataif.Context):
+    rollup_store = None
+    ts_store = None
+
+
+class JournalContext(dataif.Context):
+    journal = None
+
+
+def journal_flags():
+    """
+    Return map of every mode and its flag, as persisted in journal.
+    """
+
+    return {
+        "trace_mode": TraceContext.trace_mode,
+        "rebalance_mode": RebalContext.rebal_mode,
+        "verbose_log": dataif.Context.log_handler.level == logging.DEBUG,
+    }
+
+
 nlog = None
 
 
+class _Reply(object):
+    """
+    Class to collect reply of a control command, as written into the
+    connection of its client.
+    """
+
+    def __init__(self):
+        self.data = b""
+
+    def sendall(self, data):
+        self.data += data
+
+
+# commands only reading state of the daemon, which need not wait for
+# other commands but for main loop changing it.
+_CTLD_READ_ONLY = ('CTLD_STATUS', 'CTLD_EVENTS', 'CTLD_CONFIG',
+                   'CTLD_REBAL_CNT', 'CTLD_VERSION', 'CTLD_HIFREQ_STATS',
+                   'CTLD_ROLLUP', 'CTLD_TIMINGS', 'CTLD_OVERHEAD',
+                   'CTLD_MEM', 'CTLD_MEM_DIFF')
+
+# commands switching modes persisted in journal.
+_CTLD_MODES = ('CTLD_TRACE_ON', 'CTLD_TRACE_OFF', 'CTLD_REBAL_ON',
+               'CTLD_REBAL_OFF', 'CTLD_VERBOSE_ON', 'CTLD_VERBOSE_OFF')
+
+
 class CtlDThread(util.Thread):
+    """
+    Class to represent thread serving control commands on the unix
+    socket, through asyncio, isolated from sampling in main loop.
+    Every client may send any number of commands, each in a line, and
+    its replies are written in the same order. Commands are run in a
+    pool of threads, and those changing state of the daemon are run
+    one at a time.
+    """
 
     def __init__(self, eobj):
         util.Thread.__init__(self, eobj)
+        self.lock = threading.Lock()
 
     def run(self):
         sock_file = config.ncd_socket
@@ -69,175 +148,491 @@ class CtlDThread(util.Thread):
 
         os.makedirs(os.path.dirname(sock_file), exist_ok=True)
 
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.set_default_executor(
+            ThreadPoolExecutor(config.ncd_ctl_workers))
 
         nlog.info("starting ctld on %s" % sock_file)
-        sock.bind(sock_file)
-        sock.listen(1)
+        server = loop.run_until_complete(asyncio.start_unix_server(
+            self.session, sock_file, limit=config.ncd_ctl_line_max))
 
-        while (not self.ncd_shutdown.is_set()):
-            conn, client = sock.accept()
+        try:
+            loop.run_until_complete(self.wait_shutdown())
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+    async def wait_shutdown(self):
+        while not self.ncd_shutdown.is_set():
+            await asyncio.sleep(1)
+
+    async def session(self, reader, writer):
+        """
+        Serve commands of a client until it disconnects, or stays idle
+        for ncd_ctl_idle_timeout seconds.
+        """
+
+        loop = asyncio.get_event_loop()
+        try:
+            while not self.ncd_shutdown.is_set():
+                try:
+                    line = await asyncio.wait_for(
+                        reader.readline(), config.ncd_ctl_idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except ValueError:
+                    nlog.info("control command too long ..!")
+                    break
+
+                if not line:
+                    break
+
+                cmd = line.decode(errors='replace').strip()
+                if not cmd:
+                    continue
+
+                try:
+                    reply = await loop.run_in_executor(None, self.dispatch,
+                                                       cmd)
+                except Exception as e:
+                    nlog.warn("control command %s failed: %s" % (cmd, e))
+                    break
+
+                writer.write(reply)
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+    def dispatch(self, cmd):
+        """
+        Return reply of the control command, running it alone unless
+        it only reads state of the daemon. Reading commands wait only
+        for main loop to finish changing the sampled state.
+        """
+
+        if cmd.split()[0] in _CTLD_READ_ONLY:
+            with dataif.Context.lock:
+                return self.handle(cmd)
+
+        with self.lock:
+            return self.handle(cmd)
+
+    def handle(self, cmd):
+        """
+        Run the control command and return its reply.
+        """
+
+        conn = _Reply()
+
+        ctx = dataif.Context
+        rctx = RebalContext
+        tctx = TraceContext
+        hctx = HiFreqContext
+
+        if cmd == 'CTLD_TRACE_ON':
+            if not tctx.trace_mode:
+                nlog.info("turning on trace mode ..")
+                tctx.trace_mode = True
+            else:
+                nlog.info("trace mode already on ..!")
 
-            try:
-                cmd = conn.recv(24).decode()
+            conn.sendall(b"CTLD_ACK")
 
-                ctx = dataif.Context
-                rctx = RebalContext
-                tctx = TraceContext
+        elif cmd == 'CTLD_TRACE_OFF':
+            if tctx.trace_mode:
+                nlog.info("turning off trace mode ..")
+                tctx.trace_mode = False
+            else:
+                nlog.info("trace mode already off ..!")
 
-                if cmd == 'CTLD_TRACE_ON':
-                    if not tctx.trace_mode:
-                        nlog.info("turning on trace mode ..")
-                        tctx.trace_mode = True
-                    else:
-                        nlog.info("trace mode already on ..!")
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_REBAL_ON':
+            if not rctx.rebal_mode:
+                nlog.info("turning on rebalance mode ..")
+                rctx.rebal_mode = True
+            else:
+                nlog.info("rebalance mode already on ..!")
 
-                elif cmd == 'CTLD_TRACE_OFF':
-                    if tctx.trace_mode:
-                        nlog.info("turning off trace mode ..")
-                        tctx.trace_mode = False
-                    else:
-                        nlog.info("trace mode already off ..!")
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_REBAL_OFF':
+            if rctx.rebal_mode:
+                nlog.info("turning off rebalance mode ..")
+                rctx.rebal_mode = False
+            else:
+                nlog.info("rebalance mode already off ..!")
 
-                elif cmd == 'CTLD_REBAL_ON':
-                    if not rctx.rebal_mode:
-                        nlog.info("turning on rebalance mode ..")
-                        rctx.rebal_mode = True
-                    else:
-                        nlog.info("rebalance mode already on ..!")
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_REBAL_QUICK_ON':
+            if not rctx.rebal_quick:
+                nlog.info("turning on rebalance quick mode ..")
+                rctx.rebal_quick = True
+            else:
+                nlog.info("rebalance quick mode already on ..!")
 
-                elif cmd == 'CTLD_REBAL_OFF':
-                    if rctx.rebal_mode:
-                        nlog.info("turning off rebalance mode ..")
-                        rctx.rebal_mode = False
-                    else:
-                        nlog.info("rebalance mode already off ..!")
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_REBAL_QUICK_OFF':
+            if rctx.rebal_quick:
+                nlog.info("turning off rebalance quick mode ..")
+                rctx.rebal_quick = False
+            else:
+                nlog.info("rebalance quick mode already off ..!")
 
-                elif cmd == 'CTLD_REBAL_QUICK_ON':
-                    if not rctx.rebal_quick:
-                        nlog.info("turning on rebalance quick mode ..")
-                        rctx.rebal_quick = True
-                    else:
-                        nlog.info("rebalance quick mode already on ..!")
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_HIFREQ_ON':
+            if not hctx.hf_sampler:
+                nlog.info("turning on high-frequency mode ..")
+                hctx.hf_sampler = hifreq.HfSampler(self.ncd_shutdown)
+                hctx.hf_sampler.start()
+            else:
+                nlog.info("high-frequency mode already on ..!")
 
-                elif cmd == 'CTLD_REBAL_QUICK_OFF':
-                    if rctx.rebal_quick:
-                        nlog.info("turning off rebalance quick mode ..")
-                        rctx.rebal_quick = False
-                    else:
-                        nlog.info("rebalance quick mode already off ..!")
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_HIFREQ_OFF':
+            if hctx.hf_sampler:
+                nlog.info("turning off high-frequency mode ..")
+                hctx.hf_sampler.stop()
+                hctx.hf_sampler.join(util.Thread.timeout)
+                hctx.hf_sampler = None
+            else:
+                nlog.info("high-frequency mode already off ..!")
 
-                elif cmd == 'CTLD_VERBOSE_ON':
-                    fh = ctx.log_handler
-                    if fh.level == logging.INFO:
-                        nlog.info("turning on verbose mode ..")
-                        fh.setLevel(logging.DEBUG)
-                    else:
-                        nlog.info("verbose mode already on ..!")
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_HIFREQ_STATS':
+            hfs = hctx.hf_sampler
+            if not hfs:
+                status = "high-frequency mode: off\n"
+            else:
+                status = "high-frequency mode: on (%d ms)\n" % (
+                    hfs.interval * 1000)
+                status += "samples: %d (errors %d)\n" % (
+                    len(hfs.ring), hfs.n_errors)
+                status += "cpu cost: %.2f ms/s\n" % (
+                    hfs.cpu_cost * 1000)
+                status += "%-8s | %-10s | %-10s | %s\n" % (
+                    'pmd', 'load', 'load max', 'load mean')
+                status += ('-' * 9) + '+' + ('-' * 12) + '+' + \
+                    ('-' * 12) + '+' + ('-' * 11) + '\n'
+                summary = hfs.ring.summary()
+                for pmd_id in sorted(summary.keys()):
+                    status += "%-8d | %-10.1f | %-10.1f | %.1f\n" % (
+                        (pmd_id, ) + summary[pmd_id])
+
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
+
+        elif cmd.startswith('CTLD_ROLLUP '):
+            args = cmd.split()[1:]
+            try:
+                period = int(args[0])
+                res = None
+                if len(args) > 1:
+                    res = int(args[1])
+            except (IndexError, ValueError):
+                period = 0
+
+            status = "%-24s | %-19s | %-8s | %-8s | %-8s | %s\n" % (
+                'Object', 'Time stamp', 'min', 'mean', 'max',
+                'count')
+            status += ('-' * 25) + '+' + ('-' * 21) + '+' + \
+                ('-' * 10) + '+' + ('-' * 10) + '+' + \
+                ('-' * 10) + '+' + ('-' * 6) + '\n'
+
+            store = RollupContext.rollup_store
+            if store and period > 0:
+                end = ctx.clock.wall()
+                out = store.query(end - period, end, res)
+                for key in sorted(out.keys(), key=str):
+                    obj = " ".join([str(k) for k in key])
+                    for (ts, vmin, vmean, vmax, n) in out[key]:
+                        ts_str = datetime.fromtimestamp(
+                            ts).strftime("%Y-%m-%d %H:%M:%S")
+                        status += "%-24s | %-19s | %-8.1f | " \
+                            "%-8.1f | %-8.1f | %d\n" % (
+                                obj, ts_str, vmin, vmean, vmax, n)
+
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
+
+        elif cmd == 'CTLD_TIMINGS':
+            status = "%-40s | %-8s | %-10s | %-10s | %s\n" % (
+                'Phase', 'count', 'p50 ms', 'p99 ms', 'max ms')
+            status += ('-' * 41) + '+' + ('-' * 10) + '+' + \
+                ('-' * 12) + '+' + ('-' * 12) + '+' + ('-' * 10)
+            status += '\n'
+
+            summary = perf.timings.summary()
+            for name in sorted(summary.keys()):
+                (n, p50, p99, pmax) = summary[name]
+                status += "%-40s | %-8d | %-10.3f | %-10.3f | " \
+                    "%.3f\n" % (name, n, p50 * 1000, p99 * 1000,
+                                pmax * 1000)
+
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
+
+        elif cmd == 'CTLD_TIMINGS_CLEAR':
+            perf.timings.clear()
+            conn.sendall(b"CTLD_ACK")
+
+        elif cmd == 'CTLD_OVERHEAD':
+            status = "%-22s | %-8s | %-10s | %-9s | %-9s | " \
+                "%-9s | %-7s | %s\n" % (
+                    'Phase', 'count', 'wall s', 'user s', 'sys s',
+                    'child s', 'cpu %', 'csw vol/invol')
+            status += ('-' * 23) + '+' + ('-' * 10) + '+' + \
+                ('-' * 12) + '+' + ('-' * 11) + '+' + \
+                ('-' * 11) + '+' + ('-' * 11) + '+' + \
+                ('-' * 9) + '+' + ('-' * 14) + '\n'
+
+            summary = overhead.overhead.summary()
+            for name in sorted(summary.keys()):
+                (n, last, total) = summary[name]
+                for (label, u) in (("last", last),
+                                   ("total", total)):
+                    cpu = u.user + u.sys
+                    pct = (cpu * 100 / u.wall) if u.wall else 0.0
+                    status += "%-22s | %-8d | %-10.3f | " \
+                        "%-9.3f | %-9.3f | %-9.3f | %-7.2f | " \
+                        "%d/%d\n" % (
+                            "%s (%s)" % (name, label), n, u.wall,
+                            u.user, u.sys,
+                            u.child_user + u.child_sys, pct,
+                            u.vol_csw, u.invol_csw)
+
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
+
+        elif cmd in ('CTLD_MEM', 'CTLD_MEM_DIFF'):
+            status = "RSS: %d KiB\n\n" % (memtrack.rss() // 1024)
+
+            status += "%-32s | %s\n" % ('Object', 'count')
+            status += ('-' * 33) + '+' + ('-' * 8) + '\n'
+            counts = memtrack.model_counts()
+            for name in sorted(counts.keys()):
+                status += "%-32s | %d\n" % (name, counts[name])
+
+            status += "\n%-32s | %s\n" % ('Ring', 'size')
+            status += ('-' * 33) + '+' + ('-' * 8) + '\n'
+            sizes = memtrack.ring_sizes(ctx)
+            if hctx.hf_sampler:
+                sizes["hifreq samples"] = len(hctx.hf_sampler.ring)
+            for name in sorted(sizes.keys()):
+                status += "%-32s | %d\n" % (name, sizes[name])
+
+            if cmd == 'CTLD_MEM':
+                top = memtrack.tracker.top()
+                title = 'Allocated at'
+            else:
+                top = memtrack.tracker.diff()
+                title = 'Grown since snapshot at'
+
+            if top:
+                status += "\n%-48s | %-12s | %s\n" % (
+                    title, 'KiB', 'blocks')
+                status += ('-' * 49) + '+' + ('-' * 14) + '+' + \
+                    ('-' * 8) + '\n'
+                for (where, (size, count)) in top:
+                    status += "%-48s | %-12.1f | %d\n" % (
+                        where, size / 1024.0, count)
+            else:
+                status += "\nno memory snapshot taken.\n"
+
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
+
+        elif cmd == 'CTLD_MEM_SNAP':
+            nlog.info("taking memory snapshot ..")
+            memtrack.tracker.take_snapshot()
+            conn.sendall(b"CTLD_ACK")
+
+        elif cmd == 'CTLD_MEM_CLEAR':
+            nlog.info("dropping memory snapshot ..")
+            memtrack.tracker.clear()
+            conn.sendall(b"CTLD_ACK")
+
+        elif cmd.startswith('CTLD_PROF_START '):
+            mode = cmd.split()[1]
+            if mode not in (profile.MODE_SAMPLE,
+                            profile.MODE_CPROFILE):
+                status = "unknown profiler %s\n" % mode
+            else:
+                path = profile.profiler.start(mode, self.ncd_shutdown)
+                if path:
+                    nlog.info("profiling (%s) into %s .."
+                              % (mode, path))
+                    status = "profiling into %s\n" % path
+                else:
+                    status = "profiler already running\n"
 
-                elif cmd == 'CTLD_VERBOSE_OFF':
-                    fh = ctx.log_handler
-                    if fh.level == logging.DEBUG:
-                        nlog.info("turning off verbose mode ..")
-                        fh.setLevel(logging.INFO)
-                    else:
-                        nlog.info("verbose mode already off ..!")
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
 
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_PROF_STOP':
+            path = profile.profiler.stop()
+            if path:
+                nlog.info("profile written into %s .." % path)
+                status = "profile written into %s\n" % path
+            else:
+                status = "profiler not running\n"
 
-                elif cmd == 'CTLD_REBAL_CNT':
-                    n = 0
-                    if rctx.rebal_mode:
-                        n = len(rctx.rebal_stat)
-                        for (x, y, z) in ctx.events:
-                            if y == 'rebalance':
-                                n += 1
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
 
-                    conn.sendall(b"CTLD_DATA_ACK %6d" % (len(str(n))))
-                    conn.sendall(str(n).encode())
+        elif cmd.startswith('CTLD_SAMPLES '):
+            try:
+                n = int(cmd.split()[1])
+            except ValueError:
+                n = 0
 
-                elif cmd == 'CTLD_CONFIG':
-                    status = "trace mode:"
-                    if tctx.trace_mode:
-                        status += " on\n"
-                    else:
-                        status += " off\n"
+            if 2 <= n <= config.ncd_samples_limit:
+                nlog.info("resizing sample window to %d .." % n)
+                rctx.samples_req = n
+            else:
+                nlog.info("invalid sample window %s ..!"
+                          % cmd.split()[-1])
 
-                    status += "rebalance mode:"
-                    if rctx.rebal_mode:
-                        status += " on\n"
-                    else:
-                        status += " off\n"
+            conn.sendall(b"CTLD_ACK")
 
-                    status += "rebalance quick:"
-                    if rctx.rebal_quick:
-                        status += " on\n"
-                    else:
-                        status += " off\n"
+        elif cmd == 'CTLD_VERBOSE_ON':
+            fh = ctx.log_handler
+            if fh.level == logging.INFO:
+                nlog.info("turning on verbose mode ..")
+                fh.setLevel(logging.DEBUG)
+            else:
+                nlog.info("verbose mode already on ..!")
 
-                    status += "verbose log:"
-                    fh = ctx.log_handler
-                    if fh.level == logging.DEBUG:
-                        status += " on\n"
-                    else:
-                        status += " off\n"
+            conn.sendall(b"CTLD_ACK")
 
-                    conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
-                    conn.sendall(status.encode())
+        elif cmd == 'CTLD_VERBOSE_OFF':
+            fh = ctx.log_handler
+            if fh.level == logging.DEBUG:
+                nlog.info("turning off verbose mode ..")
+                fh.setLevel(logging.INFO)
+            else:
+                nlog.info("verbose mode already off ..!")
 
-                elif cmd == 'CTLD_STATUS':
-                    status = "%-16s | %-12s | %s\n" % ('Interface',
-                                                       'Event', 'Time stamp')
-                    status += ('-' * 17) + '+' + ('-' * 14) + '+' + ('-' * 28)
-                    status += '\n'
+            conn.sendall(b"CTLD_ACK")
 
-                    for (x, y, z) in ctx.events:
-                        status += "%-16s | %-12s | %s\n" % (x, y, z)
+        elif cmd == 'CTLD_REBAL_CNT':
+            n = 0
+            if rctx.rebal_mode:
+                n = ctx.events.count('rebalance')
 
-                    conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
-                    conn.sendall(status.encode())
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(str(n))))
+            conn.sendall(str(n).encode())
 
-                elif cmd == 'CTLD_STATUS_CLEAR':
-                    ctx.events = []
-                    conn.sendall(b"CTLD_ACK")
+        elif cmd == 'CTLD_CONFIG':
+            status = "trace mode:"
+            if tctx.trace_mode:
+                status += " on\n"
+            else:
+                status += " off\n"
 
-                elif cmd == 'CTLD_VERSION':
-                    status = "netcontrold v%s\n" % netcontrold.__version__
-                    ret = util.exec_host_command("ovs-vsctl -V")
-                    if ret == 1:
-                        status += "openvswitch (unknown)\n"
-                    else:
-                        parse = re.match("ovs-vsctl \(Open vSwitch\) (.*?)\n",
-                                         ret)
-                        status += "openvswitch v%s\n" % parse[1]
+            status += "rebalance mode:"
+            if rctx.rebal_mode:
+                status += " on\n"
+            else:
+                status += " off\n"
 
-                    conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
-                    conn.sendall(status.encode())
+            status += "rebalance quick:"
+            if rctx.rebal_quick:
+                status += " on\n"
+            else:
+                status += " off\n"
 
-                else:
-                    nlog.info("unknown control command %s" % cmd)
+            status += "verbose log:"
+            fh = ctx.log_handler
+            if fh.level == logging.DEBUG:
+                status += " on\n"
+            else:
+                status += " off\n"
+
+            status += "high-frequency mode:"
+            if hctx.hf_sampler:
+                status += " on\n"
+            else:
+                status += " off\n"
+
+            status += "sample window: %d\n" % config.ncd_samples_max
 
-            finally:
-                conn.close()
+            status += "sample interval:"
+            if rctx.sample_sched:
+                sch = rctx.sample_sched
+                status += " %.1f sec (adaptive %.1f to %.1f)\n" % (
+                    sch.interval, sch.interval_min,
+                    sch.interval_max)
+            else:
+                status += " %.1f sec\n" % rctx.sample_interval
 
-        return
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
 
+        elif (cmd == 'CTLD_STATUS' or
+              cmd.startswith('CTLD_EVENTS ')):
+            status = "%-16s | %-12s | %s\n" % ('Interface',
+                                               'Event', 'Time stamp')
+            status += ('-' * 17) + '+' + ('-' * 14) + '+' + ('-' * 28)
+            status += '\n'
+
+            if cmd == 'CTLD_STATUS':
+                (rows, cursor) = ctx.events.rows()
+                status += rows
+            else:
+                try:
+                    cursor = int(cmd.split()[1])
+                except ValueError:
+                    cursor = 0
+
+                (rows, cursor) = ctx.events.rows(
+                    cursor, config.ncd_events_page)
+                status += rows
+                status += "next: %d\n" % cursor
+
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
+
+        elif cmd == 'CTLD_STATUS_CLEAR':
+            ctx.events.clear()
+            conn.sendall(b"CTLD_ACK")
+
+        elif cmd == 'CTLD_VERSION':
+            status = "netcontrold v%s\n" % netcontrold.__version__
+            ret = util.exec_host_command("ovs-vsctl -V")
+            if ret == 1:
+                status += "openvswitch (unknown)\n"
+            else:
+                parse = re.match("ovs-vsctl \(Open vSwitch\) (.*?)\n",
+                                 ret)
+                status += "openvswitch v%s\n" % parse[1]
+
+            conn.sendall(b"CTLD_DATA_ACK %6d" % (len(status)))
+            conn.sendall(status.encode())
+
+        else:
+            nlog.info("unknown control command %s" % cmd)
+            conn.sendall(b"CTLD_ACK")
 
-def collect_data(n_samples, s_sampling):
+        # persist modes switched by the command.
+        if JournalContext.journal and cmd in _CTLD_MODES:
+            JournalContext.journal.set_flags(journal_flags())
+
+        return conn.data
+
+
+def collect_data(n_samples, s_sampling, adapt=False):
     """
     Collect various stats and rxqs mapping of every pmd in the vswitch.
 
@@ -248,27 +643,46 @@ def collect_data(n_samples, s_sampling):
 
     s_sampling: int
         sampling interval
+
+    adapt: bool, optional
+        whether to adapt sampling interval to the state of pmds, and
+        cut sampling short on sudden shift in pmd load or port drops
+        (default is False)
+
+    Returns
+    -------
+    int
+        number of samples taken.
     """
 
     ctx = dataif.Context
     rctx = RebalContext
 
-    # collect samples of pmd and rxq stats.
+    # collect samples of pmd and rxq stats, every sample scheduled
+    # against monotonic clock so that time taken in collecting them
+    # does not stretch sampling interval.
+    clock = ctx.clock
+    last_ts = clock.now()
+    deadline = last_ts
     idx_max = n_samples
     idx_gen = (o for o in range(0, idx_max))
+    n_sampled = 0
     while True:
         try:
             next(idx_gen)
         except StopIteration:
             break
 
+        # profile main loop in this thread, if requested.
+        profile.profiler.poll()
+
         try:
-            rctx.rebal_tick += 1
-            dataif.get_port_stats()
-            dataif.get_interface_stats()
-            dataif.get_pmd_stats(ctx.pmd_map)
-            dataif.get_pmd_rxqs(ctx.pmd_map)
-            dataif.get_coverage_stats(ctx.coverage_map)
+            with ctx.lock, perf.timer("collect_sample"):
+                dataif.get_port_stats()
+                dataif.get_interface_stats()
+                dataif.get_pmd_stats(ctx.pmd_map)
+                dataif.get_pmd_rxqs(ctx.pmd_map)
+                dataif.get_coverage_stats(ctx.coverage_map)
         except (error.OsCommandExc,
                 error.ObjCreateExc,
                 error.ObjConsistencyExc,
@@ -297,14 +711,16 @@ def collect_data(n_samples, s_sampling):
                 ctx.events.append(("ncd", "retry_model", now_ts))
 
                 # reset collected data
-                ctx.pmd_map.clear()
-                ctx.port_to_cls.clear()
-                ctx.port_to_id.clear()
+                with ctx.lock:
+                    ctx.pmd_map.clear()
+                    ctx.port_to_cls.clear()
+                    ctx.port_to_id.clear()
 
                 # restart iterations
                 idx_gen.close()
                 idx_max = config.ncd_samples_max
                 idx_gen = (o for o in range(0, idx_max))
+                n_sampled = 0
                 continue
 
             elif isinstance(e, error.ObjParseExc):
@@ -312,15 +728,18 @@ def collect_data(n_samples, s_sampling):
                 ctx.events.append(("ncd", "retry_parse", now_ts))
 
                 # reset collected data
-                ctx.pmd_map.clear()
-                ctx.port_to_cls.clear()
-                ctx.port_to_id.clear()
+                with ctx.lock:
+                    ctx.pmd_map.clear()
+                    ctx.port_to_cls.clear()
+                    ctx.port_to_id.clear()
 
                 # restart iterations
                 idx_gen.close()
                 idx_max = config.ncd_samples_max
                 idx_gen = (o for o in range(0, idx_max))
-                time.sleep(s_sampling)
+                n_sampled = 0
+                clock.sleep(s_sampling)
+                deadline = clock.now()
                 continue
 
             else:
@@ -328,26 +747,99 @@ def collect_data(n_samples, s_sampling):
                 ctx.events.append(("ncd", "exception", now_ts))
                 raise error.NcdShutdownExc
 
-        time.sleep(s_sampling)
+        n_sampled += 1
+
+        # add this sample into history of every pmd, rxq and port.
+        store = RollupContext.rollup_store
+        if store:
+            store.feed(clock.wall(), ctx.pmd_map, ctx.port_to_cls)
+
+        # persist this sample, if store is available.
+        ts_store = RollupContext.ts_store
+        if ts_store:
+            try:
+                ts_store.feed(clock.wall(), ctx.pmd_map, ctx.port_to_cls)
+            except (OSError, ValueError) as e:
+                nlog.warn("unable to store sample: %s" % e)
+                ts_store.close()
+                RollupContext.ts_store = None
+
+        # check this sample for sudden shift, to dry-run right away.
+        if adapt and rctx.shift_detect:
+            shift = rctx.shift_detect.update(ctx.pmd_map, ctx.port_to_cls)
+            if shift:
+                now = datetime.now()
+                now_ts = now.strftime("%Y-%m-%d %H:%M:%S")
+                nlog.info("sudden shift in %s, cutting sampling short .."
+                          % ", ".join(shift))
+                ctx.events.append(("ncd", "shift", now_ts))
+                rctx.shift_trigger = True
+                if rctx.sample_sched:
+                    rctx.sample_sched.hasten()
+
+                # next sample follows this one right away.
+                rctx.shift_detect.skip_next()
+                break
+
+        interval = s_sampling
+        if adapt and rctx.sample_sched:
+            interval = rctx.sample_sched.next_interval(ctx.pmd_map)
+            nlog.debug("next sample in %.1f sec .." % interval)
+
+        deadline += interval
+        now_mt = clock.now()
+        if deadline < now_mt:
+            nlog.debug("sampling behind by %.2f sec .."
+                       % (now_mt - deadline))
+            deadline = now_mt
+
+        clock.sleep_until(deadline)
+
+        now_mt = clock.now()
+        rctx.rebal_tick += (now_mt - last_ts)
+        last_ts = now_mt
+
+    for pmd_id in sorted(ctx.pmd_map.keys()):
+        pmd = ctx.pmd_map[pmd_id]
+        nlog.debug("pmd %d sampled %d times in %.2f sec"
+                   % (pmd_id, pmd.cyc_n,
+                      dataif.cyc_elapsed(pmd.cyc_ts, pmd.cyc_idx,
+                                         pmd.cyc_n)))
 
     now = datetime.now()
     ctx.last_ts = now.strftime("%Y-%m-%d %H:%M:%S")
-    dataif.update_pmd_load(ctx.pmd_map)
+    with ctx.lock:
+        dataif.update_pmd_load(ctx.pmd_map)
 
-    return ctx
+    return n_sampled
 
 
-def rebalance_switch(pmd_map):
+def rebalance_affinity(pmd_map, moves=None):
     """
-    Issue appropriate actions in vswitch to rebalance.
+    Return rxq affinity of the ports, as the dry-run has placed rxqs
+    in pmds.
 
     Parameters
     ----------
     pmd_map : dict
         mapping of pmd id and its Dataif_Pmd object.
+    moves : dict, optional
+        rxq moves of the dry-run to be applied, as a map of (port name,
+        rxq id) and (source pmd id, target pmd id). Other rxqs moved
+        in the dry-run are retained in their source pmd (default is
+        to apply all the moves).
+
+    Returns
+    -------
+    dict
+        mapping of port name and its pmd-rxq-affinity, or None when
+        the port need not have any affinity.
     """
 
-    port_to_pmdq = {}
+    plan = {}
+    if moves is not None:
+        plan = dataif.rebalance_plan(pmd_map)
+
     non_isol_pmds = []
     numa = 0
     for pmd_id, pmd in pmd_map.items():
@@ -355,58 +847,483 @@ def rebalance_switch(pmd_map):
         if pmd.numa_id == numa:
             non_isol_pmds.append(pmd)
             numa += 1
-            continue
 
+    non_isol_ids = [pmd.id for pmd in non_isol_pmds]
+    port_to_pmdq = {}
+    for pmd_id, pmd in pmd_map.items():
         for port_name, port in pmd.port_map.items():
-            if port_name not in port_to_pmdq and len(port.rxq_map) != 0:
-                port_to_pmdq[port_name] = ""
             for rxq_id in port.rxq_map:
-                port_to_pmdq[port_name] += "%d:%d," % (rxq_id, pmd_id)
+                # rxq not moved yet stays in its source pmd.
+                rxq_pmd_id = pmd_id
+                if ((port_name, rxq_id) in plan and
+                        (port_name, rxq_id) not in moves):
+                    rxq_pmd_id = plan[(port_name, rxq_id)][0]
+
+                if rxq_pmd_id in non_isol_ids:
+                    continue
+
+                if port_name not in port_to_pmdq:
+                    port_to_pmdq[port_name] = ""
+                port_to_pmdq[port_name] += "%d:%d," % (rxq_id, rxq_pmd_id)
+
+    # ensure non-isolated pmd carry new rxqs, arriving from other pmds.
+    for pmd in non_isol_pmds:
+        for port_name in pmd.port_map:
+            if port_name not in port_to_pmdq:
+                port_to_pmdq[port_name] = None
+
+    return port_to_pmdq
+
+
+def affinity_diff(cur_aff, new_aff):
+    """
+    Return rxq affinity of only those ports that need a change.
+
+    Parameters
+    ----------
+    cur_aff : dict
+        mapping of port name and its pmd-rxq-affinity in the vswitch.
+    new_aff : dict
+        mapping of port name and its pmd-rxq-affinity to be set, or
+        None to remove it.
+    """
 
-    # refresh ports info and check for any port removed now.
     ctx = dataif.Context
-    ctx.port_to_id.clear()
-    dataif.get_port_stats()
-    cmd = ""
-    for port_name, pmdq in port_to_pmdq.items():
-        if port_name not in ctx.port_to_id:
+    port_aff = {}
+    for port_name, pmdq in new_aff.items():
+        # check for any port removed now.
+        if port_name not in cur_aff:
             now = datetime.now()
             now_ts = now.strftime("%Y-%m-%d %H:%M:%S")
-            nlog.info("not setting affinity for an unavailable port %s"
+            nlog.info("not changing affinity for an unavailable port %s"
                       % (port_name))
             ctx.events.append((port_name, "skip", now_ts))
             continue
-        cmd += "-- set Interface %s other_config:pmd-rxq-affinity=%s " % (
-            port_name, pmdq)
 
-    # ensure non-isolated pmd carry new rxqs, arriving from other pmds.
-    for pmd in non_isol_pmds:
-        for port_name, port in pmd.port_map.items():
-            if port_name not in ctx.port_to_id:
-                now = datetime.now()
-                now_ts = now.strftime("%Y-%m-%d %H:%M:%S")
-                nlog.info("not resetting affinity for unavailable port %s"
-                          % (port_name))
-                ctx.events.append((port_name, "skip", now_ts))
-                continue
-            if port_name not in port_to_pmdq:
-                cmd += "-- remove Interface %s other_config pmd-rxq-affinity "\
-                    % (port_name)
+        if (dataif.parse_affinity(cur_aff[port_name]) ==
+                dataif.parse_affinity(pmdq)):
+            nlog.debug("affinity unchanged for port %s" % port_name)
+            continue
+
+        port_aff[port_name] = pmdq
+
+    return port_aff
+
+
+def affinity_command(port_aff):
+    """
+    Return vswitch command to set rxq affinity of the ports, or an
+    empty string if there is none to set.
+
+    Parameters
+    ----------
+    port_aff : dict
+        mapping of port name and its pmd-rxq-affinity to be set, or
+        None to remove it.
+    """
+
+    cmd = ""
+    for port_name, pmdq in port_aff.items():
+        if pmdq:
+            cmd += "-- set Interface %s other_config:pmd-rxq-affinity=%s "\
+                % (port_name, pmdq)
+        else:
+            cmd += "-- remove Interface %s other_config pmd-rxq-affinity "\
+                % (port_name)
+
+    if not cmd:
+        return cmd
+
     return "ovs-vsctl --no-wait %s" % cmd
 
 
-def ncd_kill(signal, frame):
+def interface_affinity():
+    """
+    Return rxq affinity of every interface in the vswitch, or None if
+    it could not be collected, so that rebalance is skipped for now.
+    """
+
+    try:
+        return dataif.get_interface_affinity()
+    except error.OsCommandExc as e:
+        nlog.warn("unable to collect rxq affinity: %s" % e)
+        now = datetime.now()
+        now_ts = now.strftime("%Y-%m-%d %H:%M:%S")
+        dataif.Context.events.append(("switch", "error", now_ts))
+        return None
+
+
+@perf.timed("rebalance_switch")
+def rebalance_switch(pmd_map, moves=None, cur_aff=None):
+    """
+    Return rxq affinity to be set in vswitch to rebalance. Only the
+    ports whose rxq affinity change are included.
+
+    Parameters
+    ----------
+    pmd_map : dict
+        mapping of pmd id and its Dataif_Pmd object.
+    moves : dict, optional
+        rxq moves of the dry-run to be applied (default is all).
+    cur_aff : dict, optional
+        mapping of port name and its pmd-rxq-affinity in the vswitch
+        (default is to read from vswitch).
+    """
+
+    if cur_aff is None:
+        cur_aff = interface_affinity()
+        if cur_aff is None:
+            return {}
+
+    new_aff = rebalance_affinity(pmd_map, moves)
+    return affinity_diff(cur_aff, new_aff)
+
+
+@perf.timed("switch_affinity")
+def switch_affinity(port_aff):
+    """
+    Set rxq affinity of the ports in vswitch, in one OVSDB transaction
+    if its socket is available, or through ovs-vsctl otherwise.
+
+    Parameters
+    ----------
+    port_aff : dict
+        mapping of port name and its pmd-rxq-affinity to be set, or
+        None to remove it.
+
+    Returns
+    -------
+    tuple
+        whether the change is accepted, and whether vswitchd is known
+        to have applied it.
+    """
+
+    if os.path.exists(config.ovsdb_socket):
+        nlog.info("vswitch transaction for rxq affinity: %s" % port_aff)
+        try:
+            if ovsdb.set_affinity(port_aff, config.ovsdb_socket,
+                                  config.ncd_vsw_wait_max):
+                return (True, True)
+
+            nlog.info("vswitchd did not apply changes in %d seconds .."
+                      % config.ncd_vsw_wait_max)
+            return (True, False)
+        except error.OsCommandExc as e:
+            nlog.info("%s, falling back to ovs-vsctl .." % e)
+
+    cmd = affinity_command(port_aff)
+    nlog.info("vswitch command for rxq affinity is: %s" % cmd)
+    return ((util.exec_host_command(cmd) != 1), False)
+
+
+def rx_drop_max():
+    """
+    Return the highest rx drop (in ppm) among the ports in datapath.
+    """
+
+    ctx = dataif.Context
+    drop = 0
+    for port in ctx.port_to_cls.values():
+        drop = max(drop, dataif.port_drop_ppm(port)[0])
+
+    return drop
+
+
+def rollback_rebalance(port_aff):
+    """
+    Restore rxq affinity in the ports, as it was before rebalance.
+
+    Parameters
+    ----------
+    port_aff : dict
+        mapping of port name and its pmd-rxq-affinity (or None) before
+        rebalance.
+    """
+
+    cur_aff = interface_affinity()
+    if cur_aff is None:
+        return 1
+
+    port_aff = affinity_diff(cur_aff, port_aff)
+    if not port_aff:
+        return 0
+
+    nlog.info("rolling back rxq affinity ..")
+    (ret, settled) = switch_affinity(port_aff)
+    return (0 if ret else 1)
+
+
+def measure_pmd_load(n_samples, s_sampling):
+    """
+    Sample pmds afresh and return their load score along with the
+    highest rx drop (in ppm) among the ports.
+
+    Parameters
+    ----------
+    n_samples : int
+        number of samples
+
+    s_sampling: int
+        sampling interval
+    """
+
+    ctx = dataif.Context
+
+    # begin with new samples as pmds have changed.
+    with ctx.lock:
+        ctx.pmd_map.clear()
+        ctx.port_to_cls.clear()
+        ctx.port_to_id.clear()
+
+    collect_data(n_samples, s_sampling)
+
+    return (dataif.pmd_load_score(ctx.pmd_map), rx_drop_max())
+
+
+def verify_rebalance(plan, port_aff, prev_drop, measure):
+    """
+    Check whether pmd load really improved once rebalance is applied.
+    Otherwise, rollback rxq affinity in the ports.
+
+    Parameters
+    ----------
+    plan : object
+        RebalPlan object for the rebalance applied.
+    port_aff : dict
+        mapping of port name and its pmd-rxq-affinity before rebalance.
+    prev_drop : float
+        highest rx drop (in ppm) among the ports before rebalance.
+    measure : tuple
+        pmd load score and highest rx drop measured after rebalance.
+    """
+
     ctx = dataif.Context
     rctx = RebalContext
-    tctx = TraceContext
+
+    (plan.measured_var, cur_drop) = measure
+    nlog.info("pmd load score: before rebalance %d, estimated %d, "
+              "measured %d" % (plan.prev_var, plan.cur_var,
+                               plan.measured_var))
+    nlog.info("highest rx drop: before rebalance %d ppm, measured %d ppm"
+              % (prev_drop, cur_drop))
+
+    # improvement measured should be near the one estimated in dry-run.
+    gain = plan.prev_var - plan.cur_var
+    short = (plan.measured_var - plan.cur_var) * 100
+    rollback = False
+    if plan.measured_var > plan.prev_var:
+        nlog.info("rebalance did not improve pmd load, rolling back ..")
+        rollback = True
+    elif gain > 0 and short > (gain * config.ncd_verify_var_margin):
+        nlog.info("pmd load fell short of estimate by %d%%, rolling "
+                  "back .." % (short / gain))
+        rollback = True
+    elif cur_drop > (prev_drop + config.ncd_verify_drop_margin):
+        nlog.info("rx drop went up after rebalance, rolling back ..")
+        rollback = True
+
+    if rollback:
+        plan.outcome = "rollback"
+        if (rollback_rebalance(port_aff) == 1):
+            nlog.info("problem running rollback.. check vswitch!")
+            plan.outcome = "error"
+        elif rctx.rebal_ctrl:
+            # rxqs are back in their pmds, so need no cooldown.
+            rctx.rebal_ctrl.revert(plan)
+
+        ctx.events.append(("pmd", plan.outcome, ctx.last_ts))
+        return False
+
+    plan.outcome = "verified"
+    ctx.events.append(("pmd", plan.outcome, ctx.last_ts))
+    return True
+
+
+def apply_rebalance(port_aff):
+    """
+    Set rxq affinity in vswitch for rebalance and wait for vswitch to
+    settle.
+
+    Parameters
+    ----------
+    port_aff : dict
+        mapping of port name and its pmd-rxq-affinity to be set, or
+        None to remove it.
+    """
+
+    ctx = dataif.Context
+
+    if not port_aff:
+        nlog.info("no change in affinity of the ports ..")
+        return True
+
+    (ret, settled) = switch_affinity(port_aff)
+    if not ret:
+        nlog.info("problem setting rxq affinity.. check vswitch!")
+        now = datetime.now()
+        now_ts = now.strftime("%Y-%m-%d %H:%M:%S")
+        ctx.events.append(("switch", "error", now_ts))
+
+    if not settled:
+        # sleep for few seconds before thrashing current dry-run, and
+        # long enough for pmds to settle when their load is verified.
+        wait = config.ncd_vsw_wait_min
+        if config.ncd_verify_samples:
+            wait = max(wait, config.ncd_vsw_settle_min)
+
+        nlog.info("waiting for %d seconds before new dry runs begin.."
+                  % wait)
+        ctx.clock.sleep(wait)
+
+    return ret
+
+
+def rebalance_staged(pmd_map, moves, pmd_load, target_var, s_sampling,
+                     cur_aff=None):
+    """
+    Apply rebalance in batches of rxq moves, the ones with highest
+    benefit first. After every batch, pmd load is sampled and the
+    remaining batches are skipped once estimated load is reached.
+
+    Parameters
+    ----------
+    pmd_map : dict
+        mapping of pmd id and its Dataif_Pmd object, after dry-run.
+    moves : dict
+        map of (port name, rxq id) and (source pmd id, target pmd id)
+    pmd_load : dict
+        mapping of pmd id and its load before dry-run.
+    target_var : float
+        estimated load score of pmds after dry-run.
+    s_sampling: int
+        sampling interval
+    cur_aff : dict, optional
+        mapping of port name and its pmd-rxq-affinity in the vswitch
+        (default is to read from vswitch).
+
+    Returns
+    -------
+    tuple
+        rxq moves applied, and pmd load score and highest rx drop
+        measured after last batch (or None if not measured).
+    """
+
+    move_l = rebal.order_moves(pmd_map, moves, pmd_load)
+    batch_n = config.ncd_rebal_batch_n
+
+    # prepare affinity for all the batches, as sampling pmds in between
+    # batches resets the dry-run. Every batch sets the full dry-run
+    # affinity of the ports having rxqs in source or target pmds of its
+    # moves. Pinning a port isolates every pmd in its affinity, so the
+    # ports in those pmds are pinned as well, until no other pmd gets
+    # isolated. Last batch sets affinity of all the ports, as
+    # rebalance_switch does. Only the ports whose affinity differ from
+    # previous batch are changed.
+    if cur_aff is None:
+        cur_aff = interface_affinity()
+        if cur_aff is None:
+            return ({}, None)
+
+    batch_l = []
+    applied = {}
+    for i in range(0, len(move_l), batch_n):
+        pmd_ids = set()
+        for key in move_l[i:(i + batch_n)]:
+            applied[key] = moves[key]
+            pmd_ids.update(moves[key])
+
+        new_aff = rebalance_affinity(pmd_map, applied)
+        if (i + batch_n) < len(move_l):
+            port_names = set()
+            pmd_l = list(pmd_ids)
+            while pmd_l:
+                pmd_id = pmd_l.pop()
+                for port_name in pmd_map[pmd_id].port_map:
+                    if port_name in port_names:
+                        continue
+
+                    port_names.add(port_name)
+                    pmdq = dataif.parse_affinity(new_aff.get(port_name))
+                    for rxq_pmd_id in set(pmdq.values()) - pmd_ids:
+                        pmd_ids.add(rxq_pmd_id)
+                        pmd_l.append(rxq_pmd_id)
+
+            new_aff = {port_name: pmdq for (port_name, pmdq)
+                       in new_aff.items() if port_name in port_names}
+
+        port_aff = affinity_diff(cur_aff, new_aff)
+        cur_aff.update(port_aff)
+        batch_l.append((dict(applied), port_aff))
+
+    measure = None
+    for i, (applied, port_aff) in enumerate(batch_l):
+        nlog.info("applying rebalance batch %d of %d (%d rxqs) .."
+                  % (i + 1, len(batch_l), len(applied)))
+        apply_rebalance(port_aff)
+
+        if not config.ncd_verify_samples:
+            continue
+
+        measure = measure_pmd_load(config.ncd_verify_samples, s_sampling)
+        nlog.info("pmd load score after batch %d: %d (estimated %d)"
+                  % (i + 1, measure[0], target_var))
+        if measure[0] <= target_var:
+            nlog.info("estimated pmd load reached, skipping rest ..")
+            break
+
+    return (applied, measure)
+
+
+def resize_samples(n_samples):
+    """
+    Resize sample window, dropping the samples collected so far as they
+    were sized for older window.
+
+    Parameters
+    ----------
+    n_samples : int
+        number of samples in new window.
+    """
+
+    ctx = dataif.Context
+
+    with ctx.lock:
+        config.ncd_samples_max = n_samples
+        ctx.pmd_map.clear()
+        ctx.port_to_cls.clear()
+        ctx.port_to_id.clear()
+        ctx.coverage_map.clear()
+
+
+# signal to stop ncd for a restart, retaining rxq affinity in ports.
+signal_restart = signal.SIGHUP
+
+
+def ncd_kill(signal, frame):
+    ctx = dataif.Context
 
     nlog.critical("Got signal %s, doing required clean up .." % signal)
 
-    # reset rebalance settings in ports
+    # save samples so far, for a warm restart.
+    saved = False
+    if config.ncd_snapshot_file and ctx.pmd_map:
+        try:
+            snapshot.save(config.ncd_snapshot_file, ctx)
+            nlog.info("saved samples in %s" % config.ncd_snapshot_file)
+            saved = True
+        except (IOError, OSError) as e:
+            nlog.warn("unable to save samples: %s" % e)
+
+    # reset rebalance settings in ports, unless restarting with samples
+    # saved. As vswitchd would place rxqs afresh on reset, saved samples
+    # would not match the rxq placement on restart.
+    retain = saved and (signal == signal_restart)
     cmd = ""
+    if retain:
+        nlog.info("retaining pmd-rxq-affinity in rebalanced ports.")
     for port_name, port in ctx.port_to_cls.items():
         # skip port that we did not rebalance.
-        if not port.rebalance:
+        if retain or not port.rebalance:
             continue
 
         cmd += "-- remove Interface %s other_config pmd-rxq-affinity " % (
@@ -420,22 +1337,12 @@ def ncd_kill(signal, frame):
             nlog.warn("removing pmd-rxq-affinity failed for some ports.")
             nlog.warn("you may check ovs-vsctl --no-wait %s" % cmd)
 
-    os.makedirs(os.path.dirname(config.ncd_dump_file), exist_ok=True)
-    with open(config.ncd_dump_file, 'w') as f:
-        fh = ctx.log_handler
-        json.dump({
-            "time": "%s" % datetime.now(),
-            "version": netcontrold.__version__,
-            "events": ctx.events,
-            "config": {
-                "trace_mode": tctx.trace_mode,
-                "rebalance_mode": rctx.rebal_mode,
-                "verbose_log": fh.level == logging.DEBUG,
-            },
-        }, f)
-
+    jnl = JournalContext.journal
+    if jnl:
+        jnl.set_flags(journal_flags())
+        jnl.sync()
         nlog.info("saved current configuration and data in %s" %
-                  config.ncd_dump_file)
+                  config.ncd_journal_file)
 
     raise error.NcdShutdownExc
 
@@ -450,6 +1357,21 @@ def ncd_main(argv):
                          default=10,
                          help='seconds between each sampling (default: 10)')
 
+    argpobj.add_argument('--sample-interval-min',
+                         type=float,
+                         default=config.ncd_sample_interval_min,
+                         help='shortest seconds between each sampling, '
+                         'when sampling adapts to pmd load (default: %s)'
+                         % config.ncd_sample_interval_min)
+
+    argpobj.add_argument('--sample-interval-max',
+                         type=float,
+                         default=config.ncd_sample_interval_max,
+                         help='longest seconds between each sampling, '
+                         'to adapt sampling to pmd load, or 0 to '
+                         'sample at fixed interval (default: %s)'
+                         % config.ncd_sample_interval_max)
+
     argpobj.add_argument('-t', '--trace',
                          required=False,
                          action='store_true',
@@ -487,6 +1409,13 @@ def ncd_main(argv):
                          help='rebalance by iterative queues logic '
                                 '(default: False)')
 
+    argpobj.add_argument('--rebalance-batch',
+                         type=int,
+                         default=config.ncd_rebal_batch_n,
+                         help='rxqs moved in one vswitch reconfiguration, '
+                         'zero for all at once (default: %d)'
+                         % config.ncd_rebal_batch_n)
+
     argpobj.add_argument('-q', '--quiet',
                          action='store_true',
                          default=False,
@@ -497,6 +1426,31 @@ def ncd_main(argv):
                          default=False,
                          help='trace logging (default: False)')
 
+    argpobj.add_argument('--record',
+                         type=str,
+                         default=None,
+                         help='record outputs of vswitch commands into '
+                         'capture file')
+
+    argpobj.add_argument('--replay',
+                         type=str,
+                         default=None,
+                         help='replay outputs of vswitch commands from '
+                         'capture file, instead of running them')
+
+    argpobj.add_argument('--simulate',
+                         type=str,
+                         default=None,
+                         help='run against vswitch simulated from scenario '
+                         'file, instead of the host')
+
+    argpobj.add_argument('--replay-speed',
+                         type=float,
+                         default=1.0,
+                         help='times faster than real time to replay or '
+                         'simulate, or 0 for as fast as possible '
+                         '(default: 1.0)')
+
     args = argpobj.parse_args(argv)
 
     # check input to ncd
@@ -539,9 +1493,77 @@ def ncd_main(argv):
     ctx.log_handler = fh
     pmd_map = ctx.pmd_map
 
+    # record or replay outputs of vswitch commands.
+    capture_writer = None
+    if args.replay:
+        try:
+            reader = capture.CaptureReader(args.replay)
+        except (IOError, error.OsCommandExc) as e:
+            print("unable to read capture: %s" % e)
+            sys.exit(1)
+
+        if not reader.index:
+            print("no records in capture %s!" % args.replay)
+            sys.exit(1)
+
+        nlog.info("replaying %s at %sx speed .."
+                  % (args.replay, args.replay_speed))
+        ctx.clock = capture.ReplayClock(args.replay_speed,
+                                        reader.start_time())
+        util.set_command_backend(capture.Replayer(reader, ctx.clock))
+
+        # vswitch is not reconfigured and samples are not stored, while
+        # replaying.
+        config.ovsdb_socket = ""
+        config.ncd_tsstore_dir = ""
+        config.ncd_snapshot_file = ""
+
+    elif args.simulate:
+        # simulator is loaded only when it is asked for.
+        from netcontrold.sim import switch as simswitch
+
+        ctx.clock = capture.ReplayClock(args.replay_speed)
+        try:
+            sim = simswitch.load_scenario(args.simulate, ctx.clock)
+        except (IOError, KeyError, TypeError, ValueError) as e:
+            print("unable to load scenario: %s" % e)
+            sys.exit(1)
+
+        nlog.info("simulating %s at %sx speed .."
+                  % (args.simulate, args.replay_speed))
+        util.set_command_backend(sim)
+
+        # vswitch is reconfigured only through ovs-vsctl, and samples
+        # are not stored, while simulating.
+        config.ovsdb_socket = ""
+        config.ncd_tsstore_dir = ""
+        config.ncd_snapshot_file = ""
+
+    elif args.record:
+        try:
+            capture_writer = capture.CaptureWriter(args.record)
+        except IOError as e:
+            print("unable to create capture: %s" % e)
+            sys.exit(1)
+
+        nlog.info("recording into %s .." % args.record)
+        util.set_command_backend(capture.Recorder(capture_writer,
+                                                  ctx.clock))
+
     # set sampling interval to collect data
     ncd_sample_interval = args.sample_interval
 
+    # set adaptive sampling interval
+    config.ncd_sample_interval_min = args.sample_interval_min
+    config.ncd_sample_interval_max = args.sample_interval_max
+    if (config.ncd_sample_interval_max and
+            not (0 < config.ncd_sample_interval_min <=
+                 config.ncd_sample_interval_max)):
+        print("invalid range of sample interval %s to %s!"
+              % (config.ncd_sample_interval_min,
+                 config.ncd_sample_interval_max))
+        sys.exit(1)
+
     # set interval between each re-balance
     ncd_rebal_interval = args.rebalance_interval
 
@@ -551,6 +1573,9 @@ def ncd_main(argv):
     # set iterative queue rebalance algorithm
     ncd_iq_rebal = args.rebalance_iq
 
+    # set rxqs moved in every batch of rebalance
+    config.ncd_rebal_batch_n = args.rebalance_batch
+
     # set rebalance method.
     if ncd_iq_rebal:
         rebalance_dryrun = dataif.rebalance_dryrun_by_iq
@@ -563,7 +1588,26 @@ def ncd_main(argv):
 
     # set check point to call rebalance in vswitch
     rctx = RebalContext
-    rctx.rebal_tick_n = ncd_rebal_interval / ncd_sample_interval
+    rctx.rebal_tick_n = ncd_rebal_interval
+    rctx.sample_interval = ncd_sample_interval
+    rctx.rebal_ctrl = rebal.RebalController()
+    if config.ncd_detect_shift:
+        rctx.shift_detect = detect.ShiftDetector()
+
+    if config.ncd_rollup_tiers:
+        RollupContext.rollup_store = rollup.RollupStore()
+
+    if config.ncd_tsstore_dir:
+        try:
+            RollupContext.ts_store = tsstore.TsStore()
+        except OSError as e:
+            nlog.warn("unable to open sample store: %s" % e)
+
+    if config.ncd_sample_interval_max:
+        rctx.sample_sched = sched.SampleScheduler(
+            config.ncd_sample_interval_min,
+            config.ncd_sample_interval_max,
+            ncd_sample_interval)
 
     if ncd_rebal:
         # adjust length of the samples counter
@@ -578,6 +1622,7 @@ def ncd_main(argv):
     # set signal handler to abort ncd
     signal.signal(signal.SIGINT, ncd_kill)
     signal.signal(signal.SIGTERM, ncd_kill)
+    signal.signal(signal_restart, ncd_kill)
 
     tctx = TraceContext
     if ncd_trace:
@@ -600,48 +1645,104 @@ def ncd_main(argv):
     ncd_samples_max = config.ncd_samples_max
     min_sample_i = 0
 
-    # retrieve ncd dump if exists.
-    ncd_dump = None
-    if os.path.exists(config.ncd_dump_file):
+    # restore events and modes from journal, or from dump of older
+    # versions if there is no journal yet.
+    try:
+        jnl = journal.Journal(config.ncd_journal_file)
+        events = list(jnl.events)
+        flags = jnl.flags
+    except OSError as e:
+        nlog.warn("unable to open journal: %s" % e)
+        jnl = None
+        events = []
+        flags = {}
+
+    if not (events or flags) and os.path.exists(config.ncd_dump_file):
         nlog.info("reading previous configuration and data from %s" %
                   config.ncd_dump_file)
         with open(config.ncd_dump_file, 'r') as f:
             ncd_dump = json.load(f)
 
-        ctx.events = ncd_dump["events"]
-        tctx.trace_mode = ncd_dump["config"]["trace_mode"]
-        rctx.rebal_mode = ncd_dump["config"]["rebalance_mode"]
-        fh = ctx.log_handler
-        if ncd_dump["config"]["verbose_log"]:
-            fh.setLevel(logging.DEBUG)
+        events = ncd_dump["events"]
+        flags = ncd_dump["config"]
+
+    if flags:
+        nlog.info("restoring %d events and modes from journal .."
+                  % len(events))
+        ctx.events.extend(events)
+        tctx.trace_mode = flags["trace_mode"]
+        rctx.rebal_mode = flags["rebalance_mode"]
+        if flags["verbose_log"]:
+            ctx.log_handler.setLevel(logging.DEBUG)
+
+    # start afresh with only the events restored and current modes.
+    if jnl:
+        jnl.events.clear()
+        jnl.events.extend([tuple(ev) for ev in ctx.events])
+        jnl.flags = journal_flags()
+        jnl.compact()
+        ctx.events.journal = jnl
+        JournalContext.journal = jnl
+
+    # restore samples saved on last exit, so that the first decision
+    # needs only one new sample.
+    if config.ncd_snapshot_file:
+        state = snapshot.load(config.ncd_snapshot_file)
+        if state:
+            os.remove(config.ncd_snapshot_file)
+            try:
+                reason = snapshot.check(state, ctx, snapshot.topology())
+            except error.OsCommandExc as e:
+                reason = str(e)
 
-    else:
-        os.makedirs(os.path.dirname(config.ncd_dump_file), exist_ok=True)
-        with open(config.ncd_dump_file, 'w') as f:
-            json.dump({
-                "time": "%s" % datetime.now(),
-                "version": netcontrold.__version__,
-                "events": ctx.events,
-                "config": {
-                    "trace_mode": tctx.trace_mode,
-                    "rebalance_mode": rctx.rebal_mode,
-                    "verbose_log": fh.level == logging.DEBUG,
-                },
-            }, f)
+            if reason:
+                nlog.info("not restoring saved samples: %s" % reason)
+            else:
+                with ctx.lock:
+                    snapshot.restore(state, ctx)
+                ncd_samples_max = 1
+                min_sample_i = config.ncd_samples_max - 1
+                nlog.info("restored samples of %d pmds from %s" %
+                          (len(pmd_map), config.ncd_snapshot_file))
 
     # begin rebalance dry run
     while (1):
         try:
-            collect_data(ncd_samples_max, ncd_sample_interval)
-            min_sample_i += ncd_samples_max
+            # resize sample window when requested, dropping the samples
+            # collected so far as they were sized for older window.
+            if rctx.samples_req:
+                resize_samples(rctx.samples_req)
+                rctx.samples_req = 0
+                ncd_samples_max = config.ncd_samples_max
+                min_sample_i = 0
+                nlog.info("sample window resized to %d."
+                          % config.ncd_samples_max)
+
+            rctx.shift_trigger = False
+            with overhead.accounted("collect cycle"):
+                min_sample_i += collect_data(ncd_samples_max,
+                                             ncd_sample_interval,
+                                             adapt=rctx.rebal_mode)
+
+            # log resources consumed by the daemon itself, periodically.
+            if overhead.overhead.log_due():
+                summary = overhead.overhead.summary()
+                for name in sorted(summary.keys()):
+                    (n, last, total) = summary[name]
+                    nlog.info("overhead of %s in %d runs: %s" %
+                              (name, n, overhead.usage_str(total)))
 
             nlog.info("current pmd load:")
+            pmd_load_prev = {}
             for pmd_id in sorted(pmd_map.keys()):
                 pmd = pmd_map[pmd_id]
                 nlog.info("pmd id %d load %d" % (pmd_id, pmd.pmd_load))
+                pmd_load_prev[pmd_id] = pmd.pmd_load
 
-            cur_var = dataif.pmd_load_variance(pmd_map)
-            nlog.info("current pmd load variance: %d" % cur_var)
+            cur_var = dataif.pmd_load_score(pmd_map)
+            nlog.info("current pmd load variance: %d (score %d)" %
+                      (dataif.pmd_load_variance(pmd_map), cur_var))
+            cur_drop = rx_drop_max()
 
             # do not trace if rebalance dry-run in progress.
             if tctx.trace_mode:
@@ -722,14 +1823,16 @@ def ncd_main(argv):
             else:
                 ncd_samples_max = config.ncd_samples_max
 
-            # dry-run pmd rebalance.
+            # dry-run pmd rebalance, leaving rxqs on hold in their pmds.
+            ctx.rxq_hold = rctx.rebal_ctrl.rxq_on_hold()
             rebal_rxq_n = 0
             if pmd_map:
-                for i in range(0, ncd_rebal_n):
-                    n = 0
-                    n = rebalance_dryrun(pmd_map)
-                    if (n > 0):
-                        rebal_rxq_n += n
+                with ctx.lock, overhead.accounted("dry-run"):
+                    for i in range(0, ncd_rebal_n):
+                        n = 0
+                        n = rebalance_dryrun(pmd_map)
+                        if (n > 0):
+                            rebal_rxq_n += n
 
             # restart sampling when no dry-run performed.
             if rebal_rxq_n == 0:
@@ -739,58 +1842,78 @@ def ncd_main(argv):
             else:
                 # compare previous and current state of pmds.
                 prev_var = cur_var
-                cur_var = dataif.pmd_load_variance(pmd_map)
+                cur_var = dataif.pmd_load_score(pmd_map)
                 nlog.info("pmd load after dry run:")
                 for pmd_id in sorted(pmd_map.keys()):
                     pmd = pmd_map[pmd_id]
                     nlog.info("pmd id %d load %d" % (pmd_id, pmd.pmd_load))
 
-                nlog.info("pmd load variance: previous %d, after dry run %d" %
+                nlog.info("pmd load score: previous %d, after dry run %d" %
                           (prev_var, cur_var))
 
-                if (cur_var < prev_var):
-                    diff = (prev_var - cur_var) * 100 / prev_var
-                    if diff > config.ncd_pmd_load_improve_min:
-                        rctx.apply_rebal = True
+                rebal_plan = dataif.rebalance_plan(pmd_map)
+                rctx.apply_rebal = rctx.rebal_ctrl.decide(
+                    rebal_plan, prev_var, cur_var)
 
                 # check if balance state of all pmds is reached
                 if rctx.apply_rebal:
-                    # check if rebalance call needed really.
-                    if (rctx.rebal_tick >= rctx.rebal_tick_n):
+                    # check if rebalance call needed really, unless
+                    # sudden shift asks for it, though not sooner than
+                    # ncd_detect_rebal_min since last rebalance.
+                    if ((rctx.shift_trigger and rctx.rebal_tick >=
+                            config.ncd_detect_rebal_min) or
+                            rctx.rebal_tick >= rctx.rebal_tick_n):
                         rctx.rebal_tick = 0
-                        cmd = rebalance_switch(pmd_map)
-                        ctx.events.append(("pmd", "rebalance", ctx.last_ts))
-                        nlog.info(
-                            "vswitch command for current optimization is: %s"
-                            % cmd)
                         rctx.apply_rebal = False
-
-                        if (util.exec_host_command(cmd) == 1):
-                            nlog.info(
-                                "problem running this command.. "
-                                "check vswitch!")
-                            now = datetime.now()
-                            now_ts = now.strftime("%Y-%m-%d %H:%M:%S")
-                            ctx.events.append(("switch", "error", now_ts))
-
-                        # sleep for few seconds before thrashing current
-                        # dry-run
-                        nlog.info(
-                            "waiting for %d seconds "
-                            "before new dry runs begin.."
-                            % config.ncd_vsw_wait_min)
-                        time.sleep(config.ncd_vsw_wait_min)
+                        port_aff = interface_affinity()
+                        if port_aff is None:
+                            nlog.info("skipping rebalance in this cycle ..")
+                        else:
+                            ctx.events.append(("pmd", "rebalance",
+                                               ctx.last_ts))
+
+                            measure = None
+                            batch_n = config.ncd_rebal_batch_n
+                            if batch_n and (len(rebal_plan) > batch_n):
+                                (rebal_plan, measure) = rebalance_staged(
+                                    pmd_map, rebal_plan, pmd_load_prev,
+                                    cur_var, ncd_sample_interval,
+                                    cur_aff=dict(port_aff))
+                            else:
+                                apply_rebalance(rebalance_switch(
+                                    pmd_map, cur_aff=dict(port_aff)))
+
+                            plan = rctx.rebal_ctrl.record(
+                                rebal_plan, prev_var, cur_var)
+
+                            # pmds are reconfigured, so is their usual load.
+                            if rctx.shift_detect:
+                                rctx.shift_detect.reset()
+
+                            # check whether pmds really got better.
+                            if config.ncd_verify_samples:
+                                if not measure:
+                                    nlog.info("verifying rebalance in %d "
+                                              "samples .."
+                                              % config.ncd_verify_samples)
+                                    measure = measure_pmd_load(
+                                        config.ncd_verify_samples,
+                                        ncd_sample_interval)
+
+                                verify_rebalance(plan, port_aff, cur_drop,
+                                                 measure)
                     else:
                         nlog.info("minimum rebalance interval not met!"
                                   " now at %d sec"
-                                  % (rctx.rebal_tick * ncd_sample_interval))
+                                  % rctx.rebal_tick)
                 else:
                     nlog.info("no new optimization found ..")
 
                 # reset collected data
-                pmd_map.clear()
-                ctx.port_to_cls.clear()
-                ctx.port_to_id.clear()
+                with ctx.lock:
+                    pmd_map.clear()
+                    ctx.port_to_cls.clear()
+                    ctx.port_to_id.clear()
                 ncd_samples_max = config.ncd_samples_max
                 min_sample_i = 0
 
@@ -798,6 +1921,12 @@ def ncd_main(argv):
 
         except error.NcdShutdownExc:
             nlog.info("Exiting NCD ..")
+            if RollupContext.ts_store:
+                RollupContext.ts_store.close()
+            if capture_writer:
+                capture_writer.close()
+            if JournalContext.journal:
+                JournalContext.journal.close()
             tobj.ncd_shutdown.set()
             sys.exit(1)
 
@@ -0,0 +1,331 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['CaptureWriter',
+           'CaptureReader',
+           'Recorder',
+           'Replayer',
+           'ReplayClock',
+           ]
+
+import json
+import struct
+import threading
+import time
+import zlib
+
+from netcontrold.lib import config
+from netcontrold.lib import util
+from netcontrold.lib.error import OsCommandExc
+
+# Capture file begins with magic, followed by blocks of records, each
+# as length and compressed json list of [time, command, output]. At
+# the end is compressed json index of commands recorded and
+# [first time, last time, offset] of every block, and trailer locating
+# the index.
+_MAGIC = b"NCDCAP01"
+_BLK = struct.Struct("<I")
+_TRAILER = struct.Struct("<QI8s")
+_TRAILER_MAGIC = b"NCDCAPIX"
+
+
+class CaptureWriter(object):
+    """
+    Class to write outputs of host commands into capture file.
+
+    Attributes
+    ----------
+    path : str
+        capture file.
+    block_n : int
+        records compressed together in a block.
+
+    Methods
+    -------
+    append(ts, cmd, output)
+        add a record.
+    close()
+        write pending records and index.
+    """
+
+    def __init__(self, path, block_n=None):
+        if block_n is None:
+            block_n = config.ncd_capture_block_n
+
+        self.path = path
+        self.block_n = block_n
+        self.pending = []
+        self.index = []
+        self.cmds = set()
+        self.lock = threading.Lock()
+        self.f = open(path, 'wb')
+        self.f.write(_MAGIC)
+
+    def _write_block(self):
+        if not self.pending:
+            return
+
+        data = zlib.compress(json.dumps(self.pending).encode())
+        self.index.append([self.pending[0][0], self.pending[-1][0],
+                           self.f.tell()])
+        self.f.write(_BLK.pack(len(data)))
+        self.f.write(data)
+        self.f.flush()
+        self.pending = []
+
+    def append(self, ts, cmd, output):
+        """
+        Add a record, writing a block when enough records are pending.
+
+        Parameters
+        ----------
+        ts : float
+            wall clock time (in sec) of the command.
+        cmd : str
+            command executed.
+        output : str or int
+            output of the command, or 1 when it failed.
+        """
+
+        with self.lock:
+            self.pending.append([ts, cmd, output])
+            self.cmds.add(cmd)
+            if len(self.pending) >= self.block_n:
+                self._write_block()
+
+    def close(self):
+        with self.lock:
+            if not self.f:
+                return
+
+            self._write_block()
+            offset = self.f.tell()
+            data = zlib.compress(json.dumps(
+                {"cmds": sorted(self.cmds), "blocks": self.index}).encode())
+            self.f.write(data)
+            self.f.write(_TRAILER.pack(offset, len(data), _TRAILER_MAGIC))
+            self.f.close()
+            self.f = None
+
+
+class CaptureReader(object):
+    """
+    Class to read records from capture file, block by block.
+
+    Attributes
+    ----------
+    path : str
+        capture file.
+    index : list
+        [first time, last time, offset] of every block.
+    cmds : set
+        commands recorded.
+
+    Methods
+    -------
+    records(start=None)
+        returns generator of records from the block holding start time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise OsCommandExc("%s is not a capture file" % path)
+
+            (self.cmds, self.index) = self._read_index(f)
+
+    def _read_index(self, f):
+        f.seek(0, 2)
+        size = f.tell()
+        if size >= len(_MAGIC) + _TRAILER.size:
+            f.seek(size - _TRAILER.size)
+            (offset, length, magic) = _TRAILER.unpack(f.read(_TRAILER.size))
+            if magic == _TRAILER_MAGIC:
+                f.seek(offset)
+                index = json.loads(zlib.decompress(f.read(length)).decode())
+                return (set(index["cmds"]), index["blocks"])
+
+        # capture was not closed, so build index by walking the blocks.
+        cmds = set()
+        index = []
+        offset = len(_MAGIC)
+        while True:
+            f.seek(offset)
+            hdr = f.read(_BLK.size)
+            if len(hdr) < _BLK.size:
+                break
+
+            (length, ) = _BLK.unpack(hdr)
+            data = f.read(length)
+            if len(data) < length:
+                break
+
+            try:
+                records = json.loads(zlib.decompress(data).decode())
+            except (zlib.error, ValueError):
+                break
+
+            index.append([records[0][0], records[-1][0], offset])
+            cmds.update([rec[1] for rec in records])
+            offset += _BLK.size + length
+
+        return (cmds, index)
+
+    def start_time(self):
+        if not self.index:
+            return None
+
+        return self.index[0][0]
+
+    def end_time(self):
+        if not self.index:
+            return None
+
+        return self.index[-1][1]
+
+    def records(self, start=None):
+        """
+        Return generator of records, from the block holding start time.
+
+        Parameters
+        ----------
+        start : float, optional
+            wall clock time (in sec) to begin with.
+        """
+
+        with open(self.path, 'rb') as f:
+            for (first, last, offset) in self.index:
+                if start is not None and last < start:
+                    continue
+
+                f.seek(offset)
+                (length, ) = _BLK.unpack(f.read(_BLK.size))
+                for rec in json.loads(
+                        zlib.decompress(f.read(length)).decode()):
+                    yield rec
+
+
+class Recorder(object):
+    """
+    Class to represent command backend, which runs commands in host
+    and records their outputs into capture file.
+    """
+
+    def __init__(self, writer, clock=None):
+        if clock is None:
+            clock = util.Clock()
+
+        self.writer = writer
+        self.clock = clock
+
+    def __call__(self, cmd):
+        ts = self.clock.wall()
+        output = util.run_host_command(cmd)
+        self.writer.append(ts, cmd, output)
+        return output
+
+
+class ReplayClock(util.Clock):
+    """
+    Class to represent clock of replay, which runs faster than real
+    time by speed times, or instantly when speed is zero.
+
+    Attributes
+    ----------
+    speed : float
+        how many times faster than real time.
+    """
+
+    def __init__(self, speed=1.0, wall_start=None):
+        self.speed = speed
+        self.mono = 0.0
+        if wall_start is None:
+            wall_start = time.time()
+
+        self.wall_start = wall_start
+        self.lock = threading.Lock()
+
+    def now(self):
+        return self.mono
+
+    def wall(self):
+        return self.wall_start + self.mono
+
+    def sleep(self, sec):
+        if sec <= 0:
+            return
+
+        if self.speed > 0:
+            time.sleep(sec / self.speed)
+
+        with self.lock:
+            self.mono += sec
+
+
+class Replayer(object):
+    """
+    Class to represent command backend, which returns outputs recorded
+    in capture file as of current time of replay clock. Commands not
+    in the capture (such as those changing the vswitch) succeed with
+    empty output.
+
+    Attributes
+    ----------
+    reader : object
+        CaptureReader object.
+    clock : object
+        ReplayClock object, starting at the beginning of capture.
+
+    Raises
+    ------
+    OsCommandExc
+        when replay has gone past the end of capture.
+    """
+
+    def __init__(self, reader, clock):
+        self.reader = reader
+        self.clock = clock
+        self.gen = reader.records(clock.wall())
+        self.next_rec = next(self.gen, None)
+        self.latest = {}
+
+    def _first_output(self, cmd):
+        for (ts, rcmd, output) in self.reader.records():
+            if rcmd == cmd:
+                return output
+
+        return ""
+
+    def __call__(self, cmd):
+        if cmd not in self.reader.cmds:
+            return ""
+
+        now = self.clock.wall()
+        if now > self.reader.end_time():
+            raise OsCommandExc("end of capture %s" % self.reader.path)
+
+        while self.next_rec and self.next_rec[0] <= now:
+            (ts, rcmd, output) = self.next_rec
+            self.latest[rcmd] = output
+            self.next_rec = next(self.gen, None)
+
+        if cmd not in self.latest:
+            # command recorded only later, so bring its first output
+            # forward.
+            self.latest[cmd] = self._first_output(cmd)
+
+        return self.latest[cmd]
@@ -22,6 +22,36 @@
 # Input param "--sample-interval" option available.
 ncd_samples_max = 6
 
+# Largest number of samples in the window, when it is resized at
+# runtime through "ncd_ctl config samples <n>". Aggregates over the
+# window are maintained as the samples arrive, so that a longer window
+# costs no more in every dry-run than the shorter one.
+ncd_samples_limit = 4096
+
+# History of pmd load, rxq load and port drops is kept in tiers of
+# (resolution in sec, number of buckets), every bucket holding lowest,
+# mean and highest value sampled in its time. Buckets are allocated
+# only as they are used, for every pmd, rxq and port. Default tiers
+# keep one minute buckets for an hour, ten minutes for a day and one
+# hour for a week. History is queried through
+# "ncd_ctl history <sec> [res]".
+ncd_rollup_tiers = [(60, 60), (600, 144), (3600, 168)]
+
+# Shortest and longest interval (in sec) between samples, when sampling
+# adapts to the state of pmds. Sampling is done at the shortest interval
+# while pmd load changes by ncd_sample_load_delta (in percent) between
+# samples, or is within ncd_sample_load_delta below the threshold
+# ncd_pmd_core_threshold. Otherwise, the interval doubles on every
+# sample up to the longest. Adaptive sampling is disabled when the
+# longest interval is zero, so that every sample is at sample interval,
+# and it is so by default. Setting the longest interval (say 60) opts
+# in for adaptive sampling, while rebalance mode is on.
+# Input param "--sample-interval-min" and "--sample-interval-max"
+# options available.
+ncd_sample_interval_min = 0.5
+ncd_sample_interval_max = 0
+ncd_sample_load_delta = 10
+
 # Minimum improvement in the pmd load values calculated in
 # each sampling iteration. This value judges on whether all the PMDs
 # have arrived at a balanced equilibrium. Smaller the value, better
@@ -29,27 +59,170 @@ ncd_samples_max = 6
 # taken by tool arrive at conclusion for rebalance.
 ncd_pmd_load_improve_min = 25
 
+# Improvement in pmd load needed for a rebalance, when it follows
+# another one applied within ncd_rebal_cooldown seconds. Along with
+# ncd_pmd_load_improve_min, this forms the hysteresis in deciding
+# rebalance, so that the vswitch is not reconfigured back and forth.
+ncd_pmd_load_improve_max = 50
+ncd_rebal_cooldown = 600
+
+# Minimum interval in seconds that a rxq stays in its new pmd after
+# a rebalance, before any dry-run can move it again.
+ncd_rxq_cooldown = 300
+
+# A rxq moving back into the pmd it left in any of the last
+# ncd_rebal_flap_n rebalances is considered flapping, and it is held
+# in its pmd for ncd_rxq_flap_hold seconds.
+ncd_rebal_flap_n = 4
+ncd_rxq_flap_hold = 3600
+
+# Maximum number of applied rebalances to remember.
+ncd_rebal_history_max = 32
+
+# Weights of packet loss in the rebalance objective. Packet drops
+# (in ppm) in RX of a port and its TX retries are converted into an
+# extra load (in percent) on the pmds polling this port, so that
+# dry-runs prefer relieving pmds which actually lose packets.
+ncd_score_drop_weight = 0.001
+ncd_score_retry_weight = 0.0001
+
 # Minimum per core load threshold to trigger rebalance, if the pmd load
 # is above this threshold.
 ncd_pmd_core_threshold = 95
 
+# Detect sudden shift in pmd load and port rx drop on every sample, to
+# cut sampling short and dry-run immediately. Load (in percent) and rx
+# drop (in ppm) are checked with two-sided CUSUM test, tolerating drift
+# in every sample and firing once accumulated deviation crosses limit.
+# A pmd crossing ncd_pmd_core_threshold also fires immediately.
+# Rebalance triggered by sudden shift is still spaced apart by at least
+# ncd_detect_rebal_min seconds.
+ncd_detect_shift = True
+ncd_detect_rebal_min = 60
+ncd_detect_load_drift = 5
+ncd_detect_load_limit = 40
+ncd_detect_drop_drift = 1000
+ncd_detect_drop_limit = 20000
+
 # Minimum interval for vswitch to reach steady state, following
 # pmd reconfiguration.
 ncd_vsw_wait_min = 0
 
+# Minimum interval (in sec) to let pmds settle before verifying their
+# load, when vswitch is not known to have applied the reconfiguration
+# (as with ovs-vsctl --no-wait). Otherwise, verification samples would
+# include the transient in pmds reloading rxqs.
+ncd_vsw_settle_min = 2
+
+# OVSDB server socket, to set rxq affinity of the ports in one
+# transaction and wait until vswitchd has applied it, for at most
+# ncd_vsw_wait_max seconds. When the socket is unavailable, ovs-vsctl
+# is run instead and vswitch is given ncd_vsw_wait_min to settle.
+ovsdb_socket = "/var/run/openvswitch/db.sock"
+ncd_vsw_wait_max = 10
+
+# Number of samples to verify pmd load once a rebalance is applied.
+# If pmd load score measured falls short of the estimated improvement
+# by more than ncd_verify_var_margin (in percent of the estimated
+# improvement), or rx drop in any port has gone up by
+# ncd_verify_drop_margin (in ppm), previous rxq affinity of the ports
+# are restored. Verification is disabled when ncd_verify_samples is
+# zero.
+ncd_verify_samples = 3
+ncd_verify_var_margin = 50
+ncd_verify_drop_margin = 1000
+
+# Maximum number of rxqs moved in one vswitch reconfiguration. Larger
+# rebalance is applied in batches of these many rxqs, the ones with
+# highest benefit first, verifying pmd load after every batch (for
+# ncd_verify_samples), until estimated pmd load is reached. Zero to
+# apply the whole rebalance at once.
+# Input param "--rebalance-batch" option available.
+ncd_rebal_batch_n = 0
+
+# High-frequency sampling mode, to diagnose microbursts in pmds. Only
+# pmd counters are sampled, every ncd_hf_interval (in sec), through a
+# persistent unixctl connection to vswitchd found in ovs_rundir. The
+# latest ncd_hf_samples of them are retained.
+ncd_hf_interval = 0.2
+ncd_hf_samples = 3000
+ovs_rundir = "/var/run/openvswitch"
+
+# Latest ncd_events_max events are retained for "ncd_ctl status", and
+# "ncd_ctl status from <n>" returns at most ncd_events_page of them.
+ncd_events_max = 4096
+ncd_events_page = 256
+
 # Store location for the logs created and its maximum size.
 ncd_log_file = "/var/log/netcontrold/ncd.log"
 ncd_log_max_KB = 1024
 ncd_log_max_backup_n = 1
 
+# Store of every sample collected, as fixed width records in memory
+# mapped segment files of ncd_tsstore_segment_size bytes. Oldest
+# segments are removed to keep the store within ncd_tsstore_size_max
+# bytes. Store is disabled when its directory is empty, as it is by
+# default; set it to e.g. "/var/log/netcontrold/tsstore" to enable.
+# Records are read through "ncd_ctl records <sec>", without the daemon.
+# Port names longer than 64 bytes are cut, and marked with "~".
+ncd_tsstore_dir = ""
+ncd_tsstore_segment_size = 4 * 1024 * 1024
+ncd_tsstore_size_max = 64 * 1024 * 1024
+
+# Outputs of host commands recorded with "--record" are compressed in
+# blocks of ncd_capture_block_n records, and replayed with "--replay".
+ncd_capture_block_n = 64
+
+# Profiles of the main loop, started by "ncd_ctl profile start", are
+# written in ncd_profile_dir. Stack sampler picks the main loop stack
+# every ncd_profile_interval (in sec).
+ncd_profile_dir = "/var/log/netcontrold"
+ncd_profile_interval = 0.01
+
+# Allocations are traced, once "ncd_ctl memory snapshot" is taken, with
+# ncd_mem_trace_frames frames each, and ncd_mem_top_n top allocators
+# are reported.
+ncd_mem_trace_frames = 1
+ncd_mem_top_n = 10
+
+# Cpu time, context switches and wall time consumed by the daemon in
+# every collection cycle and dry-run are summarised in the log, every
+# ncd_overhead_log_interval (in sec).
+ncd_overhead_log_interval = 300
+
 # Minimum threshold (in ppm) for packet drop to call back trace actions.
 ncd_cb_pktdrop_min = 10000
 
 # Unix socket file
 ncd_socket = "/var/run/netcontrold/ncd_ctrld.sock"
 
-# Dump file for status store and load
+# Control commands are served to any number of clients, each command
+# in a line of at most ncd_ctl_line_max bytes, by ncd_ctl_workers
+# threads. Client idle for ncd_ctl_idle_timeout (in sec) is dropped.
+ncd_ctl_workers = 4
+ncd_ctl_line_max = 1024
+ncd_ctl_idle_timeout = 300
+
+# Dump file for status store and load, as in older versions. It is
+# read only when no journal is found.
 ncd_dump_file = "/var/log/netcontrold/ncd.json"
 
+# Journal of events and mode flags, appended as they occur and replayed
+# on restart. Appends are fsync'ed in batches of ncd_journal_sync_n
+# records (and on exit), and the journal is compacted to the retained
+# events and latest flags once it grows past ncd_journal_size_max.
+ncd_journal_file = "/var/log/netcontrold/ncd.journal"
+ncd_journal_sync_n = 16
+ncd_journal_size_max = 4 * 1024 * 1024
+
+# Samples of pmds and ports are saved in ncd_snapshot_file on exit, and
+# restored on start, if not older than ncd_snapshot_age_max (in sec)
+# and if neither vswitchd nor its rxq placement changed since then.
+# pmd-rxq-affinity set in rebalanced ports is removed on exit, except
+# when ncd is restarted ("ncd_ctl restart", through SIGHUP) and samples
+# are saved, so that rxq placement matches the samples on restart.
+ncd_snapshot_file = "/var/log/netcontrold/ncd.snapshot"
+ncd_snapshot_age_max = 300
+
 # Minimum threshold (in ppm) for upcall rate
 datapath_overflow_rate = 0.000001
@@ -21,10 +21,12 @@ __all__ = ['get_pmd_stats',
            ]
 
 import re
-import copy
+import threading
 from netcontrold.lib import util
 
 from netcontrold.lib import config
+from netcontrold.lib import event
+from netcontrold.lib import perf
 import operator
 from netcontrold.lib.error import ObjCreateExc, ObjParseExc,\
     ObjConsistencyExc, ObjModelExc, OsCommandExc
@@ -36,14 +38,51 @@ class Context():
     port_to_cls = {}
     nlog = None
     last_ts = None
-    events = []
+    events = event.EventLog(config.ncd_events_max)
     log_handler = None
     coverage_map = {}
+    rxq_hold = set()
+    clock = util.Clock()
+    # held by main loop while changing the maps above, and by control
+    # commands reading them.
+    lock = threading.RLock()
 
 
 nlog = Context.nlog
 
 
+class CycRing(list):
+    """
+    Class to represent sampling slots of a counter. Total of the slots
+    is kept up to date as every slot is written, so that windows of
+    any size are aggregated in constant time.
+
+    Attributes
+    ----------
+    total : int
+        sum of all the slots.
+    """
+
+    def __init__(self, iterable=()):
+        super(CycRing, self).__init__(iterable)
+        self.total = sum(self)
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            super(CycRing, self).__setitem__(idx, value)
+            self.total = sum(self)
+        else:
+            self.total += value - self[idx]
+            super(CycRing, self).__setitem__(idx, value)
+
+
+def make_cyc_ring():
+    """
+    Return new CycRing object with as many slots as samples in window.
+    """
+    return CycRing([0, ] * int(config.ncd_samples_max))
+
+
 class Rxq(object):
     """
     Class to represent the RXQ in the port of a vswitch.
@@ -106,8 +145,8 @@ class Dataif_Rxq(Rxq):
 
         self.pmd = None
         self.enabled = False
-        self.cpu_cyc = [0, ] * int(config.ncd_samples_max)
-        self.rx_cyc = [0, ] * int(config.ncd_samples_max)
+        self.cpu_cyc = make_cyc_ring()
+        self.rx_cyc = make_cyc_ring()
 
 
 class Port(object):
@@ -260,6 +299,10 @@ def make_dataif_port(port_name=None):
             samples of transmit retry by this port in TX.
         cyc_idx : int
             current sampling index.
+        cyc_n : int
+            number of sampling slots filled.
+        cyc_ts : list
+            monotonic time of every sample.
         rxq_rebalanced : dict
             map of PMDs that its each rxq will be associated with.
         rebalance : bool
@@ -276,6 +319,8 @@ def make_dataif_port(port_name=None):
         tx_drop_cyc = [0, ] * int(config.ncd_samples_max)
         tx_retry_cyc = [0, ] * int(config.ncd_samples_max)
         cyc_idx = 0
+        cyc_n = int(config.ncd_samples_max)
+        cyc_ts = [0, ] * int(config.ncd_samples_max)
         rebalance = False
 
         def __init__(self):
@@ -342,6 +387,8 @@ class Dataif_Coverage(object):
     ----------
     upcall : list
         samples of upcall_flow_limit_hit coverage counter.
+    ts : list
+        monotonic time of every sample.
     index : int
         current sampling index
 
@@ -357,6 +404,7 @@ class Dataif_Coverage(object):
         """
 
         self.upcall = [0, ] * int(config.ncd_samples_max)
+        self.ts = [0, ] * int(config.ncd_samples_max)
         self.index = 0
 
     def __eq__(self, other):
@@ -391,6 +439,16 @@ class Dataif_Pmd(object):
         samples of processing cpu cycles consumed by this pmd.
     cyc_idx : int
         current sampling index.
+    cyc_n : int
+        number of sampling slots filled.
+    cyc_ts : list
+        monotonic time of every sample.
+    rx_adj : int
+        packets moved into this pmd by dry-run, over sampling window.
+    idle_cpu_adj : int
+        idle cpu cycles moved into this pmd by dry-run.
+    proc_cpu_adj : int
+        processing cpu cycles moved into this pmd by dry-run.
     isolated : bool
         whether this pmd is isolated from auto rebalance of vswitch.
     pmd_load : int
@@ -433,10 +491,15 @@ class Dataif_Pmd(object):
 
         self.id = _id
         self.numa_id = None
-        self.rx_cyc = [0, ] * int(config.ncd_samples_max)
-        self.idle_cpu_cyc = [0, ] * int(config.ncd_samples_max)
-        self.proc_cpu_cyc = [0, ] * int(config.ncd_samples_max)
+        self.rx_cyc = make_cyc_ring()
+        self.idle_cpu_cyc = make_cyc_ring()
+        self.proc_cpu_cyc = make_cyc_ring()
+        self.rx_adj = 0
+        self.idle_cpu_adj = 0
+        self.proc_cpu_adj = 0
         self.cyc_idx = 0
+        self.cyc_n = int(config.ncd_samples_max)
+        self.cyc_ts = [0, ] * int(config.ncd_samples_max)
         self.isolated = None
         self.pmd_load = 0
         self.port_map = {}
@@ -481,6 +544,9 @@ class Dataif_Pmd(object):
                 (sorted(self.rx_cyc) == sorted(other.rx_cyc)) and
                 (sorted(self.idle_cpu_cyc) == sorted(other.idle_cpu_cyc)) and
                 (sorted(self.proc_cpu_cyc) == sorted(other.proc_cpu_cyc)) and
+                (self.rx_adj == other.rx_adj) and
+                (self.idle_cpu_adj == other.idle_cpu_adj) and
+                (self.proc_cpu_adj == other.proc_cpu_adj) and
                 (self.isolated == other.isolated) and
                 (self.pmd_load == other.pmd_load) and
                 (self.port_map == other.port_map)):
@@ -597,6 +663,109 @@ class Dataif_Pmd(object):
         return n_rxq
 
 
+def cyc_samples(cyc, cyc_idx, cyc_n):
+    """
+    Return samples of a counter, in the order they were sampled. When
+    not all the sampling slots are filled yet, only the filled ones are
+    returned.
+
+    Parameters
+    ----------
+    cyc : list
+        sampling slots of the counter.
+    cyc_idx : int
+        current sampling index.
+    cyc_n : int
+        number of sampling slots filled.
+    """
+
+    if cyc_n >= len(cyc):
+        # oldest sample is next to the current one.
+        start = (cyc_idx + 1) % len(cyc)
+        return list(cyc[start:]) + list(cyc[:start])
+
+    return [cyc[(cyc_idx - i) % len(cyc)] for i in range(cyc_n - 1, -1, -1)]
+
+
+def cyc_total(cyc):
+    """
+    Return sum of all the slots of a counter.
+
+    Parameters
+    ----------
+    cyc : list
+        sampling slots of the counter.
+    """
+
+    if isinstance(cyc, CycRing):
+        return cyc.total
+
+    return sum(cyc)
+
+
+def cyc_delta(cyc, cyc_idx, cyc_n):
+    """
+    Return sum of differences between consecutive samples of a counter,
+    which is the last sample less the first one.
+
+    Parameters
+    ----------
+    cyc : list
+        sampling slots of the counter.
+    cyc_idx : int
+        current sampling index.
+    cyc_n : int
+        number of sampling slots filled.
+    """
+
+    if cyc_n < len(cyc):
+        return cyc[cyc_idx] - cyc[(cyc_idx - cyc_n + 1) % len(cyc)]
+
+    # oldest sample is next to the current one, once all are filled.
+    return cyc[cyc_idx] - cyc[(cyc_idx + 1) % len(cyc)]
+
+
+def cyc_window_sum(cyc, cyc_idx, cyc_n):
+    """
+    Return sum of the samples of a per-interval counter (such as rxq
+    cycles), for the intervals within sampling window. Slot of the
+    oldest sample is the beginning of the window, so it is left out.
+
+    Parameters
+    ----------
+    cyc : list
+        sampling slots of the counter.
+    cyc_idx : int
+        current sampling index.
+    cyc_n : int
+        number of sampling slots filled.
+    """
+
+    if cyc_n >= len(cyc):
+        # oldest sample is next to the current one, once all are filled.
+        return cyc_total(cyc) - cyc[(cyc_idx + 1) % len(cyc)]
+
+    return sum([cyc[(cyc_idx - i) % len(cyc)] for i in range(cyc_n - 1)])
+
+
+def cyc_elapsed(cyc_ts, cyc_idx, cyc_n):
+    """
+    Return seconds elapsed between the oldest and latest samples.
+
+    Parameters
+    ----------
+    cyc_ts : list
+        monotonic time of every sample.
+    cyc_idx : int
+        current sampling index.
+    cyc_n : int
+        number of sampling slots filled.
+    """
+
+    ts = cyc_samples(cyc_ts, cyc_idx, cyc_n)
+    return max(ts) - min(ts)
+
+
 def pmd_load(pmd):
     """
     Calculate pmd load.
@@ -609,20 +778,20 @@ def pmd_load(pmd):
 
     # Given we have samples of rx packtes, processing and idle cpu
     # cycles of a pmd, calculate load on this pmd.
-    # sort counters so that, incremental differences calculated.
-    sort_rx_cyc = sorted(pmd.rx_cyc[:])
-    sort_idle_cyc = sorted(pmd.idle_cpu_cyc[:])
-    sort_proc_cyc = sorted(pmd.proc_cpu_cyc[:])
-
-    rx_sum = sum([j - i for i, j in zip(sort_rx_cyc[:-1], sort_rx_cyc[1:])])
+    # incremental differences of the counters add up to the latest
+    # sample less the oldest one, as the counters only increase, along
+    # with what dry-run has moved. only the filled slots are used when
+    # sampling is not complete.
+    rx_sum = abs(cyc_delta(pmd.rx_cyc, pmd.cyc_idx, pmd.cyc_n) +
+                 pmd.rx_adj)
     if rx_sum == 0:
         # no activity without any packet.
         return 0
 
-    idle_sum = sum(
-        [j - i for i, j in zip(sort_idle_cyc[:-1], sort_idle_cyc[1:])])
-    proc_sum = sum(
-        [j - i for i, j in zip(sort_proc_cyc[:-1], sort_proc_cyc[1:])])
+    idle_sum = abs(cyc_delta(pmd.idle_cpu_cyc, pmd.cyc_idx, pmd.cyc_n) +
+                   pmd.idle_cpu_adj)
+    proc_sum = abs(cyc_delta(pmd.proc_cpu_cyc, pmd.cyc_idx, pmd.cyc_n) +
+                   pmd.proc_cpu_adj)
 
     cpp = (idle_sum + proc_sum) / rx_sum
     if cpp == 0:
@@ -638,6 +807,31 @@ def pmd_load(pmd):
     return pmd_load
 
 
+def pmd_load_sample(pmd):
+    """
+    Return load of the pmd in its latest sampling interval, or None
+    if there is no interval sampled yet.
+
+    Parameters
+    ----------
+    pmd : object
+        Dataif_Pmd object.
+    """
+
+    if pmd.cyc_n < 2:
+        return None
+
+    cur_idx = pmd.cyc_idx
+    prev_idx = (cur_idx - 1) % len(pmd.rx_cyc)
+    proc = pmd.proc_cpu_cyc[cur_idx] - pmd.proc_cpu_cyc[prev_idx]
+    idle = pmd.idle_cpu_cyc[cur_idx] - pmd.idle_cpu_cyc[prev_idx]
+    if (proc + idle) <= 0:
+        return 0
+
+    return (proc * 100) / (proc + idle)
+
+
+@perf.timed("update_pmd_load")
 def update_pmd_load(pmd_map):
     """
     Update pmd for its current load level.
@@ -678,8 +872,10 @@ def pmd_need_rebalance(pmd_map):
 
     nlog = Context.nlog
     pmd_loaded = 0
+    pmd_penalty = pmd_drop_penalty(pmd_map)
     for pmd in pmd_map.values():
-        if (pmd.pmd_load >= config.ncd_pmd_core_threshold and
+        load = pmd.pmd_load + pmd_penalty[pmd.id]
+        if (load >= config.ncd_pmd_core_threshold and
                 pmd.count_rxq() > 1):
             nlog.debug("pmd %d is loaded more than %d threshold" %
                        (pmd.id, config.ncd_pmd_core_threshold))
@@ -691,6 +887,7 @@ def pmd_need_rebalance(pmd_map):
     return False
 
 
+@perf.timed("get_coverage_stats")
 def get_coverage_stats(coverage_map):
     """
     Collect stats of coverage counters. In every sampling iteration,
@@ -713,6 +910,8 @@ def get_coverage_stats(coverage_map):
     if not data:
         raise OsCommandExc("unable to collect data")
 
+    ts = Context.clock.now()
+
     for line in data.splitlines():
         # In below matching line, retrieve upcall_flow_limit_hit count
         if line.startswith("upcall_flow_limit_hit"):
@@ -724,7 +923,7 @@ def get_coverage_stats(coverage_map):
             # if coverage object exists modify it by adding new sample
             if "coverage" in coverage_map:
                 coverage = coverage_map["coverage"]
-                coverage.index = (coverage.index + 1) % config.ncd_samples_max
+                coverage.index = (coverage.index + 1) % len(coverage.upcall)
 
             # else create new coverage object and add sample to it
             else:
@@ -732,10 +931,12 @@ def get_coverage_stats(coverage_map):
                 Context.coverage_map["coverage"] = coverage
 
             coverage.upcall[coverage.index] = count
+            coverage.ts[coverage.index] = ts
 
     return coverage_map
 
 
+@perf.timed("get_pmd_stats")
 def get_pmd_stats(pmd_map):
     """
     Collect stats on every pmd running in the system and update
@@ -765,6 +966,8 @@ def get_pmd_stats(pmd_map):
     if not data:
         raise OsCommandExc("unable to collect data")
 
+    ts = Context.clock.now()
+
     # current state of pmds
     cur_pmd_l = sorted(pmd_map.keys())
 
@@ -793,6 +996,7 @@ def get_pmd_stats(pmd_map):
 
                 # Store following stats in new sampling slot.
                 pmd.cyc_idx = (pmd.cyc_idx + 1) % config.ncd_samples_max
+                pmd.cyc_n = min(pmd.cyc_n + 1, config.ncd_samples_max)
                 nlog.debug("pmd %d in iteration %d" % (pmd.id, pmd.cyc_idx))
             else:
                 # Very first sampling for each pmd occur in this
@@ -809,6 +1013,9 @@ def get_pmd_stats(pmd_map):
 
                 # numa id of pmd is of core's.
                 pmd.numa_id = numa_id
+                pmd.cyc_n = 1
+
+            pmd.cyc_ts[pmd.cyc_idx] = ts
         elif line.startswith("main thread"):
             # end of pmd stats
             break
@@ -834,6 +1041,7 @@ def get_pmd_stats(pmd_map):
     return pmd_map
 
 
+@perf.timed("get_pmd_rxqs")
 def get_pmd_rxqs(pmd_map):
     """
     Collect info on how rxq is pinned with pmd, from the vswitch.
@@ -967,6 +1175,7 @@ def get_pmd_rxqs(pmd_map):
     return pmd_map
 
 
+@perf.timed("get_port_stats")
 def get_port_stats():
     """
     Collect stats on every port in the datapath.
@@ -989,6 +1198,8 @@ def get_port_stats():
     if not data:
         raise OsCommandExc("unable to collect data")
 
+    ts = Context.clock.now()
+
     # current state of ports
     cur_port_l = sorted(Context.port_to_cls.keys())
 
@@ -1010,14 +1221,18 @@ def get_port_stats():
 
                 # Store following stats in new sampling slot.
                 port.cyc_idx = (port.cyc_idx + 1) % config.ncd_samples_max
+                port.cyc_n = min(port.cyc_n + 1, config.ncd_samples_max)
                 nlog.debug("port %s in iteration %d" %
                            (port.name, port.cyc_idx))
             else:
                 # create new entry in port_to_cls for this port.
                 port = make_dataif_port(pname)
                 port.id = pid
+                port.cyc_n = 1
                 nlog.debug("added port %s stats.." % pname)
 
+            port.cyc_ts[port.cyc_idx] = ts
+
         elif re.match(r'\s.*RX packets:(\d+) .*? dropped:(\d+) *', line):
             # From other lines, we retrieve stats of the port.
             linesre = re.search(
@@ -1045,6 +1260,7 @@ def get_port_stats():
     return None
 
 
+@perf.timed("get_interface_stats")
 def get_interface_stats():
     """
     Collect retry stats on every applicable port in the datapath.
@@ -1123,6 +1339,73 @@ def get_interface_stats():
     return None
 
 
+@perf.timed("get_interface_affinity")
+def get_interface_affinity():
+    """
+    Collect rxq affinity configured in every interface of the vswitch.
+
+    Returns
+    -------
+    dict
+        mapping of interface name and its pmd-rxq-affinity, or None
+        if no affinity configured.
+
+    Raises
+    ------
+    OsCommandExc
+        if the given OS command did not succeed for some reason.
+    """
+
+    # retrieve required data from the vswitch.
+    cmd = "ovs-vsctl list interface"
+    data = util.exec_host_command(cmd)
+    if not data:
+        raise OsCommandExc("unable to collect data")
+
+    port_aff = {}
+    pname = None
+    for line in data.splitlines():
+        if re.match(r'\s*name\s.*:\s"*([A-Za-z0-9_-]+)"*', line):
+            linesre = re.search(r'\s*name\s.*:\s"*([A-Za-z0-9_-]+)"*', line)
+            (pname, ) = linesre.groups()
+            port_aff[pname] = None
+
+        elif re.match(r'\s*other_config\s.*:\s{(.*)}', line):
+            linesre = re.search(r'pmd-rxq-affinity="*([0-9:, ]+)"*', line)
+            if linesre and pname:
+                port_aff[pname] = linesre.groups()[0]
+
+            pname = None
+
+    return port_aff
+
+
+def parse_affinity(pmdq):
+    """
+    Return pmd-rxq-affinity of a port as a map of rxq id and pmd id.
+
+    Parameters
+    ----------
+    pmdq : str
+        pmd-rxq-affinity of the port (as "rxq:pmd,.."), or None.
+    """
+
+    rxq_pmd = {}
+    if not pmdq:
+        return rxq_pmd
+
+    for elm in pmdq.split(","):
+        elm = elm.strip()
+        if not elm:
+            continue
+
+        (rxq_id, pmd_id) = elm.split(":")
+        rxq_pmd[int(rxq_id)] = int(pmd_id)
+
+    return rxq_pmd
+
+
+@perf.timed("rebalance_dryrun_by_iq")
 def rebalance_dryrun_by_iq(pmd_map):
     """
     Rebalance pmds based on their current load of traffic in it and
@@ -1157,16 +1440,20 @@ def rebalance_dryrun_by_iq(pmd_map):
 
     # Sort pmds in pmd_map based on the rxq load, in descending order.
     # Pick the pmd which is more loaded from one end of the list.
+    # Packet loss on the ports polled by a pmd is accounted as its
+    # extra load, so that pmds losing packets are relieved first.
+    pmd_penalty = pmd_drop_penalty(pmd_map)
     pmd_load_list = sorted(
-        pmd_map.values(), key=lambda o: o.pmd_load)
+        pmd_map.values(), key=lambda o: o.pmd_load + pmd_penalty[o.id])
 
     # Split list into busy and less loaded.
     bpmd_load_list = []
     ipmd_load_list = []
     for pmd in pmd_load_list:
         # pmd load of above configured threshold
-        if pmd.pmd_load > config.ncd_pmd_core_threshold:
-            bpmd_load_list.append(pmd)
+        if (pmd.pmd_load + pmd_penalty[pmd.id] >
+                config.ncd_pmd_core_threshold):
+            bpmd_load_list.insert(0, pmd)
 
         # skip pmd when its rxq count is one i.e pmd has just one rxq,
         # and this rxq is already busy (hencs, pmd was busy).
@@ -1207,21 +1494,31 @@ def rebalance_dryrun_by_iq(pmd_map):
                 continue
 
             # Sort rxqs based on their current load, in ascending order.
-            pmd_proc_cyc = sum(pmd.proc_cpu_cyc)
+            pmd_proc_cyc = cyc_total(pmd.proc_cpu_cyc)
             rxq_load_list = sorted(port.rxq_map.values(),
                                    key=lambda o:
-                                   ((sum(o.cpu_cyc) * 100) / pmd_proc_cyc))
+                                   ((cyc_total(o.cpu_cyc) * 100) /
+                                    pmd_proc_cyc))
+
+            # skip rxqs which are held in this pmd for now.
+            if not rxq_load_list:
+                raise ObjConsistencyExc("rxq found empty ..")
+
+            rxq_load_list = [o for o in rxq_load_list
+                             if (port.name, o.id) not in Context.rxq_hold]
 
             # pick one rxq to rebalance and this was least loaded in this pmd.
             try:
                 rxq = rxq_load_list.pop(0)
             except IndexError:
-                raise ObjConsistencyExc("rxq found empty ..")
+                nlog.debug("all rxqs of port %s held in pmd %d .."
+                           % (port.name, pmd.id))
+                continue
 
             # move this rxq into the rebalancing pmd.
             nlog.info(
                 "moving rxq %d (port %s cycles %s) from pmd %d into pmd %d"
-                % (rxq.id, port.name, sum(rxq.cpu_cyc), pmd.id, ipmd.id))
+                % (rxq.id, port.name, cyc_total(rxq.cpu_cyc), pmd.id, ipmd.id))
             iport = ipmd.find_port_by_name(port.name)
             if not iport:
                 iport = ipmd.add_port(port.name, port.id, port.numa_id)
@@ -1229,25 +1526,25 @@ def rebalance_dryrun_by_iq(pmd_map):
             n_rxq_rebalanced += 1
             assert(iport.numa_id == port.numa_id)
 
-            # Copy cpu cycles of this rxq into its clone in
-            # in rebalancing pmd (for dry-run).
-            irxq.cpu_cyc = copy.deepcopy(rxq.cpu_cyc)
-            irxq.rx_cyc = copy.deepcopy(rxq.rx_cyc)
+            # Share cpu cycles of this rxq with its clone in
+            # in rebalancing pmd (for dry-run), as sampling slots are
+            # not written until the dry-run is reset.
+            irxq.cpu_cyc = rxq.cpu_cyc
+            irxq.rx_cyc = rxq.rx_cyc
 
-            cur_idx = pmd.cyc_idx
-            for i in range(0, config.ncd_samples_max - 1):
-                for j in range(0, i + 1):
-                    # update rebalancing pmd for cpu cycles and rx count.
-                    ipmd.proc_cpu_cyc[cur_idx + j] += irxq.cpu_cyc[cur_idx]
-                    ipmd.idle_cpu_cyc[cur_idx + j] -= irxq.cpu_cyc[cur_idx]
-                    ipmd.rx_cyc[cur_idx + j] += irxq.rx_cyc[cur_idx]
+            # cpu cycles and rx count of this rxq over sampling window.
+            cpu = cyc_window_sum(irxq.cpu_cyc, pmd.cyc_idx, pmd.cyc_n)
+            rx = cyc_window_sum(irxq.rx_cyc, pmd.cyc_idx, pmd.cyc_n)
 
-                    # update current pmd for cpu cycles and rx count.
-                    pmd.proc_cpu_cyc[cur_idx + j] -= irxq.cpu_cyc[cur_idx]
-                    pmd.idle_cpu_cyc[cur_idx + j] += irxq.cpu_cyc[cur_idx]
-                    pmd.rx_cyc[cur_idx + j] -= irxq.rx_cyc[cur_idx]
+            # update rebalancing pmd for cpu cycles and rx count.
+            ipmd.proc_cpu_adj += cpu
+            ipmd.idle_cpu_adj -= cpu
+            ipmd.rx_adj += rx
 
-                cur_idx = (cur_idx - 1) % config.ncd_samples_max
+            # update current pmd for cpu cycles and rx count.
+            pmd.proc_cpu_adj -= cpu
+            pmd.idle_cpu_adj += cpu
+            pmd.rx_adj -= rx
 
             # No more tracking of this rxq in current pmd.
             port.del_rxq(rxq.id)
@@ -1267,6 +1564,7 @@ def rebalance_dryrun_by_iq(pmd_map):
     return n_rxq_rebalanced
 
 
+@perf.timed("rebalance_dryrun_by_cyc")
 def rebalance_dryrun_by_cyc(pmd_map):
     """
     Rebalance pmds based on their current load of traffic in it and
@@ -1318,8 +1616,17 @@ def rebalance_dryrun_by_cyc(pmd_map):
         for port in pmd.port_map.values():
             rxq_list += port.rxq_map.values()
 
+    # rxqs of ports losing packets are weighed up, so that they are
+    # placed ahead of others.
+    port_penalty = {}
+    for rxq in rxq_list:
+        if rxq.port.name not in port_penalty:
+            port_penalty[rxq.port.name] = port_drop_penalty(rxq.port)
+
     rxq_load_list = sorted(
-        rxq_list, key=lambda o: sum(o.cpu_cyc), reverse=True)
+        rxq_list, key=lambda o: (cyc_total(o.cpu_cyc) *
+                                 (100 + port_penalty[o.port.name])),
+        reverse=True)
     pmd_list_forward = []
     for rxq in rxq_load_list:
         if rxq.pmd not in pmd_list_forward:
@@ -1395,12 +1702,19 @@ def rebalance_dryrun_by_cyc(pmd_map):
         if pmd.id == rpmd.id:
             nlog.info(
                 "no change needed for rxq %d (port %s cycles %s) in pmd %d"
-                % (rxq.id, port.name, sum(rxq.cpu_cyc), pmd.id))
+                % (rxq.id, port.name, cyc_total(rxq.cpu_cyc), pmd.id))
+            continue
+
+        if (port.name, rxq.id) in Context.rxq_hold:
+            nlog.info(
+                "holding rxq %d (port %s cycles %s) in pmd %d"
+                % (rxq.id, port.name, cyc_total(rxq.cpu_cyc), pmd.id))
             continue
 
         # move this rxq into the rebalancing pmd.
         nlog.info("moving rxq %d (port %s cycles %s) from pmd %d into pmd %d"
-                  % (rxq.id, port.name, sum(rxq.cpu_cyc), pmd.id, rpmd.id))
+                  % (rxq.id, port.name, cyc_total(rxq.cpu_cyc), pmd.id,
+                     rpmd.id))
         rport = rpmd.find_port_by_name(port.name)
         if not rport:
             rport = rpmd.add_port(port.name, port.id, port.numa_id)
@@ -1408,25 +1722,25 @@ def rebalance_dryrun_by_cyc(pmd_map):
         n_rxq_rebalanced += 1
         assert(rport.numa_id == port.numa_id)
 
-        # Copy cpu and rxq cycles of this rxq into its clone in
-        # in rebalancing pmd (for dry-run).
-        rrxq.cpu_cyc = copy.deepcopy(rxq.cpu_cyc)
-        rrxq.rx_cyc = copy.deepcopy(rxq.rx_cyc)
+        # Share cpu and rxq cycles of this rxq with its clone in
+        # in rebalancing pmd (for dry-run), as sampling slots are
+        # not written until the dry-run is reset.
+        rrxq.cpu_cyc = rxq.cpu_cyc
+        rrxq.rx_cyc = rxq.rx_cyc
 
-        cur_idx = pmd.cyc_idx
-        for i in range(0, config.ncd_samples_max - 1):
-            for j in range(0, i + 1):
-                # update rebalancing pmd for cpu cycles and rx count.
-                rpmd.proc_cpu_cyc[cur_idx + j] += rrxq.cpu_cyc[cur_idx]
-                rpmd.idle_cpu_cyc[cur_idx + j] -= rrxq.cpu_cyc[cur_idx]
-                rpmd.rx_cyc[cur_idx + j] += rrxq.rx_cyc[cur_idx]
+        # cpu cycles and rx count of this rxq over sampling window.
+        cpu = cyc_window_sum(rrxq.cpu_cyc, pmd.cyc_idx, pmd.cyc_n)
+        rx = cyc_window_sum(rrxq.rx_cyc, pmd.cyc_idx, pmd.cyc_n)
 
-                # update current pmd for cpu cycles and rx count.
-                pmd.proc_cpu_cyc[cur_idx + j] -= rrxq.cpu_cyc[cur_idx]
-                pmd.idle_cpu_cyc[cur_idx + j] += rrxq.cpu_cyc[cur_idx]
-                pmd.rx_cyc[cur_idx + j] -= rrxq.rx_cyc[cur_idx]
+        # update rebalancing pmd for cpu cycles and rx count.
+        rpmd.proc_cpu_adj += cpu
+        rpmd.idle_cpu_adj -= cpu
+        rpmd.rx_adj += rx
 
-            cur_idx = (cur_idx - 1) % config.ncd_samples_max
+        # update current pmd for cpu cycles and rx count.
+        pmd.proc_cpu_adj -= cpu
+        pmd.idle_cpu_adj += cpu
+        pmd.rx_adj -= rx
 
         # No more tracking of this rxq in current pmd.
         port.del_rxq(rxq.id)
@@ -1440,18 +1754,56 @@ def rebalance_dryrun_by_cyc(pmd_map):
     return n_rxq_rebalanced
 
 
+def rebalance_plan(pmd_map):
+    """
+    Return rxqs moved across pmds in the dry-run(s), as a map of
+    (port name, rxq id) and (source pmd id, target pmd id).
+
+    Parameters
+    ----------
+    pmd_map : dict
+        mapping of pmd id and its Dataif_Pmd object.
+    """
+
+    # every hop of a rxq, as repeated dry-runs could move it again.
+    rxq_hops = {}
+    for pmd in pmd_map.values():
+        for port in pmd.port_map.values():
+            for rxq_id, pmd_id in port.rxq_rebalanced.items():
+                hops = rxq_hops.setdefault((port.name, rxq_id), {})
+                hops[pmd.id] = pmd_id
+
+    plan = {}
+    for key, hops in rxq_hops.items():
+        # origin of the rxq is the pmd that no hop moved it into.
+        src_l = set(hops.keys()) - set(hops.values())
+        if not src_l:
+            # rxq moved back into its pmd.
+            continue
+
+        src = src_l.pop()
+        dst = hops[src]
+        for i in range(0, len(hops)):
+            if dst not in hops:
+                break
+            dst = hops[dst]
+
+        if src != dst:
+            plan[key] = (src, dst)
+
+    return plan
+
+
 def port_drop_ppm(port):
     """
     Return packet drops from the port stats.
 
     """
     ret_rxtx = [0, 0]
-    rx_sum = sum([j - i for i, j in zip(port.rx_cyc[:-1], port.rx_cyc[1:])])
-    rxd_sum = sum(
-        [j - i for i, j in zip(port.rx_drop_cyc[:-1], port.rx_drop_cyc[1:])])
-    tx_sum = sum([j - i for i, j in zip(port.tx_cyc[:-1], port.tx_cyc[1:])])
-    txd_sum = sum(
-        [j - i for i, j in zip(port.tx_drop_cyc[:-1], port.tx_drop_cyc[1:])])
+    rx_sum = cyc_delta(port.rx_cyc, port.cyc_idx, port.cyc_n)
+    rxd_sum = cyc_delta(port.rx_drop_cyc, port.cyc_idx, port.cyc_n)
+    tx_sum = cyc_delta(port.tx_cyc, port.cyc_idx, port.cyc_n)
+    txd_sum = cyc_delta(port.tx_drop_cyc, port.cyc_idx, port.cyc_n)
 
     if rx_sum != 0:
         ret_rxtx[0] = (1000000 * rxd_sum) / rx_sum
@@ -1462,12 +1814,133 @@ def port_drop_ppm(port):
     return ret_rxtx
 
 
+def port_drop_sample(port):
+    """
+    Return rx drop (in ppm) of the port in its latest sampling interval,
+    or None if there is no interval sampled yet.
+
+    Parameters
+    ----------
+    port : object
+        Dataif_Port class of the port.
+    """
+
+    if port.cyc_n < 2:
+        return None
+
+    cur_idx = port.cyc_idx
+    prev_idx = (cur_idx - 1) % len(port.rx_cyc)
+    rx = port.rx_cyc[cur_idx] - port.rx_cyc[prev_idx]
+    rxd = port.rx_drop_cyc[cur_idx] - port.rx_drop_cyc[prev_idx]
+    if rx <= 0:
+        return 0
+
+    return (1000000 * rxd) / rx
+
+
 def port_tx_retry(port):
     """
     Return count of tx retry performed, from the port stats.
     """
-    return sum(
-        [j - i for i, j in zip(port.tx_retry_cyc[:-1], port.tx_retry_cyc[1:])])
+    return cyc_delta(port.tx_retry_cyc, port.cyc_idx, port.cyc_n)
+
+
+def port_drop_penalty(port):
+    """
+    Return packet loss of the port, expressed as extra load (in
+    percent) that the pmds polling this port should carry in the
+    rebalance objective.
+
+    Parameters
+    ----------
+    port : object
+        Dataif_Port object.
+    """
+
+    drop = port_drop_ppm(port)
+    tx_retry = port_tx_retry(port)
+
+    penalty = (config.ncd_score_drop_weight * drop[0] +
+               config.ncd_score_retry_weight * tx_retry)
+
+    return min(penalty, 100)
+
+
+def pmd_drop_penalty(pmd_map):
+    """
+    Attribute packet loss of every port to the pmds polling its rxqs.
+    Loss of a port is shared among its pmds in proportion to the
+    cpu cycles its rxqs consume in each pmd.
+
+    Parameters
+    ----------
+    pmd_map : dict
+        mapping of pmd id and its Dataif_Pmd object.
+    """
+
+    pmd_penalty = {}
+    port_cyc = {}
+    port_rxq_n = {}
+
+    # total cycles and rxqs of every port across all pmds.
+    for pmd in pmd_map.values():
+        pmd_penalty[pmd.id] = 0
+        for port in pmd.port_map.values():
+            cyc = 0
+            for rxq in port.rxq_map.values():
+                cyc += cyc_total(rxq.cpu_cyc)
+
+            port_cyc[port.name] = port_cyc.get(port.name, 0) + cyc
+            port_rxq_n[port.name] = (port_rxq_n.get(port.name, 0) +
+                                     len(port.rxq_map))
+
+    port_penalty = {}
+    for pmd in pmd_map.values():
+        for port in pmd.port_map.values():
+            if len(port.rxq_map) == 0:
+                continue
+
+            if port.name not in port_penalty:
+                port_penalty[port.name] = port_drop_penalty(port)
+
+            penalty = port_penalty[port.name]
+            if penalty == 0:
+                continue
+
+            # share the loss as per cycles of this port in the pmd, or
+            # just by the count of rxqs when there is no cycle info.
+            if port_cyc[port.name] != 0:
+                cyc = 0
+                for rxq in port.rxq_map.values():
+                    cyc += cyc_total(rxq.cpu_cyc)
+                share = cyc / port_cyc[port.name]
+            else:
+                share = len(port.rxq_map) / port_rxq_n[port.name]
+
+            pmd_penalty[pmd.id] += (penalty * share)
+
+    for pmd_id in pmd_penalty:
+        pmd_penalty[pmd_id] = min(pmd_penalty[pmd_id], 100)
+
+    return pmd_penalty
+
+
+def pmd_load_score(pmd_map):
+    """
+    Get rebalance objective on a set of pmds. It is the load variance
+    of pmds, where packet loss on the ports is attributed to the pmds
+    polling them, as extra load.
+
+    Parameters
+    ----------
+    pmd_map : dict
+        mapping of pmd id and its Dataif_Pmd object.
+    """
+
+    pmd_penalty = pmd_drop_penalty(pmd_map)
+    pmd_load_list = list(map(lambda o: o.pmd_load + pmd_penalty[o.id],
+                             pmd_map.values()))
+    return util.variance(pmd_load_list)
 
 
 def upcall_rate(coverage, pmd_map):
@@ -0,0 +1,195 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['Cusum',
+           'ShiftDetector',
+           ]
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+
+
+class Cusum(object):
+    """
+    Class to represent two-sided CUSUM test on a series of values.
+    Deviations from a moving mean, beyond an allowed drift, are
+    accumulated on either side and the test fires once any of them
+    crosses the limit.
+
+    Attributes
+    ----------
+    drift : float
+        deviation from mean tolerated in every value.
+    limit : float
+        accumulated deviation to fire the test.
+    alpha : float
+        weight of new value in the moving mean.
+    mean : float
+        moving mean of the values.
+    pos : float
+        accumulated deviation above mean.
+    neg : float
+        accumulated deviation below mean.
+
+    Methods
+    -------
+    update(value)
+        add new value and return whether the test fired.
+    """
+
+    def __init__(self, drift, limit, alpha=0.2):
+        self.drift = drift
+        self.limit = limit
+        self.alpha = alpha
+        self.mean = None
+        self.pos = 0
+        self.neg = 0
+
+    def update(self, value):
+        """
+        Add new value in the series and return True if it has shifted.
+        Test restarts from this value once fired.
+
+        Parameters
+        ----------
+        value : float
+            new value in the series.
+        """
+
+        if self.mean is None:
+            self.mean = value
+            return False
+
+        dev = value - self.mean
+        self.pos = max(0, self.pos + dev - self.drift)
+        self.neg = max(0, self.neg - dev - self.drift)
+
+        if self.pos > self.limit or self.neg > self.limit:
+            self.mean = value
+            self.pos = 0
+            self.neg = 0
+            return True
+
+        self.mean += self.alpha * dev
+        return False
+
+
+class ShiftDetector(object):
+    """
+    Class to detect sudden shift in load of the pmds and in rx drop of
+    the ports, on every sample.
+
+    Attributes
+    ----------
+    pmd_test : dict
+        map of pmd id and Cusum object on its load.
+    port_test : dict
+        map of port name and Cusum object on its rx drop.
+    pmd_load : dict
+        map of pmd id and its load in previous sample.
+    skip : bool
+        whether to leave out the next sample.
+
+    Methods
+    -------
+    update(pmd_map, port_to_cls)
+        check latest sample and return what has shifted.
+    reset()
+        forget the samples checked so far.
+    skip_next()
+        leave out the next sample.
+    """
+
+    def __init__(self):
+        self.pmd_test = {}
+        self.port_test = {}
+        self.pmd_load = {}
+        self.skip = False
+
+    def reset(self):
+        """
+        Forget the samples checked so far, as when pmds are
+        reconfigured.
+        """
+
+        self.pmd_test.clear()
+        self.port_test.clear()
+        self.pmd_load.clear()
+        self.skip = False
+
+    def skip_next(self):
+        """
+        Leave out the next sample, as when it is taken right after the
+        latest one and its interval is too short to be compared.
+        """
+
+        self.skip = True
+
+    def update(self, pmd_map, port_to_cls):
+        """
+        Check latest sample of the pmds and ports, and return list of
+        the ones with sudden shift.
+
+        A pmd has shifted when its load crosses ncd_pmd_core_threshold
+        from below, or its CUSUM test fires. A port has shifted when
+        its CUSUM test on rx drop fires.
+
+        Parameters
+        ----------
+        pmd_map : dict
+            mapping of pmd id and its Dataif_Pmd object.
+        port_to_cls : dict
+            mapping of port name and its Dataif_Port class.
+        """
+
+        shift = []
+        if self.skip:
+            self.skip = False
+            return shift
+
+        for pmd_id in sorted(pmd_map.keys()):
+            load = dataif.pmd_load_sample(pmd_map[pmd_id])
+            if load is None:
+                continue
+
+            if pmd_id not in self.pmd_test:
+                self.pmd_test[pmd_id] = Cusum(config.ncd_detect_load_drift,
+                                              config.ncd_detect_load_limit)
+
+            prev_load = self.pmd_load.get(pmd_id, load)
+            self.pmd_load[pmd_id] = load
+
+            fired = self.pmd_test[pmd_id].update(load)
+            if (prev_load < config.ncd_pmd_core_threshold <= load):
+                fired = True
+
+            if fired:
+                shift.append("pmd %d" % pmd_id)
+
+        for port_name in sorted(port_to_cls.keys()):
+            drop = dataif.port_drop_sample(port_to_cls[port_name])
+            if drop is None:
+                continue
+
+            if port_name not in self.port_test:
+                self.port_test[port_name] = Cusum(
+                    config.ncd_detect_drop_drift,
+                    config.ncd_detect_drop_limit)
+
+            if self.port_test[port_name].update(drop):
+                shift.append("port %s" % port_name)
+
+        return shift
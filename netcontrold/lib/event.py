@@ -0,0 +1,136 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['EventLog',
+           ]
+
+import threading
+
+
+def event_row(ev):
+    """
+    Return event as a row in status table.
+    """
+
+    return "%-16s | %-12s | %s\n" % ev
+
+
+class EventLog(object):
+    """
+    Class to represent fixed size ring of events, each a tuple of the
+    object, event and time stamp. Oldest event is overwritten once the
+    ring is full, and every event is given a sequence number to query
+    events after it.
+
+    Attributes
+    ----------
+    size : int
+        most events retained.
+    seq : int
+        sequence number of next event appended.
+    counts : dict
+        map of event and count of its occurrence, including events
+        overwritten in the ring.
+    journal : object
+        Journal object that events are persisted in, if any.
+
+    Methods
+    -------
+    append(ev)
+        add new event, overwriting the oldest if full.
+    count(event)
+        returns count of the event.
+    query(cursor, limit)
+        returns events from cursor and cursor after them.
+    rows()
+        returns events rendered as status table rows.
+    clear()
+        remove all events and their counts.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.journal = None
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.ring = [None, ] * self.size
+            self.seq = 0
+            self.counts = {}
+            if self.journal:
+                self.journal.clear_events()
+
+    def __len__(self):
+        return min(self.seq, self.size)
+
+    def __iter__(self):
+        return iter(self.query(0, self.size)[0])
+
+    def append(self, ev):
+        ev = tuple(ev)
+        with self.lock:
+            self.ring[self.seq % self.size] = (ev, event_row(ev))
+            self.seq += 1
+            self.counts[ev[1]] = self.counts.get(ev[1], 0) + 1
+            if self.journal:
+                self.journal.append_event(ev)
+
+    def extend(self, evs):
+        for ev in evs:
+            self.append(ev)
+
+    def count(self, event):
+        return self.counts.get(event, 0)
+
+    def _slots(self, cursor, limit):
+        first = max(cursor, self.seq - self.size, 0)
+        last = self.seq
+        if limit is not None:
+            last = min(last, first + limit)
+
+        return ([self.ring[i % self.size] for i in range(first, last)], last)
+
+    def query(self, cursor=0, limit=None):
+        """
+        Return tuple of list of events, oldest first, from sequence
+        number cursor (or oldest retained, if overwritten), and cursor
+        to query next events from.
+
+        Parameters
+        ----------
+        cursor : int, optional
+            sequence number of first event (default is 0).
+        limit : int, optional
+            most events returned (default is no limit).
+        """
+
+        with self.lock:
+            (slots, last) = self._slots(cursor, limit)
+
+        return ([ev for (ev, row) in slots], last)
+
+    def rows(self, cursor=0, limit=None):
+        """
+        Return tuple of events rendered as status table rows, and
+        cursor to query next events from, as in query().
+        """
+
+        with self.lock:
+            (slots, last) = self._slots(cursor, limit)
+
+        return ("".join([row for (ev, row) in slots]), last)
@@ -0,0 +1,254 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['unixctl_socket',
+           'parse_pmd_counters',
+           'HfRing',
+           'HfSampler',
+           ]
+
+import collections
+import os
+import re
+import threading
+import time
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import jsonrpc
+from netcontrold.lib import util
+from netcontrold.lib.error import OsCommandExc
+
+
+def unixctl_socket():
+    """
+    Return unixctl socket file of the running vswitchd.
+
+    Raises
+    ------
+    OsCommandExc
+        if vswitchd pid could not be found.
+    """
+
+    pid_file = os.path.join(config.ovs_rundir, "ovs-vswitchd.pid")
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+    except (IOError, ValueError) as e:
+        raise OsCommandExc("unable to read %s: %s" % (pid_file, e))
+
+    return os.path.join(config.ovs_rundir, "ovs-vswitchd.%d.ctl" % pid)
+
+
+def parse_pmd_counters(data):
+    """
+    Return counters of every pmd from pmd-stats-show output, as a map
+    of pmd id and tuple of packets received, idle and processing cpu
+    cycles.
+
+    Parameters
+    ----------
+    data : str
+        output of dpif-netdev/pmd-stats-show command.
+    """
+
+    counters = {}
+    core_id = None
+    rx = idle = proc = 0
+    for line in data.splitlines():
+        if line.startswith("pmd thread"):
+            if core_id is not None:
+                counters[core_id] = (rx, idle, proc)
+
+            linesre = re.search(r'core_id (\d+):', line)
+            core_id = int(linesre.groups()[0])
+            rx = idle = proc = 0
+        elif line.startswith("main thread"):
+            break
+        elif core_id is not None:
+            (sname, sep, sval) = line.partition(":")
+            sname = sname.strip()
+            if sname == "packets received":
+                rx = int(sval.split()[0])
+            elif sname == "idle cycles":
+                idle = int(sval.split()[0])
+            elif sname == "processing cycles":
+                proc = int(sval.split()[0])
+
+    if core_id is not None:
+        counters[core_id] = (rx, idle, proc)
+
+    return counters
+
+
+class HfRing(object):
+    """
+    Class to represent bounded ring of high-frequency samples of pmd
+    counters.
+
+    Attributes
+    ----------
+    samples : deque
+        tuple of monotonic time and pmd counters, latest at the end.
+    lock : Lock
+        lock to serialize appends with readers of the samples.
+
+    Methods
+    -------
+    append(ts, counters)
+        add new sample, dropping the oldest if full.
+    pmd_load()
+        returns load of every pmd in every sampled interval.
+    summary()
+        returns latest, highest and mean load of every pmd.
+    """
+
+    def __init__(self, size):
+        self.samples = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def append(self, ts, counters):
+        with self.lock:
+            self.samples.append((ts, counters))
+
+    def pmd_load(self):
+        """
+        Return map of pmd id and list of its load in every interval
+        between samples, oldest first.
+        """
+
+        # sampler thread keeps appending while control sessions read.
+        with self.lock:
+            samples = list(self.samples)
+
+        load = {}
+        prev = None
+        for (ts, counters) in samples:
+            if prev is None:
+                prev = counters
+                continue
+
+            for pmd_id, (rx, idle, proc) in counters.items():
+                if pmd_id not in prev:
+                    continue
+
+                (prx, pidle, pproc) = prev[pmd_id]
+                cyc = (idle - pidle) + (proc - pproc)
+                if cyc <= 0:
+                    continue
+
+                load.setdefault(pmd_id, []).append(
+                    ((proc - pproc) * 100) / cyc)
+
+            prev = counters
+
+        return load
+
+    def summary(self):
+        """
+        Return map of pmd id and tuple of its latest, highest and mean
+        load among the intervals sampled.
+        """
+
+        summary = {}
+        for pmd_id, load in self.pmd_load().items():
+            summary[pmd_id] = (load[-1], max(load), sum(load) / len(load))
+
+        return summary
+
+
+class HfSampler(util.Thread):
+    """
+    Class to represent thread sampling pmd counters at high frequency,
+    through a persistent unixctl connection to vswitchd.
+
+    Attributes
+    ----------
+    interval : float
+        seconds between samples.
+    ring : object
+        HfRing object of the samples.
+    cpu_cost : float
+        cpu seconds consumed by this thread in every second.
+    n_errors : int
+        count of samples failed.
+
+    Methods
+    -------
+    stop()
+        stop sampling.
+    """
+
+    def __init__(self, eobj, interval=None, size=None):
+        util.Thread.__init__(self, eobj)
+        self.daemon = True
+        if interval is None:
+            interval = config.ncd_hf_interval
+        if size is None:
+            size = config.ncd_hf_samples
+
+        self.interval = interval
+        self.ring = HfRing(size)
+        self.cpu_cost = 0.0
+        self.n_errors = 0
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        nlog = dataif.Context.nlog
+        clock = dataif.Context.clock
+
+        conn = None
+        cpu_ts = time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID)
+        wall_ts = clock.now()
+        deadline = wall_ts
+        while not (self.stop_event.is_set() or self.ncd_shutdown.is_set()):
+            try:
+                # vswitchd may be restarted, so find its socket again
+                # when reconnecting.
+                if conn is None:
+                    conn = jsonrpc.Connection(unixctl_socket(),
+                                              max(self.interval, 1))
+
+                data = conn.request("dpif-netdev/pmd-stats-show", [])
+                self.ring.append(clock.now(), parse_pmd_counters(data))
+            except OsCommandExc as e:
+                self.n_errors += 1
+                nlog.debug("high-frequency sampling failed: %s" % e)
+                if conn:
+                    conn.close()
+                conn = None
+
+            # account cpu consumed by this thread, once in a second.
+            now = clock.now()
+            if (now - wall_ts) >= 1:
+                cpu = time.clock_gettime(time.CLOCK_THREAD_CPUTIME_ID)
+                self.cpu_cost = (cpu - cpu_ts) / (now - wall_ts)
+                (cpu_ts, wall_ts) = (cpu, now)
+
+            deadline += self.interval
+            if deadline < now:
+                deadline = now
+
+            self.stop_event.wait(max(0, deadline - clock.now()))
+
+        if conn:
+            conn.close()
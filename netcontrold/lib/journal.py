@@ -0,0 +1,255 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['read_records',
+           'Journal',
+           ]
+
+import collections
+import json
+import os
+import struct
+import threading
+import zlib
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+
+# every record is its length and crc32, followed by json payload.
+_HDR = struct.Struct("<II")
+
+
+def encode_record(rec):
+    data = json.dumps(rec, separators=(',', ':')).encode()
+    return _HDR.pack(len(data), zlib.crc32(data) & 0xffffffff) + data
+
+
+def read_records(path):
+    """
+    Return tuple of list of records in the journal, and offset where
+    valid records end. Records after a torn or corrupt one, as left by
+    a crash while appending, are not returned.
+
+    Parameters
+    ----------
+    path : str
+        journal file.
+    """
+
+    recs = []
+    end = 0
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return (recs, end)
+
+    while (end + _HDR.size) <= len(data):
+        (n, crc) = _HDR.unpack_from(data, end)
+        payload = data[end + _HDR.size:end + _HDR.size + n]
+        if len(payload) < n or (zlib.crc32(payload) & 0xffffffff) != crc:
+            break
+
+        try:
+            recs.append(json.loads(payload.decode()))
+        except ValueError:
+            break
+
+        end += _HDR.size + n
+
+    return (recs, end)
+
+
+class Journal(object):
+    """
+    Class to represent append-only journal of events and mode flags.
+    Existing journal is replayed when opened, and appends are fsync'ed
+    in batches. Once journal grows too big, it is rewritten with only
+    the events retained and latest flags. On any error in writing it,
+    journal is closed and no more records are appended.
+
+    Attributes
+    ----------
+    path : str
+        journal file.
+    events : deque
+        latest events in the journal, oldest first.
+    flags : dict
+        latest mode flags in the journal.
+    sync_n : int
+        records appended before fsync.
+    size_max : int
+        size (in bytes) that journal is compacted beyond.
+
+    Methods
+    -------
+    append_event(ev)
+        add an event.
+    clear_events()
+        drop all events.
+    set_flags(flags)
+        add mode flags, if changed.
+    sync()
+        fsync records appended.
+    compact()
+        rewrite journal with only the events retained and latest flags.
+    close()
+        sync and close journal.
+    """
+
+    def __init__(self, path, sync_n=None, size_max=None, events_max=None):
+        if sync_n is None:
+            sync_n = config.ncd_journal_sync_n
+        if size_max is None:
+            size_max = config.ncd_journal_size_max
+        if events_max is None:
+            events_max = config.ncd_events_max
+
+        self.path = path
+        self.sync_n = sync_n
+        self.size_max = size_max
+        self.events = collections.deque(maxlen=events_max)
+        self.flags = {}
+        self.lock = threading.Lock()
+        self.pending = 0
+
+        (recs, end) = read_records(path)
+        for rec in recs:
+            self._apply(rec)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.fd = open(path, 'ab')
+        self.fd.truncate(end)
+        self.size = end
+
+    def _apply(self, rec):
+        if rec["t"] == "ev":
+            self.events.append(tuple(rec["ev"]))
+        elif rec["t"] == "clear":
+            self.events.clear()
+        elif rec["t"] == "flags":
+            self.flags = rec["flags"]
+
+    def _append(self, rec):
+        with self.lock:
+            self._write(rec)
+
+    def _write(self, rec):
+        if self.fd.closed:
+            return
+
+        self._apply(rec)
+        data = encode_record(rec)
+        try:
+            self.fd.write(data)
+            self.size += len(data)
+            self.pending += 1
+            if self.pending >= self.sync_n:
+                self._sync()
+
+            if self.size > self.size_max:
+                self._compact()
+        except OSError as e:
+            self._fail(e)
+
+    def _fail(self, e):
+        nlog = dataif.Context.nlog
+        if nlog:
+            nlog.warn("unable to write journal %s: %s, not journaling"
+                      " any more" % (self.path, e))
+
+        try:
+            self.fd.close()
+        except OSError:
+            pass
+
+    def _sync(self):
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+        self.pending = 0
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            recs = [{"t": "flags", "flags": self.flags}]
+            recs += [{"t": "ev", "ev": list(ev)} for ev in self.events]
+            for rec in recs:
+                data = encode_record(rec)
+                f.write(data)
+                size += len(data)
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.fd.close()
+        os.replace(tmp_path, self.path)
+        self.fd = open(self.path, 'ab')
+        self.size = size
+        self.pending = 0
+
+    def append_event(self, ev):
+        self._append({"t": "ev", "ev": list(ev)})
+
+    def clear_events(self):
+        self._append({"t": "clear"})
+
+    def set_flags(self, flags):
+        """
+        Add mode flags, unless they are same as latest in journal.
+
+        Parameters
+        ----------
+        flags : dict
+            map of mode and its flag.
+        """
+
+        with self.lock:
+            if flags != self.flags:
+                self._write({"t": "flags", "flags": dict(flags)})
+
+    def sync(self):
+        with self.lock:
+            if self.fd.closed:
+                return
+
+            try:
+                self._sync()
+            except OSError as e:
+                self._fail(e)
+
+    def compact(self):
+        with self.lock:
+            if self.fd.closed:
+                return
+
+            try:
+                self._compact()
+            except OSError as e:
+                self._fail(e)
+
+    def close(self):
+        with self.lock:
+            if self.fd.closed:
+                return
+
+            try:
+                self._sync()
+            except OSError as e:
+                self._fail(e)
+                return
+
+            self.fd.close()
@@ -0,0 +1,174 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['Connection']
+
+import json
+import socket
+
+from netcontrold.lib.error import OsCommandExc
+
+
+class Connection(object):
+    """
+    Class to represent JSON-RPC connection over unix socket, as used
+    by ovsdb-server and ovs-vswitchd.
+
+    Attributes
+    ----------
+    sock_file : str
+        unix socket file to connect.
+    timeout : float
+        seconds to wait for any reply.
+
+    Methods
+    -------
+    open()
+        connect to the socket.
+    close()
+        close the connection.
+    request(method, params)
+        send request and return its result.
+    """
+
+    def __init__(self, sock_file, timeout=10):
+        self.sock_file = sock_file
+        self.timeout = timeout
+        self.sock = None
+        self.buf = ""
+        self.next_id = 0
+
+    def open(self):
+        """
+        Connect to the socket, if not already connected.
+
+        Raises
+        ------
+        OsCommandExc
+            if unable to connect the socket.
+        """
+
+        if self.sock:
+            return
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.sock_file)
+        except (OSError, socket.error) as e:
+            sock.close()
+            raise OsCommandExc("unable to connect %s: %s"
+                               % (self.sock_file, e))
+
+        self.sock = sock
+        self.buf = ""
+
+    def close(self):
+        """
+        Close the connection.
+        """
+
+        if self.sock:
+            self.sock.close()
+
+        self.sock = None
+        self.buf = ""
+
+    def send(self, msg):
+        try:
+            self.sock.sendall(json.dumps(msg).encode())
+        except (OSError, socket.error) as e:
+            self.close()
+            raise OsCommandExc("unable to send on %s: %s"
+                               % (self.sock_file, e))
+
+    def recv(self):
+        """
+        Return next JSON message received in this connection.
+
+        Raises
+        ------
+        OsCommandExc
+            if connection is closed or timed out.
+        """
+
+        decoder = json.JSONDecoder()
+        while True:
+            data = self.buf.lstrip()
+            if data:
+                try:
+                    (msg, end) = decoder.raw_decode(data)
+                    self.buf = data[end:]
+                    return msg
+                except ValueError:
+                    # message not complete yet.
+                    pass
+
+            try:
+                chunk = self.sock.recv(65536)
+            except (OSError, socket.error) as e:
+                self.close()
+                raise OsCommandExc("unable to receive on %s: %s"
+                                   % (self.sock_file, e))
+
+            if not chunk:
+                self.close()
+                raise OsCommandExc("connection closed by %s"
+                                   % self.sock_file)
+
+            self.buf += chunk.decode()
+
+    def request(self, method, params):
+        """
+        Send request and return its result.
+
+        Parameters
+        ----------
+        method : str
+            name of the method.
+        params : list
+            parameters of the method.
+
+        Raises
+        ------
+        OsCommandExc
+            if the request failed for some reason.
+        """
+
+        self.open()
+
+        self.next_id += 1
+        req_id = self.next_id
+        self.send({"method": method, "params": params, "id": req_id})
+
+        while True:
+            msg = self.recv()
+
+            # keep the session alive for the server.
+            if msg.get("method") == "echo":
+                self.send({"result": msg.get("params", []),
+                           "error": None, "id": msg.get("id")})
+                continue
+
+            if msg.get("id") != req_id:
+                # skip notifications and stale replies.
+                continue
+
+            if msg.get("error"):
+                raise OsCommandExc("%s failed: %s"
+                                   % (method, msg["error"]))
+
+            return msg.get("result")
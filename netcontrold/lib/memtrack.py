@@ -0,0 +1,176 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['rss',
+           'model_counts',
+           'ring_sizes',
+           'MemTracker',
+           'tracker',
+           ]
+
+import gc
+import os
+import tracemalloc
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+
+
+def rss():
+    """
+    Return resident set size (in bytes) of this process, or zero if it
+    could not be read.
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (IOError, ValueError, IndexError):
+        return 0
+
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def model_counts():
+    """
+    Return map of model type and count of its objects alive. Every
+    port is modelled by a class of its own, so port classes are counted
+    apart from their instances in pmds.
+    """
+
+    counts = {}
+    model = (dataif.Dataif_Pmd, dataif.Rxq, dataif.Port,
+             dataif.Dataif_Coverage)
+    for obj in gc.get_objects():
+        if isinstance(obj, type):
+            if issubclass(obj, dataif.Port) and obj is not dataif.Port:
+                name = "%s (class)" % obj.__name__
+            else:
+                continue
+        elif isinstance(obj, model):
+            name = type(obj).__name__
+        else:
+            continue
+
+        counts[name] = counts.get(name, 0) + 1
+
+    return counts
+
+
+def ring_sizes(ctx):
+    """
+    Return map of every ring buffer in the context and count of its
+    entries.
+
+    Parameters
+    ----------
+    ctx : object
+        Context class of the daemon.
+    """
+
+    pmd_n = rxq_n = 0
+    for pmd in ctx.pmd_map.values():
+        pmd_n += len(pmd.rx_cyc)
+        for port in pmd.port_map.values():
+            for rxq in port.rxq_map.values():
+                rxq_n += len(rxq.cpu_cyc)
+
+    return {"events": len(ctx.events),
+            "pmd samples": pmd_n,
+            "rxq samples": rxq_n,
+            }
+
+
+class MemTracker(object):
+    """
+    Class to track allocations of the daemon through tracemalloc, which
+    is started only on demand for its overhead.
+
+    Attributes
+    ----------
+    snapshot : object
+        tracemalloc snapshot to compare against, if any.
+
+    Methods
+    -------
+    take_snapshot()
+        start tracing if need be, and keep snapshot of allocations.
+    top(limit)
+        returns top allocators of the memory traced.
+    diff(limit)
+        returns top allocators grown since snapshot.
+    clear()
+        stop tracing and drop snapshot.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+
+    def _filtered(self):
+        snap = tracemalloc.take_snapshot()
+        return snap.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def take_snapshot(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(config.ncd_mem_trace_frames)
+
+        self.snapshot = self._filtered()
+
+    def top(self, limit=None):
+        """
+        Return list of file:line and tuple of its size (in bytes) and
+        count of blocks allocated, largest first. Empty when memory is
+        not traced.
+        """
+
+        if not tracemalloc.is_tracing():
+            return []
+
+        if limit is None:
+            limit = config.ncd_mem_top_n
+
+        stats = self._filtered().statistics("lineno")
+        return [(str(stat.traceback), (stat.size, stat.count))
+                for stat in stats[:limit]]
+
+    def diff(self, limit=None):
+        """
+        Return list of file:line and tuple of its growth in size (in
+        bytes) and count of blocks since snapshot, largest first. Empty
+        when no snapshot is taken.
+        """
+
+        if not (self.snapshot and tracemalloc.is_tracing()):
+            return []
+
+        if limit is None:
+            limit = config.ncd_mem_top_n
+
+        stats = self._filtered().compare_to(self.snapshot, "lineno")
+        return [(str(stat.traceback), (stat.size_diff, stat.count_diff))
+                for stat in stats[:limit]]
+
+    def clear(self):
+        self.snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# memory tracker of the daemon.
+tracker = MemTracker()
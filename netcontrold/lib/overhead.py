@@ -0,0 +1,187 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['Usage',
+           'usage',
+           'usage_delta',
+           'usage_str',
+           'Overhead',
+           'overhead',
+           'accounted',
+           ]
+
+import collections
+import os
+import threading
+import time
+
+from netcontrold.lib import config
+
+Usage = collections.namedtuple("Usage", [
+    "wall", "user", "sys", "child_user", "child_sys", "vol_csw",
+    "invol_csw"])
+
+
+def ctx_switches():
+    """
+    Return tuple of voluntary and involuntary context switches of this
+    process, or zeros if they could not be read.
+    """
+
+    vol = invol = 0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                (name, sep, val) = line.partition(":")
+                if name == "voluntary_ctxt_switches":
+                    vol = int(val)
+                elif name == "nonvoluntary_ctxt_switches":
+                    invol = int(val)
+    except (IOError, ValueError):
+        pass
+
+    return (vol, invol)
+
+
+def usage():
+    """
+    Return Usage of this process so far. Cpu times are of all threads
+    in the process, and of child processes (host commands) waited for.
+    """
+
+    t = os.times()
+    (vol, invol) = ctx_switches()
+    return Usage(time.monotonic(), t[0], t[1], t[2], t[3], vol, invol)
+
+
+def usage_delta(end, start):
+    return Usage(*[(e - s) for (e, s) in zip(end, start)])
+
+
+def usage_str(u):
+    """
+    Return Usage in a line to log.
+    """
+
+    cpu = u.user + u.sys
+    pct = (cpu * 100 / u.wall) if u.wall > 0 else 0.0
+    return "wall %.3fs, cpu %.3fs (user %.3fs sys %.3fs, %.2f%%), " \
+        "child cpu %.3fs, ctx switches %d/%d" % (
+            u.wall, cpu, u.user, u.sys, pct, u.child_user + u.child_sys,
+            u.vol_csw, u.invol_csw)
+
+
+class Overhead(object):
+    """
+    Class to account resources consumed by the daemon itself in every
+    phase.
+
+    Attributes
+    ----------
+    phase_map : dict
+        map of phase name and list of its count, Usage in latest run
+        and Usage summed over all runs.
+    log_ts : float
+        monotonic time when summary was last logged.
+
+    Methods
+    -------
+    record(name, delta)
+        add Usage of a run of the phase.
+    summary()
+        returns count, latest and total Usage of every phase.
+    log_due(now)
+        whether summary is due to be logged.
+    clear()
+        remove all phases.
+    """
+
+    def __init__(self):
+        self.phase_map = {}
+        self.log_ts = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, name, delta):
+        with self.lock:
+            phase = self.phase_map.get(name)
+            if not phase:
+                self.phase_map[name] = [1, delta, delta]
+                return
+
+            phase[0] += 1
+            phase[1] = delta
+            phase[2] = Usage(*[(a + b) for (a, b) in zip(phase[2], delta)])
+
+    def summary(self):
+        """
+        Return map of phase name and tuple of its count, Usage in
+        latest run and Usage summed over all runs.
+        """
+
+        with self.lock:
+            return {name: tuple(phase)
+                    for name, phase in self.phase_map.items()}
+
+    def log_due(self, now=None):
+        """
+        Return whether ncd_overhead_log_interval has passed since
+        summary was last logged, and if so restart the interval.
+
+        Parameters
+        ----------
+        now : float, optional
+            monotonic time (default is current time).
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        if (now - self.log_ts) < config.ncd_overhead_log_interval:
+            return False
+
+        self.log_ts = now
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.phase_map = {}
+
+
+# resources consumed by the daemon.
+overhead = Overhead()
+
+
+class accounted(object):
+    """
+    Context manager to record resources consumed in the block as a run
+    of the phase.
+
+    Parameters
+    ----------
+    name : str
+        name of the phase.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = usage()
+        return self
+
+    def __exit__(self, *args):
+        overhead.record(self.name, usage_delta(usage(), self.start))
+        return False
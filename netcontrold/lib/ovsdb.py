@@ -0,0 +1,156 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['affinity_ops',
+           'transact',
+           'wait_cfg',
+           'set_affinity',
+           ]
+
+import time
+
+from netcontrold.lib import jsonrpc
+from netcontrold.lib.error import OsCommandExc
+
+OVSDB_NAME = "Open_vSwitch"
+
+# Interval (in sec) to poll cur_cfg, while waiting for vswitchd.
+CFG_POLL_INTERVAL = 0.05
+
+
+def affinity_ops(port_aff):
+    """
+    Return OVSDB operations to set rxq affinity of the ports, and to
+    request vswitchd for reconfiguration.
+
+    Parameters
+    ----------
+    port_aff : dict
+        mapping of port name and its pmd-rxq-affinity to be set, or
+        None to remove it.
+    """
+
+    ops = []
+    for port_name, pmdq in sorted(port_aff.items()):
+        where = [["name", "==", port_name]]
+
+        # insert does not replace an existing key, so remove it first.
+        mutations = [["other_config", "delete",
+                      ["set", ["pmd-rxq-affinity"]]]]
+        if pmdq:
+            mutations.append(["other_config", "insert",
+                              ["map", [["pmd-rxq-affinity", pmdq]]]])
+
+        ops.append({"op": "mutate", "table": "Interface",
+                    "where": where, "mutations": mutations})
+
+    # vswitchd reconfigures and sets cur_cfg once it sees next_cfg bumped.
+    ops.append({"op": "mutate", "table": "Open_vSwitch", "where": [],
+                "mutations": [["next_cfg", "+=", 1]]})
+    ops.append({"op": "select", "table": "Open_vSwitch", "where": [],
+                "columns": ["next_cfg"]})
+    ops.append({"op": "comment",
+                "comment": "netcontrold: set pmd-rxq-affinity"})
+
+    return ops
+
+
+def transact(conn, ops):
+    """
+    Run OVSDB operations in one transaction and return their results.
+
+    Parameters
+    ----------
+    conn : object
+        jsonrpc.Connection object to OVSDB server.
+    ops : list
+        OVSDB operations.
+
+    Raises
+    ------
+    OsCommandExc
+        if the transaction failed.
+    """
+
+    result = conn.request("transact", [OVSDB_NAME] + ops)
+    for res in result:
+        if res and res.get("error"):
+            raise OsCommandExc("ovsdb transaction failed: %s (%s)"
+                               % (res["error"], res.get("details", "")))
+
+    return result
+
+
+def wait_cfg(conn, next_cfg, timeout):
+    """
+    Wait until vswitchd has applied configuration of next_cfg.
+    Return True if it did within timeout, False otherwise.
+
+    Parameters
+    ----------
+    conn : object
+        jsonrpc.Connection object to OVSDB server.
+    next_cfg : int
+        configuration sequence number to wait for.
+    timeout : float
+        maximum seconds to wait.
+    """
+
+    op = {"op": "select", "table": "Open_vSwitch", "where": [],
+          "columns": ["cur_cfg"]}
+
+    deadline = time.monotonic() + timeout
+    while True:
+        rows = transact(conn, [op])[0]["rows"]
+        if rows and rows[0]["cur_cfg"] >= next_cfg:
+            return True
+
+        if time.monotonic() >= deadline:
+            return False
+
+        time.sleep(CFG_POLL_INTERVAL)
+
+
+def set_affinity(port_aff, sock_file, timeout):
+    """
+    Set rxq affinity of the ports in one OVSDB transaction, and wait
+    until vswitchd has applied it. Return True if vswitchd applied the
+    change within timeout, False otherwise.
+
+    Parameters
+    ----------
+    port_aff : dict
+        mapping of port name and its pmd-rxq-affinity to be set, or
+        None to remove it.
+    sock_file : str
+        unix socket file of OVSDB server.
+    timeout : float
+        maximum seconds to wait for vswitchd.
+
+    Raises
+    ------
+    OsCommandExc
+        if the transaction could not be run.
+    """
+
+    conn = jsonrpc.Connection(sock_file, timeout)
+    try:
+        ops = affinity_ops(port_aff)
+        result = transact(conn, ops)
+        next_cfg = result[len(ops) - 2]["rows"][0]["next_cfg"]
+        return wait_cfg(conn, next_cfg, timeout)
+    finally:
+        conn.close()
@@ -0,0 +1,201 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['Histogram',
+           'Timings',
+           'timings',
+           'timer',
+           'timed',
+           ]
+
+import functools
+import math
+import threading
+import time
+
+
+class Histogram(object):
+    """
+    Class to represent latency histogram in log scale buckets, from
+    one microsecond with four buckets in every doubling. Recording a
+    latency is constant time and size of histogram is fixed.
+
+    Attributes
+    ----------
+    buckets : list
+        count of latencies in every bucket.
+    count : int
+        count of latencies recorded.
+    total : float
+        sum of latencies (in sec).
+    max : float
+        highest latency (in sec).
+
+    Methods
+    -------
+    record(sec)
+        add a latency.
+    percentile(p)
+        returns latency at p percentile.
+    """
+
+    base = 1e-6
+    sub = 4
+    n_buckets = 140
+
+    def __init__(self):
+        self.buckets = [0, ] * self.n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def upper(self, i):
+        """
+        Return highest latency (in sec) in bucket i.
+        """
+        return self.base * (2 ** (i / self.sub))
+
+    def record(self, sec):
+        i = 0
+        if sec > self.base:
+            i = min(int(math.ceil(math.log2(sec / self.base) * self.sub)),
+                    self.n_buckets - 1)
+
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += sec
+        if sec > self.max:
+            self.max = sec
+
+    def percentile(self, p):
+        """
+        Return latency (in sec) at p percentile, as upper bound of its
+        bucket, or zero when nothing is recorded.
+
+        Parameters
+        ----------
+        p : float
+            percentile between 0 and 100.
+        """
+
+        if not self.count:
+            return 0.0
+
+        target = (p * self.count) / 100
+        cum = 0
+        for i, n in enumerate(self.buckets):
+            cum += n
+            if n and cum >= target:
+                return min(self.upper(i), self.max)
+
+        return self.max
+
+
+class Timings(object):
+    """
+    Class to represent latency histogram of every phase.
+
+    Attributes
+    ----------
+    hist_map : dict
+        map of phase name and its Histogram object.
+
+    Methods
+    -------
+    record(name, sec)
+        add a latency of the phase.
+    summary()
+        returns count, p50, p99 and max latency of every phase.
+    clear()
+        remove all latencies.
+    """
+
+    def __init__(self):
+        self.hist_map = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, sec):
+        with self.lock:
+            hist = self.hist_map.get(name)
+            if not hist:
+                hist = Histogram()
+                self.hist_map[name] = hist
+
+            hist.record(sec)
+
+    def summary(self):
+        """
+        Return map of phase name and tuple of its count, p50, p99 and
+        max latency (in sec).
+        """
+
+        with self.lock:
+            return {name: (hist.count, hist.percentile(50),
+                           hist.percentile(99), hist.max)
+                    for name, hist in self.hist_map.items()}
+
+    def clear(self):
+        with self.lock:
+            self.hist_map = {}
+
+
+# timings of the daemon.
+timings = Timings()
+
+
+class timer(object):
+    """
+    Context manager to record time taken in the block as latency of
+    the phase.
+
+    Parameters
+    ----------
+    name : str
+        name of the phase.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        timings.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed(name):
+    """
+    Return decorator recording time taken in every call of the function
+    as latency of the phase.
+
+    Parameters
+    ----------
+    name : str
+        name of the phase.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
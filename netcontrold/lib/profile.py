@@ -0,0 +1,205 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['StackSampler',
+           'Profiler',
+           'profiler',
+           ]
+
+import cProfile
+import os
+import sys
+import threading
+from datetime import datetime
+
+from netcontrold.lib import config
+from netcontrold.lib import util
+
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+
+
+class StackSampler(util.Thread):
+    """
+    Class to represent thread sampling stack of another thread at an
+    interval, counting every distinct stack in collapsed form as
+    "file:function;file:function".
+
+    Attributes
+    ----------
+    thread_id : int
+        ident of the thread sampled.
+    interval : float
+        seconds between samples.
+    counts : dict
+        map of collapsed stack and count of its samples.
+
+    Methods
+    -------
+    stop()
+        stop sampling.
+    write(path)
+        write collapsed stacks for flamegraph.
+    """
+
+    def __init__(self, eobj, thread_id, interval=None):
+        util.Thread.__init__(self, eobj)
+        self.daemon = True
+        if interval is None:
+            interval = config.ncd_profile_interval
+
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame:
+            code = frame.f_code
+            stack.append("%s:%s" % (os.path.basename(code.co_filename),
+                                    code.co_name))
+            frame = frame.f_back
+
+        if stack:
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def run(self):
+        while not (self.stop_event.is_set() or self.ncd_shutdown.is_set()):
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for key in sorted(self.counts.keys()):
+                f.write("%s %d\n" % (key, self.counts[key]))
+
+
+class Profiler(object):
+    """
+    Class to profile main loop of the daemon on demand. Stack sampling
+    runs in its own thread, while cProfile is switched on and off by
+    the main loop itself at its next poll(), so that collection is
+    never paused.
+
+    Attributes
+    ----------
+    mode : str
+        MODE_SAMPLE or MODE_CPROFILE, or None when not profiling.
+    path : str
+        file the profile is written into.
+
+    Methods
+    -------
+    start(mode, eobj, thread_id)
+        begin profiling, returning file to be written.
+    stop()
+        end profiling, returning file written.
+    poll()
+        switch cProfile in the calling thread, as requested.
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.path = None
+        self.sampler = None
+        self.prof = None
+        self.want_prof = False
+        self.dump_path = None
+
+    def start(self, mode, eobj, thread_id=None):
+        """
+        Begin profiling and return file that the profile is written into
+        when stopped, or None when already profiling.
+
+        Parameters
+        ----------
+        mode : str
+            MODE_SAMPLE or MODE_CPROFILE.
+        eobj : object
+            shutdown event of the daemon.
+        thread_id : int, optional
+            thread to sample (default is main thread).
+        """
+
+        if self.mode:
+            return None
+
+        if thread_id is None:
+            thread_id = threading.main_thread().ident
+
+        ext = {MODE_SAMPLE: "folded", MODE_CPROFILE: "pstats"}[mode]
+        now = datetime.now().strftime("%Y%m%d-%H%M%S")
+        os.makedirs(config.ncd_profile_dir, exist_ok=True)
+        self.path = os.path.join(config.ncd_profile_dir,
+                                 "ncd-profile-%s.%s" % (now, ext))
+        self.mode = mode
+        if mode == MODE_SAMPLE:
+            self.sampler = StackSampler(eobj, thread_id)
+            self.sampler.start()
+        else:
+            self.want_prof = True
+
+        return self.path
+
+    def stop(self):
+        """
+        End profiling and return file of the profile, or None when not
+        profiling. Stack samples are written right away, and cProfile
+        stats at next poll() of the main loop.
+        """
+
+        if not self.mode:
+            return None
+
+        path = self.path
+        if self.mode == MODE_SAMPLE:
+            self.sampler.stop()
+            self.sampler.join(util.Thread.timeout)
+            self.sampler.write(path)
+            self.sampler = None
+        else:
+            self.dump_path = path
+            self.want_prof = False
+
+        self.mode = None
+        self.path = None
+        return path
+
+    def poll(self):
+        """
+        Switch cProfile on or off in the calling thread, as requested
+        through start() and stop().
+        """
+
+        if self.want_prof and not self.prof:
+            self.prof = cProfile.Profile()
+            self.prof.enable()
+
+        elif not self.want_prof and self.prof:
+            self.prof.disable()
+            self.prof.dump_stats(self.dump_path)
+            self.prof = None
+            self.dump_path = None
+
+
+# profiler of the daemon.
+profiler = Profiler()
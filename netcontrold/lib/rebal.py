@@ -0,0 +1,275 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['RebalPlan',
+           'RebalController',
+           'order_moves',
+           ]
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+
+
+class RebalPlan(object):
+    """
+    Class to represent a rebalance plan applied in the vswitch.
+
+    Attributes
+    ----------
+    ts : float
+        monotonic time when this plan is applied.
+    moves : dict
+        map of (port name, rxq id) and (source pmd id, target pmd id)
+        for every rxq moved by this plan.
+    prev_var : float
+        load score of pmds before the dry-run.
+    cur_var : float
+        estimated load score of pmds after the dry-run.
+    measured_var : float
+        load score of pmds measured after applying this plan, if known.
+    outcome : str
+        result of this plan once applied, if known.
+    """
+
+    def __init__(self, moves, prev_var, cur_var, ts=None):
+        self.ts = ts
+        self.moves = moves
+        self.prev_var = prev_var
+        self.cur_var = cur_var
+        self.measured_var = None
+        self.outcome = None
+
+
+class RebalController(object):
+    """
+    Class to decide whether a dry-run is worth applying in the vswitch,
+    with hysteresis across the rebalances applied so far.
+
+    Attributes
+    ----------
+    history : list
+        rebalance plans applied, latest at the end.
+    rxq_move_ts : dict
+        map of (port name, rxq id) and the time it was last moved.
+    rxq_flap_ts : dict
+        map of (port name, rxq id) and the time it was found flapping.
+
+    Methods
+    -------
+    rxq_on_hold(now)
+        returns rxqs that should not be moved by dry-runs now.
+    decide(moves, prev_var, cur_var, now)
+        returns whether the dry-run should be applied.
+    record(moves, prev_var, cur_var, now)
+        remember the plan applied in the vswitch.
+    revert(plan)
+        forget cooldown of the rxqs moved by a plan rolled back.
+    """
+
+    def __init__(self):
+        self.history = []
+        self.rxq_move_ts = {}
+        self.rxq_flap_ts = {}
+
+    def rxq_on_hold(self, now=None):
+        """
+        Return set of (port name, rxq id) for the rxqs which are either
+        in cooldown after their last move, or held for flapping.
+
+        Parameters
+        ----------
+        now : float, optional
+            monotonic time to compare with (default is current time)
+        """
+
+        if now is None:
+            now = dataif.Context.clock.now()
+
+        rxq_hold = set()
+        for key, ts in self.rxq_move_ts.items():
+            if (now - ts) < config.ncd_rxq_cooldown:
+                rxq_hold.add(key)
+
+        for key, ts in self.rxq_flap_ts.items():
+            if (now - ts) < config.ncd_rxq_flap_hold:
+                rxq_hold.add(key)
+
+        return rxq_hold
+
+    def find_flap(self, moves):
+        """
+        Return set of (port name, rxq id) for the rxqs in this plan,
+        moving back into the pmd they left in recent rebalances.
+
+        Parameters
+        ----------
+        moves : dict
+            map of (port name, rxq id) and (source pmd id, target pmd id)
+        """
+
+        rxq_flap = set()
+        for plan in self.history[-config.ncd_rebal_flap_n:]:
+            for key, (src, dst) in moves.items():
+                if key not in plan.moves:
+                    continue
+
+                (psrc, pdst) = plan.moves[key]
+                if psrc == dst:
+                    rxq_flap.add(key)
+
+        return rxq_flap
+
+    def decide(self, moves, prev_var, cur_var, now=None):
+        """
+        Return True when the plan improves pmd load enough, considering
+        when the last rebalance was applied, and it does not move rxqs
+        back and forth between same pmds.
+
+        Parameters
+        ----------
+        moves : dict
+            map of (port name, rxq id) and (source pmd id, target pmd id)
+        prev_var : float
+            load score of pmds before the dry-run.
+        cur_var : float
+            estimated load score of pmds after the dry-run.
+        now : float, optional
+            monotonic time to compare with (default is current time)
+        """
+
+        nlog = dataif.Context.nlog
+
+        if now is None:
+            now = dataif.Context.clock.now()
+
+        if not moves:
+            nlog.info("no rxq to move in this dry-run ..")
+            return False
+
+        if cur_var >= prev_var:
+            return False
+
+        # a rebalance applied recently needs a higher improvement to
+        # be followed by another.
+        improve_min = config.ncd_pmd_load_improve_min
+        if self.history:
+            last = self.history[-1]
+            if (now - last.ts) < config.ncd_rebal_cooldown:
+                improve_min = config.ncd_pmd_load_improve_max
+
+        diff = (prev_var - cur_var) * 100 / prev_var
+        if diff <= improve_min:
+            nlog.info("improvement %d%% is not above %d%% .."
+                      % (diff, improve_min))
+            return False
+
+        # hold rxqs moving back and forth, and skip this plan as well.
+        rxq_flap = self.find_flap(moves)
+        if rxq_flap:
+            for key in rxq_flap:
+                nlog.info("holding port %s rxq %d for flapping .."
+                          % key)
+                self.rxq_flap_ts[key] = now
+
+            return False
+
+        return True
+
+    def record(self, moves, prev_var, cur_var, now=None):
+        """
+        Remember the plan applied in the vswitch.
+
+        Parameters
+        ----------
+        moves : dict
+            map of (port name, rxq id) and (source pmd id, target pmd id)
+        prev_var : float
+            load score of pmds before the dry-run.
+        cur_var : float
+            estimated load score of pmds after the dry-run.
+        now : float, optional
+            monotonic time of applying the plan (default is current time)
+        """
+
+        if now is None:
+            now = dataif.Context.clock.now()
+
+        plan = RebalPlan(moves, prev_var, cur_var, now)
+        self.history.append(plan)
+        if len(self.history) > config.ncd_rebal_history_max:
+            self.history.pop(0)
+
+        for key in moves:
+            self.rxq_move_ts[key] = now
+
+        # forget rxqs no more in cooldown or flapping.
+        for key, ts in list(self.rxq_move_ts.items()):
+            if (now - ts) >= config.ncd_rxq_cooldown:
+                self.rxq_move_ts.pop(key)
+
+        for key, ts in list(self.rxq_flap_ts.items()):
+            if (now - ts) >= config.ncd_rxq_flap_hold:
+                self.rxq_flap_ts.pop(key)
+
+        return plan
+
+    def revert(self, plan):
+        """
+        Forget cooldown of the rxqs moved by the plan, as it is rolled
+        back and the rxqs are in their source pmds again.
+
+        Parameters
+        ----------
+        plan : object
+            RebalPlan object rolled back.
+        """
+
+        for key in plan.moves:
+            if self.rxq_move_ts.get(key) == plan.ts:
+                self.rxq_move_ts.pop(key)
+
+
+def order_moves(pmd_map, moves, pmd_load):
+    """
+    Return rxq moves in the order of their benefit, highest first.
+    Benefit of a move is the cpu cycles of the rxq moved, scaled by
+    how much its source pmd was busier than the target pmd.
+
+    Parameters
+    ----------
+    pmd_map : dict
+        mapping of pmd id and its Dataif_Pmd object, after dry-run.
+    moves : dict
+        map of (port name, rxq id) and (source pmd id, target pmd id)
+    pmd_load : dict
+        mapping of pmd id and its load before dry-run.
+    """
+
+    benefit = {}
+    for key, (src, dst) in moves.items():
+        (port_name, rxq_id) = key
+
+        # moved rxq is tracked in its target pmd after dry-run.
+        cyc = 0
+        port = pmd_map[dst].find_port_by_name(port_name)
+        if port:
+            rxq = port.find_rxq_by_id(rxq_id)
+            if rxq:
+                cyc = dataif.cyc_total(rxq.cpu_cyc)
+
+        benefit[key] = cyc * max(pmd_load[src] - pmd_load[dst], 1)
+
+    return sorted(moves.keys(), key=lambda o: benefit[o], reverse=True)
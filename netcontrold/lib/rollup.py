@@ -0,0 +1,342 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['RollupTier',
+           'Rollup',
+           'RollupStore',
+           'rxq_load_sample',
+           ]
+
+import threading
+from array import array
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+
+
+class RollupTier(object):
+    """
+    Class to represent downsampled history of a value, as buckets of
+    fixed resolution in a circular array. Every bucket keeps lowest,
+    highest, sum and count of the values added in its time. Array
+    grows as buckets are used, until it holds size buckets.
+
+    Attributes
+    ----------
+    resolution : int
+        seconds covered by every bucket.
+    size : int
+        number of buckets.
+    last : int
+        slot of the latest bucket, or -1 if there is none.
+
+    Methods
+    -------
+    add(ts, value)
+        add value sampled at ts into its bucket.
+    query(start, end)
+        returns buckets between start and end time.
+    """
+
+    def __init__(self, resolution, size):
+        self.resolution = resolution
+        self.size = size
+        self.bucket = array('q')
+        self.vmin = array('d')
+        self.vmax = array('d')
+        self.vsum = array('d')
+        self.count = array('l')
+        self.last = -1
+
+    def add(self, ts, value):
+        """
+        Add value into bucket of its time. New bucket takes next slot,
+        reusing the slot of oldest bucket once the array is full.
+
+        Parameters
+        ----------
+        ts : float
+            wall clock time (in sec) of the value.
+        value : float
+            sampled value.
+        """
+
+        bucket = int(ts // self.resolution)
+        i = self.last
+        if i < 0 or bucket > self.bucket[i]:
+            i = (i + 1) % self.size
+            if i == len(self.bucket):
+                self.bucket.append(bucket)
+                self.vmin.append(value)
+                self.vmax.append(value)
+                self.vsum.append(value)
+                self.count.append(1)
+            else:
+                self.bucket[i] = bucket
+                self.vmin[i] = value
+                self.vmax[i] = value
+                self.vsum[i] = value
+                self.count[i] = 1
+
+            self.last = i
+            return
+
+        if bucket != self.bucket[i]:
+            # older bucket, as wall clock has stepped back.
+            try:
+                i = self.bucket.index(bucket)
+            except ValueError:
+                return
+
+        if value < self.vmin[i]:
+            self.vmin[i] = value
+        if value > self.vmax[i]:
+            self.vmax[i] = value
+        self.vsum[i] += value
+        self.count[i] += 1
+
+    def span(self):
+        """
+        Return seconds of history covered by this tier.
+        """
+        return self.resolution * self.size
+
+    def query(self, start, end):
+        """
+        Return list of buckets between start and end time, oldest
+        first, as tuple of bucket time, lowest, mean, highest value and
+        count of values.
+
+        Parameters
+        ----------
+        start : float
+            wall clock time (in sec) to begin with.
+        end : float
+            wall clock time (in sec) to end with.
+        """
+
+        first = int(start // self.resolution)
+        last = int(end // self.resolution)
+        first = max(first, last - self.size + 1)
+
+        out = []
+        for i in range(len(self.bucket)):
+            bucket = self.bucket[i]
+            if bucket < first or bucket > last:
+                continue
+
+            out.append((bucket * self.resolution, self.vmin[i],
+                        self.vsum[i] / self.count[i], self.vmax[i],
+                        self.count[i]))
+
+        return sorted(out)
+
+
+class Rollup(object):
+    """
+    Class to represent history of a value in every resolution.
+
+    Attributes
+    ----------
+    tiers : list
+        RollupTier objects, finest resolution first.
+    last_ts : float
+        wall clock time (in sec) of the latest value added.
+
+    Methods
+    -------
+    add(ts, value)
+        add value into every tier.
+    query(start, end, resolution=None)
+        returns buckets between start and end time.
+    """
+
+    def __init__(self, tiers=None):
+        if tiers is None:
+            tiers = config.ncd_rollup_tiers
+
+        self.tiers = [RollupTier(res, size)
+                      for (res, size) in sorted(tiers)]
+        self.last_ts = None
+
+    def add(self, ts, value):
+        for tier in self.tiers:
+            tier.add(ts, value)
+
+        self.last_ts = ts
+
+    def tier(self, start, end, resolution=None):
+        """
+        Return tier of given resolution, or else the finest one that
+        covers time between start and end.
+        """
+
+        for tier in self.tiers:
+            if resolution is not None:
+                if tier.resolution == resolution:
+                    return tier
+            elif tier.span() >= (end - start):
+                return tier
+
+        if resolution is not None:
+            return None
+
+        return self.tiers[-1]
+
+    def query(self, start, end, resolution=None):
+        """
+        Return buckets between start and end time, from the tier of
+        given resolution, or else the finest one covering the time.
+
+        Parameters
+        ----------
+        start : float
+            wall clock time (in sec) to begin with.
+        end : float
+            wall clock time (in sec) to end with.
+        resolution : int, optional
+            seconds covered by every bucket.
+        """
+
+        tier = self.tier(start, end, resolution)
+        if not tier:
+            return []
+
+        return tier.query(start, end)
+
+
+def rxq_load_sample(pmd, rxq):
+    """
+    Return load of the rxq on its pmd in the latest sampling interval,
+    or None if there is no interval sampled yet.
+
+    Parameters
+    ----------
+    pmd : object
+        Dataif_Pmd object.
+    rxq : object
+        Dataif_Rxq object.
+    """
+
+    if pmd.cyc_n < 2:
+        return None
+
+    cur_idx = pmd.cyc_idx
+    prev_idx = (cur_idx - 1) % len(pmd.rx_cyc)
+    proc = pmd.proc_cpu_cyc[cur_idx] - pmd.proc_cpu_cyc[prev_idx]
+    idle = pmd.idle_cpu_cyc[cur_idx] - pmd.idle_cpu_cyc[prev_idx]
+    if (proc + idle) <= 0:
+        return 0
+
+    return (rxq.cpu_cyc[cur_idx] * 100) / (proc + idle)
+
+
+class RollupStore(object):
+    """
+    Class to represent history of every pmd, rxq and port. Unlike the
+    sampling slots, history is not reset with the collected data, but
+    history of an object no longer sampled is removed.
+
+    Attributes
+    ----------
+    rollup_map : dict
+        map of object key and its Rollup object. Key is ("pmd", id)
+        for pmd load, ("rxq", port name, id) for rxq load and
+        ("port", name) for rx drop (in ppm) of a port.
+    lock : Lock
+        lock to serialize feed with queries from control sessions.
+
+    Methods
+    -------
+    feed(ts, pmd_map, port_to_cls)
+        add latest sample of every object.
+    query(start, end, resolution=None)
+        returns buckets of every object between start and end time.
+    """
+
+    def __init__(self, tiers=None):
+        self.tiers = tiers
+        self.rollup_map = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, ts, value):
+        if value is None:
+            return
+
+        rollup = self.rollup_map.get(key)
+        if not rollup:
+            rollup = Rollup(self.tiers)
+            self.rollup_map[key] = rollup
+
+        rollup.add(ts, value)
+
+    def feed(self, ts, pmd_map, port_to_cls):
+        """
+        Add latest sample of every pmd, rxq and port, and remove history
+        of the ones not sampled any more.
+
+        Parameters
+        ----------
+        ts : float
+            wall clock time (in sec) of the sample.
+        pmd_map : dict
+            mapping of pmd id and its Dataif_Pmd object.
+        port_to_cls : dict
+            mapping of port name and its Dataif_Port class.
+        """
+
+        with self.lock:
+            for pmd in pmd_map.values():
+                self.add(("pmd", pmd.id), ts, dataif.pmd_load_sample(pmd))
+                for port in pmd.port_map.values():
+                    for rxq in port.rxq_map.values():
+                        self.add(("rxq", port.name, rxq.id), ts,
+                                 rxq_load_sample(pmd, rxq))
+
+            for name, port in port_to_cls.items():
+                self.add(("port", name), ts, dataif.port_drop_sample(port))
+
+            # samples may miss objects for a while, such as rxqs in the
+            # first sample after reset, so remove only the objects not
+            # sampled for as long as the finest tier spans.
+            for key, rollup in list(self.rollup_map.items()):
+                if (ts - rollup.last_ts) > rollup.tiers[0].span():
+                    del self.rollup_map[key]
+
+    def query(self, start, end, resolution=None):
+        """
+        Return map of object key and its buckets between start and end
+        time.
+
+        Parameters
+        ----------
+        start : float
+            wall clock time (in sec) to begin with.
+        end : float
+            wall clock time (in sec) to end with.
+        resolution : int, optional
+            seconds covered by every bucket.
+        """
+
+        # buckets are read alone, as feed may be adding into them.
+        out = {}
+        with self.lock:
+            for key, rollup in self.rollup_map.items():
+                buckets = rollup.query(start, end, resolution)
+                if buckets:
+                    out[key] = buckets
+
+        return out
@@ -0,0 +1,100 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['SampleScheduler',
+           ]
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+
+
+class SampleScheduler(object):
+    """
+    Class to adapt sampling interval to the state of pmds. Sampling is
+    quick while pmd load is changing or near its threshold, and backs
+    off while pmds are steady and below threshold.
+
+    Attributes
+    ----------
+    interval_min : float
+        shortest interval (in sec) between samples.
+    interval_max : float
+        longest interval (in sec) between samples.
+    interval : float
+        current interval (in sec) between samples.
+    pmd_load : dict
+        map of pmd id and its load in previous sample.
+
+    Methods
+    -------
+    next_interval(pmd_map)
+        check latest sample and return interval until next one.
+    hasten()
+        sample at shortest interval from now on.
+    """
+
+    def __init__(self, interval_min, interval_max, interval=None):
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        if interval is None:
+            interval = interval_max
+
+        self.interval = min(max(interval, interval_min), interval_max)
+        self.pmd_load = {}
+
+    def hasten(self):
+        """
+        Sample at shortest interval from now on, until pmds are
+        steady again.
+        """
+
+        self.interval = self.interval_min
+
+    def next_interval(self, pmd_map):
+        """
+        Check latest sample of the pmds and return interval (in sec)
+        until next sample.
+
+        Parameters
+        ----------
+        pmd_map : dict
+            mapping of pmd id and its Dataif_Pmd object.
+        """
+
+        delta = config.ncd_sample_load_delta
+        busy = False
+        steady = True
+        for pmd in pmd_map.values():
+            load = dataif.pmd_load_sample(pmd)
+            if load is None:
+                steady = False
+                continue
+
+            if load >= (config.ncd_pmd_core_threshold - delta):
+                busy = True
+
+            prev_load = self.pmd_load.get(pmd.id)
+            if prev_load is not None and abs(load - prev_load) >= delta:
+                busy = True
+
+            self.pmd_load[pmd.id] = load
+
+        if busy:
+            self.interval = self.interval_min
+        elif steady:
+            self.interval = min(self.interval * 2, self.interval_max)
+
+        return self.interval
@@ -0,0 +1,292 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['vswitchd_pid',
+           'topology',
+           'model_topology',
+           'save',
+           'load',
+           'check',
+           'restore',
+           ]
+
+import json
+import os
+import re
+import zlib
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import util
+from netcontrold.lib.error import OsCommandExc
+
+_MAGIC = b"NCDSNAP1"
+
+# sample rings of every port class.
+_PORT_RINGS = ("rx_cyc", "rx_drop_cyc", "tx_cyc", "tx_drop_cyc",
+               "tx_retry_cyc")
+
+
+def vswitchd_pid():
+    """
+    Return pid of the running vswitchd, or None if it could not be
+    found.
+    """
+
+    pid_file = os.path.join(config.ovs_rundir, "ovs-vswitchd.pid")
+    try:
+        with open(pid_file) as f:
+            return int(f.read().strip())
+    except (IOError, ValueError):
+        return None
+
+
+def topology():
+    """
+    Return sorted list of pmd id, numa id, port name and rxq id of every
+    rxq in the vswitch.
+
+    Raises
+    ------
+    OsCommandExc
+        if the given OS command did not succeed for some reason.
+    """
+
+    cmd = "ovs-appctl dpif-netdev/pmd-rxq-show"
+    data = util.exec_host_command(cmd)
+    if not data:
+        raise OsCommandExc("unable to collect data")
+
+    topo = []
+    pmd = None
+    for line in data.splitlines():
+        linesre = re.search(r'pmd thread numa_id (\d+) core_id (\d+):', line)
+        if linesre:
+            pmd = (int(linesre.groups()[1]), int(linesre.groups()[0]))
+            continue
+
+        linesre = re.search(r'port:\s([A-Za-z0-9_-]+)\s*queue-id:\s*(\d+)',
+                            line)
+        if linesre and pmd:
+            topo.append([pmd[0], pmd[1], linesre.groups()[0],
+                         int(linesre.groups()[1])])
+
+    return sorted(topo)
+
+
+def model_topology(state):
+    """
+    Return sorted list of pmd id, numa id, port name and rxq id of every
+    rxq modelled in the state, as in topology().
+
+    Parameters
+    ----------
+    state : dict
+        state in snapshot file.
+    """
+
+    topo = []
+    for ps in state["pmds"]:
+        for port_state in ps["ports"]:
+            for rxq_state in port_state["rxqs"]:
+                topo.append([ps["id"], ps["numa_id"], port_state["name"],
+                             rxq_state[0]])
+
+    return sorted(topo)
+
+
+def _shift(ts_list, offset):
+    return [(ts + offset) if ts else ts for ts in ts_list]
+
+
+def save(path, ctx):
+    """
+    Write latest pmds, ports and their samples in the context into
+    snapshot file.
+
+    Parameters
+    ----------
+    path : str
+        snapshot file.
+    ctx : object
+        Context class of the daemon.
+    """
+
+    pmds = []
+    for pmd in ctx.pmd_map.values():
+        ports = []
+        for port in pmd.port_map.values():
+            rxqs = [[rxq.id, rxq.enabled, list(rxq.cpu_cyc),
+                     list(rxq.rx_cyc)] for rxq in port.rxq_map.values()]
+            ports.append({"name": port.name, "id": port.id,
+                          "numa_id": port.numa_id, "rxqs": rxqs})
+
+        pmds.append({"id": pmd.id, "numa_id": pmd.numa_id,
+                     "isolated": pmd.isolated, "pmd_load": pmd.pmd_load,
+                     "cyc_idx": pmd.cyc_idx, "cyc_n": pmd.cyc_n,
+                     "cyc_ts": pmd.cyc_ts, "rx_cyc": list(pmd.rx_cyc),
+                     "idle_cpu_cyc": list(pmd.idle_cpu_cyc),
+                     "proc_cpu_cyc": list(pmd.proc_cpu_cyc),
+                     "ports": ports})
+
+    port_cls = []
+    for cls in ctx.port_to_cls.values():
+        state = {"name": cls.name, "id": cls.id, "type": cls.type,
+                 "rebalance": cls.rebalance, "cyc_idx": cls.cyc_idx,
+                 "cyc_n": cls.cyc_n, "cyc_ts": cls.cyc_ts}
+        for ring in _PORT_RINGS:
+            state[ring] = list(getattr(cls, ring))
+
+        port_cls.append(state)
+
+    coverage = ctx.coverage_map.get("coverage")
+    if coverage:
+        coverage = {"upcall": coverage.upcall, "ts": coverage.ts,
+                    "index": coverage.index}
+
+    state = {"now": ctx.clock.now(), "wall": ctx.clock.wall(),
+             "pid": vswitchd_pid(),
+             "samples_max": config.ncd_samples_max,
+             "pmds": pmds, "ports": port_cls,
+             "port_to_id": ctx.port_to_id, "coverage": coverage}
+
+    tmp_path = path + ".tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(zlib.compress(json.dumps(state).encode()))
+
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    """
+    Return state in snapshot file, or None if there is no valid one.
+
+    Parameters
+    ----------
+    path : str
+        snapshot file.
+    """
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return None
+
+    if not data.startswith(_MAGIC):
+        return None
+
+    try:
+        return json.loads(zlib.decompress(data[len(_MAGIC):]).decode())
+    except (zlib.error, ValueError):
+        return None
+
+
+def check(state, ctx, topo):
+    """
+    Return reason why the state can not be restored, or None if the
+    vswitch is same as when the state was saved.
+
+    Parameters
+    ----------
+    state : dict
+        state in snapshot file.
+    ctx : object
+        Context class of the daemon.
+    topo : list
+        current topology of the vswitch, as returned by topology().
+    """
+
+    age = ctx.clock.wall() - state["wall"]
+    if not (0 <= age <= config.ncd_snapshot_age_max):
+        return "snapshot is %d sec old" % age
+
+    if state["samples_max"] != config.ncd_samples_max:
+        return "sample window changed"
+
+    if not state["pmds"] or any([ps["cyc_n"] < state["samples_max"]
+                                 for ps in state["pmds"]]):
+        return "sample window not filled"
+
+    if state["pid"] != vswitchd_pid():
+        return "vswitchd restarted"
+
+    if model_topology(state) != topo:
+        return "pmd or rxq topology changed"
+
+    return None
+
+
+def restore(state, ctx):
+    """
+    Rebuild pmds, ports and their samples in the context from state.
+    Times of samples are moved as far back from now as they were from
+    the time state was saved.
+
+    Parameters
+    ----------
+    state : dict
+        state in snapshot file.
+    ctx : object
+        Context class of the daemon.
+    """
+
+    offset = (ctx.clock.now() - (ctx.clock.wall() - state["wall"]) -
+              state["now"])
+
+    ctx.port_to_id.update(state["port_to_id"])
+    for ps in state["ports"]:
+        cls = dataif.make_dataif_port(ps["name"])
+        cls.id = ps["id"]
+        cls.type = ps["type"]
+        cls.rebalance = ps["rebalance"]
+        cls.cyc_idx = ps["cyc_idx"]
+        cls.cyc_n = ps["cyc_n"]
+        cls.cyc_ts = _shift(ps["cyc_ts"], offset)
+        for ring in _PORT_RINGS:
+            setattr(cls, ring, ps[ring])
+
+    for ps in state["pmds"]:
+        pmd = dataif.Dataif_Pmd(ps["id"])
+        pmd.numa_id = ps["numa_id"]
+        pmd.isolated = ps["isolated"]
+        pmd.pmd_load = ps["pmd_load"]
+        pmd.cyc_idx = ps["cyc_idx"]
+        pmd.cyc_n = ps["cyc_n"]
+        pmd.cyc_ts = _shift(ps["cyc_ts"], offset)
+        pmd.rx_cyc = dataif.CycRing(ps["rx_cyc"])
+        pmd.idle_cpu_cyc = dataif.CycRing(ps["idle_cpu_cyc"])
+        pmd.proc_cpu_cyc = dataif.CycRing(ps["proc_cpu_cyc"])
+        ctx.pmd_map[pmd.id] = pmd
+
+        for port_state in ps["ports"]:
+            port = pmd.add_port(port_state["name"], port_state["id"],
+                                port_state["numa_id"])
+            for (qid, enabled, cpu_cyc, rx_cyc) in port_state["rxqs"]:
+                rxq = port.add_rxq(qid)
+                rxq.pmd = pmd
+                rxq.enabled = enabled
+                rxq.cpu_cyc = dataif.CycRing(cpu_cyc)
+                rxq.rx_cyc = dataif.CycRing(rx_cyc)
+
+    if state["coverage"]:
+        coverage = dataif.Dataif_Coverage()
+        coverage.upcall = state["coverage"]["upcall"]
+        coverage.ts = _shift(state["coverage"]["ts"], offset)
+        coverage.index = state["coverage"]["index"]
+        ctx.coverage_map["coverage"] = coverage
@@ -0,0 +1,304 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['KIND_PMD',
+           'KIND_RXQ',
+           'KIND_PORT',
+           'Record',
+           'TsStore',
+           'TsReader',
+           ]
+
+import collections
+import mmap
+import os
+import re
+import struct
+
+from netcontrold.lib import config
+
+# Segment header: magic, record size, record count.
+_MAGIC = b"NCDTS002"
+_HDR = struct.Struct("<8sI4xQ8x")
+
+# Record: wall clock time, kind, flags, id, name and counters. Counters
+# are (rx, idle, proc) cycles for pmd, (rx, cpu) cycles in the interval
+# for rxq and (rx, rx drop, tx, tx drop, tx retry) for port.
+_REC = struct.Struct("<dBB2xi64s5q")
+_N_COUNTERS = 5
+_NAME_MAX = 64
+
+# name is longer than the record holds, and is cut.
+_FLAG_TRUNCATED = 0x1
+
+KIND_PMD = 1
+KIND_RXQ = 2
+KIND_PORT = 3
+
+_SEG_FMT = "ncd-%08d.seg"
+_SEG_RE = re.compile(r'^ncd-(\d{8})\.seg$')
+
+Record = collections.namedtuple('Record',
+                                'ts kind id name counters truncated')
+
+
+def _encode_name(name):
+    """
+    Return name encoded to fit in a record, cut at a character boundary
+    when it is too long, and whether it is cut.
+    """
+
+    encoded = name.encode()
+    if len(encoded) <= _NAME_MAX:
+        return (encoded, False)
+
+    cut = encoded[:_NAME_MAX].decode(errors='ignore').encode()
+    return (cut, True)
+
+
+def _segments(path):
+    """
+    Return list of segment files in path, oldest first.
+    """
+
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return []
+
+    return [os.path.join(path, name)
+            for name in sorted(names) if _SEG_RE.match(name)]
+
+
+class TsStore(object):
+    """
+    Class to represent append-only store of every sample, as fixed
+    width records in memory-mapped segment files. Oldest segments are
+    removed when the store grows beyond its size.
+
+    Attributes
+    ----------
+    path : str
+        directory of the segment files.
+    segment_size : int
+        bytes in every segment file.
+    size_max : int
+        bytes retained in all segment files.
+
+    Methods
+    -------
+    append(ts, kind, _id, name, counters)
+        add a record.
+    feed(ts, pmd_map, port_to_cls)
+        add records of latest sample of every pmd, rxq and port.
+    close()
+        close current segment.
+    """
+
+    def __init__(self, path=None, segment_size=None, size_max=None):
+        if path is None:
+            path = config.ncd_tsstore_dir
+        if segment_size is None:
+            segment_size = config.ncd_tsstore_segment_size
+        if size_max is None:
+            size_max = config.ncd_tsstore_size_max
+
+        self.path = path
+        self.segment_size = max(segment_size, _HDR.size + _REC.size)
+        self.size_max = size_max
+        self.capacity = (self.segment_size - _HDR.size) // _REC.size
+        self.seq = 0
+        self.count = 0
+        self.mm = None
+
+        os.makedirs(path, exist_ok=True)
+        segments = _segments(path)
+        if segments:
+            last = os.path.basename(segments[-1])
+            self.seq = int(_SEG_RE.match(last).groups()[0])
+
+    def _new_segment(self):
+        self.close()
+
+        self.seq += 1
+        seg_file = os.path.join(self.path, _SEG_FMT % self.seq)
+        with open(seg_file, 'w+b') as f:
+            # allocate blocks of the segment now, as writing into a hole
+            # of sparse file through mmap raises SIGBUS on a full disk.
+            try:
+                os.posix_fallocate(f.fileno(), 0, self.segment_size)
+            except OSError:
+                f.close()
+                os.unlink(seg_file)
+                raise
+
+            self.mm = mmap.mmap(f.fileno(), self.segment_size)
+
+        self.count = 0
+        _HDR.pack_into(self.mm, 0, _MAGIC, _REC.size, 0)
+
+        # retain only as many segments as the store could hold.
+        segments = _segments(self.path)
+        n_max = max(1, self.size_max // self.segment_size)
+        for seg_file in segments[:-n_max]:
+            try:
+                os.unlink(seg_file)
+            except OSError:
+                pass
+
+    def append(self, ts, kind, _id, name, counters):
+        """
+        Add a record into current segment, moving into next segment
+        when it is full. Record count in the header is updated only
+        after the record is written, so that readers see only the
+        complete records.
+
+        Parameters
+        ----------
+        ts : float
+            wall clock time (in sec) of the sample.
+        kind : int
+            one of KIND_PMD, KIND_RXQ and KIND_PORT.
+        _id : int
+            id of pmd or rxq, or -1 for port.
+        name : str
+            port name for rxq and port, or empty. Name longer than
+            the record holds is cut, and flagged in the record.
+        counters : tuple
+            counters of the sample.
+        """
+
+        if not self.mm or self.count >= self.capacity:
+            self._new_segment()
+
+        counters = tuple(counters) + (0, ) * (_N_COUNTERS - len(counters))
+        (encoded, truncated) = _encode_name(name)
+        flags = _FLAG_TRUNCATED if truncated else 0
+        _REC.pack_into(self.mm, _HDR.size + (self.count * _REC.size),
+                       ts, kind, flags, _id, encoded, *counters)
+        self.count += 1
+        _HDR.pack_into(self.mm, 0, _MAGIC, _REC.size, self.count)
+
+    def feed(self, ts, pmd_map, port_to_cls):
+        """
+        Add records of latest sample of every pmd, rxq and port.
+
+        Parameters
+        ----------
+        ts : float
+            wall clock time (in sec) of the sample.
+        pmd_map : dict
+            mapping of pmd id and its Dataif_Pmd object.
+        port_to_cls : dict
+            mapping of port name and its Dataif_Port class.
+        """
+
+        for pmd in pmd_map.values():
+            i = pmd.cyc_idx
+            self.append(ts, KIND_PMD, pmd.id, "",
+                        (pmd.rx_cyc[i], pmd.idle_cpu_cyc[i],
+                         pmd.proc_cpu_cyc[i]))
+            for port in pmd.port_map.values():
+                for rxq in port.rxq_map.values():
+                    self.append(ts, KIND_RXQ, rxq.id, port.name,
+                                (rxq.rx_cyc[i], rxq.cpu_cyc[i]))
+
+        for name, port in port_to_cls.items():
+            i = port.cyc_idx
+            self.append(ts, KIND_PORT, -1, name,
+                        (port.rx_cyc[i], port.rx_drop_cyc[i],
+                         port.tx_cyc[i], port.tx_drop_cyc[i],
+                         port.tx_retry_cyc[i]))
+
+    def close(self):
+        if self.mm:
+            self.mm.flush()
+            self.mm.close()
+            self.mm = None
+
+
+class TsReader(object):
+    """
+    Class to read records from the store, by mapping its segment files
+    read-only. Reader does not need the daemon, and sees records as
+    soon as they are appended.
+
+    Attributes
+    ----------
+    path : str
+        directory of the segment files.
+
+    Methods
+    -------
+    records(start=None, kind=None)
+        returns generator of records, oldest first.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = config.ncd_tsstore_dir
+
+        self.path = path
+
+    def segments(self):
+        return _segments(self.path)
+
+    def records(self, start=None, kind=None):
+        """
+        Return generator of records, oldest first.
+
+        Parameters
+        ----------
+        start : float, optional
+            wall clock time (in sec) of oldest record to return.
+        kind : int, optional
+            kind of records to return.
+        """
+
+        for seg_file in self.segments():
+            try:
+                with open(seg_file, 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # segment removed by retention, or not yet sized.
+                continue
+
+            try:
+                (magic, rec_size, count) = _HDR.unpack_from(mm, 0)
+                if magic != _MAGIC or rec_size != _REC.size:
+                    continue
+
+                # skip the segment when its last record is too old.
+                if start is not None and count:
+                    last_ts = _REC.unpack_from(
+                        mm, _HDR.size + ((count - 1) * rec_size))[0]
+                    if last_ts < start:
+                        continue
+
+                for i in range(count):
+                    rec = _REC.unpack_from(mm, _HDR.size + (i * rec_size))
+                    if start is not None and rec[0] < start:
+                        continue
+                    if kind is not None and rec[1] != kind:
+                        continue
+
+                    yield Record(rec[0], rec[1], rec[3],
+                                 rec[4].rstrip(b'\0').decode(
+                                     errors='replace'),
+                                 rec[5:],
+                                 bool(rec[2] & _FLAG_TRUNCATED))
+            finally:
+                mm.close()
@@ -15,9 +15,12 @@
 #
 
 __all__ = ['exec_host_command',
+           'run_host_command',
+           'set_command_backend',
            'exists',
            'variance',
            'rr_cpu_in_numa',
+           'Clock',
            ]
 
 # Import standard modules
@@ -29,9 +32,13 @@ import signal
 import subprocess
 import distutils.spawn
 import threading
+import time
+from datetime import datetime
 
 from netcontrold.lib import error
 from netcontrold.lib import config
+from netcontrold.lib import perf
+from netcontrold.lib import tsstore
 
 
 class Memoize:
@@ -54,8 +61,16 @@ class Memoize:
 
 def cpuinfo():
     proc_list = []
-    with open('/proc/cpuinfo') as f:
-        lines = f.readlines()
+    data = None
+    if _command_backend:
+        # cpus of the host recorded, replayed or simulated.
+        data = _command_backend("cat /proc/cpuinfo")
+
+    if data and data != 1:
+        lines = data.splitlines()
+    else:
+        with open('/proc/cpuinfo') as f:
+            lines = f.readlines()
 
     for line in lines:
         line = line.strip()
@@ -78,7 +93,6 @@ def cpuinfo():
         else:
             raise ValueError("proc_list cannot be empty")
 
-    f.close()
     return proc_list
 
 
@@ -116,7 +130,38 @@ def rr_cpu_in_numa():
     return sum(numa_cpus, [])
 
 
+# Backend to run host commands instead of the host itself, such as
+# replaying outputs captured earlier.
+_command_backend = None
+
+
+def set_command_backend(backend):
+    """
+    Set backend to run host commands, or None to run them in host.
+
+    Parameters
+    ----------
+    backend : function
+        function taking the command and returning its output, or 1
+        when the command failed.
+    """
+    global _command_backend
+    _command_backend = backend
+
+
 def exec_host_command(cmd):
+    # phase is named by the program and its first argument, such as
+    # "ovs-appctl dpif-netdev/pmd-stats-show" or "ovs-vsctl set".
+    args = cmd.split()
+    subcmd = [arg for arg in args[1:] if not arg.startswith("-")]
+    with perf.timer(" ".join(["exec"] + args[:1] + subcmd[:1])):
+        if _command_backend:
+            return _command_backend(cmd)
+
+        return run_host_command(cmd)
+
+
+def run_host_command(cmd):
     try:
         ret = subprocess.check_output(cmd.split()).decode()
     except subprocess.CalledProcessError as e:
@@ -134,6 +179,102 @@ def variance(_list):
     return sum((item - mean) ** 2 for item in _list) / len(_list)
 
 
+class Clock:
+    """
+    Class to represent monotonic clock for sampling, unaffected by
+    changes in wall clock.
+    """
+
+    def now(self):
+        """
+        Return current time in seconds.
+        """
+        return time.monotonic()
+
+    def wall(self):
+        """
+        Return current wall clock time in seconds since epoch.
+        """
+        return time.time()
+
+    def sleep(self, sec):
+        """
+        Sleep for given seconds.
+        """
+        time.sleep(sec)
+
+    def sleep_until(self, deadline):
+        """
+        Sleep until the deadline, if it is not past already.
+        """
+        sec = deadline - self.now()
+        if sec > 0:
+            self.sleep(sec)
+
+
+class CtlSession(object):
+    """
+    Class to represent connection to control socket of netcontrold,
+    carrying any number of commands.
+
+    Attributes
+    ----------
+    sock : object
+        socket connected to netcontrold.
+
+    Methods
+    -------
+    request(cmd)
+        send command and return data in its reply, if any.
+    close()
+        close connection.
+    """
+
+    def __init__(self, sock_file=None):
+        if sock_file is None:
+            sock_file = config.ncd_socket
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(sock_file)
+        except socket.error:
+            self.sock.close()
+            raise
+
+    def _recv(self, n):
+        data = b""
+        while (len(data) < n):
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise socket.error("connection closed")
+            data += chunk
+
+        return data
+
+    def request(self, cmd):
+        """
+        Send control command and wait for its ack. Data in the reply,
+        if any, is returned, or None otherwise.
+
+        Parameters
+        ----------
+        cmd : bytes
+            control command.
+        """
+
+        self.sock.sendall(cmd + b"\n")
+        ack = self._recv(len("CTLD_ACK"))
+        if ack == b"CTLD_ACK":
+            return None
+
+        ack += self._recv(len("CTLD_DATA_ACK XXXXXX") - len(ack))
+        status_len = int(re.findall(r'\d+', ack.decode())[0])
+        return self._recv(status_len).decode()
+
+    def close(self):
+        self.sock.close()
+
+
 class Thread(threading.Thread):
     """
     Class to represent thread instance.
@@ -227,9 +368,14 @@ class Service:
         # Start the daemon
         return(self.create())
 
-    def stop(self):
+    def stop(self, sig=signal.SIGTERM):
         """
         Stop the service.
+
+        Parameters
+        ----------
+        sig : int, optional
+            signal to stop the service with (default is SIGTERM)
         """
         try:
             fh = open(self.pidfile, 'r')
@@ -239,7 +385,7 @@ class Service:
 
         pid = int(fh.read().strip())
         try:
-            os.kill(pid, signal.SIGTERM)
+            os.kill(pid, sig)
         except OSError as e:
             if not str(e).find("No such process"):
                 sys.stderr.write("unable to kill %d\n" % pid)
@@ -252,14 +398,23 @@ class Service:
 
     def restart(self):
         """
-        Restart the service.
+        Restart the service. It is stopped through SIGHUP, so that it
+        may retain its state for the restart.
         """
-        self.stop()
+        self.stop(signal.SIGHUP)
         self.start()
 
-    def config(self):
+    def _ctl_request(self, cmd, reply_data=False):
         """
-        Query current config of netcontrold.
+        Send control command to netcontrold and wait for its ack.
+        Data in the reply, if any, is returned.
+
+        Parameters
+        ----------
+        cmd : bytes
+            control command.
+        reply_data : bool, optional
+            whether the reply carries data (default is False)
         """
         sock_file = config.ncd_socket
 
@@ -267,63 +422,40 @@ class Service:
             sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
             sys.exit(1)
 
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         try:
-            sock.connect(sock_file)
+            session = CtlSession(sock_file)
         except socket.error as e:
             sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
             sys.exit(1)
 
         try:
-            sock.sendall(b"CTLD_CONFIG")
-            ack_len = 0
-            while (ack_len < len("CTLD_DATA_ACK XXXXXX")):
-                data = sock.recv(len("CTLD_DATA_ACK XXXXXX"))
-                ack_len += len(data)
-
-            status_len = int(re.findall('\d+', data.decode())[0])
-            data_len = 0
-            while (data_len < status_len):
-                data = sock.recv(status_len).decode()
-                data_len += len(data)
+            data = session.request(cmd)
+        except socket.error as e:
+            sys.stderr.write("no reply from %s: %s\n" % (sock_file, e))
+            sys.exit(1)
+        finally:
+            session.close()
 
-            sys.stdout.write(data)
+        if reply_data:
+            return data or ""
 
-        finally:
-            sock.close()
+        return None
 
+    def config(self):
+        """
+        Query current config of netcontrold.
+        """
+        sys.stdout.write(self._ctl_request(b"CTLD_CONFIG", True))
         return 0
 
     def rebalance(self, rebal_flag):
         """
         Enable or disable rebalance mode.
         """
-        sock_file = config.ncd_socket
-
-        if not os.path.exists(sock_file):
-            sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
-            sys.exit(1)
-
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(sock_file)
-        except socket.error as e:
-            sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
-            sys.exit(1)
-
-        try:
-            if rebal_flag:
-                sock.sendall(b"CTLD_REBAL_ON")
-            else:
-                sock.sendall(b"CTLD_REBAL_OFF")
-
-            ack_len = 0
-            while (ack_len < len("CTLD_ACK")):
-                data = sock.recv(64)
-                ack_len += len(data)
-
-        finally:
-            sock.close()
+        if rebal_flag:
+            self._ctl_request(b"CTLD_REBAL_ON")
+        else:
+            self._ctl_request(b"CTLD_REBAL_OFF")
 
         return 0
 
@@ -331,32 +463,10 @@ class Service:
         """
         Enable or disable quick rebalance.
         """
-        sock_file = config.ncd_socket
-
-        if not os.path.exists(sock_file):
-            sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
-            sys.exit(1)
-
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(sock_file)
-        except socket.error as e:
-            sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
-            sys.exit(1)
-
-        try:
-            if quick_flag:
-                sock.sendall(b"CTLD_REBAL_QUICK_ON")
-            else:
-                sock.sendall(b"CTLD_REBAL_QUICK_OFF")
-
-            ack_len = 0
-            while (ack_len < len("CTLD_ACK")):
-                data = sock.recv(64)
-                ack_len += len(data)
-
-        finally:
-            sock.close()
+        if quick_flag:
+            self._ctl_request(b"CTLD_REBAL_QUICK_ON")
+        else:
+            self._ctl_request(b"CTLD_REBAL_QUICK_OFF")
 
         return 0
 
@@ -364,32 +474,10 @@ class Service:
         """
         Enable or disable trace mode.
         """
-        sock_file = config.ncd_socket
-
-        if not os.path.exists(sock_file):
-            sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
-            sys.exit(1)
-
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(sock_file)
-        except socket.error as e:
-            sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
-            sys.exit(1)
-
-        try:
-            if trace_flag:
-                sock.sendall(b"CTLD_TRACE_ON")
-            else:
-                sock.sendall(b"CTLD_TRACE_OFF")
-
-            ack_len = 0
-            while (ack_len < len("CTLD_ACK")):
-                data = sock.recv(64)
-                ack_len += len(data)
-
-        finally:
-            sock.close()
+        if trace_flag:
+            self._ctl_request(b"CTLD_TRACE_ON")
+        else:
+            self._ctl_request(b"CTLD_TRACE_OFF")
 
         return 0
 
@@ -397,32 +485,10 @@ class Service:
         """
         Enable or disable verbose logging.
         """
-        sock_file = config.ncd_socket
-
-        if not os.path.exists(sock_file):
-            sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
-            sys.exit(1)
-
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(sock_file)
-        except socket.error as e:
-            sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
-            sys.exit(1)
-
-        try:
-            if vrb_flag:
-                sock.sendall(b"CTLD_VERBOSE_ON")
-            else:
-                sock.sendall(b"CTLD_VERBOSE_OFF")
-
-            ack_len = 0
-            while (ack_len < len("CTLD_ACK")):
-                data = sock.recv(64)
-                ack_len += len(data)
-
-        finally:
-            sock.close()
+        if vrb_flag:
+            self._ctl_request(b"CTLD_VERBOSE_ON")
+        else:
+            self._ctl_request(b"CTLD_VERBOSE_OFF")
 
         return 0
 
@@ -430,102 +496,157 @@ class Service:
         """
         Query current status of netcontrold.
         """
-        sock_file = config.ncd_socket
+        sys.stdout.write(self._ctl_request(b"CTLD_STATUS", True))
+        return 0
 
-        if not os.path.exists(sock_file):
-            sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
-            sys.exit(1)
+    def status_from(self, cursor):
+        """
+        Query events of netcontrold from sequence number cursor, along
+        with the cursor to query next events from.
+        """
+        sys.stdout.write(self._ctl_request(b"CTLD_EVENTS %d" % cursor, True))
+        return 0
 
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(sock_file)
-        except socket.error as e:
-            sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
-            sys.exit(1)
+    def status_clear(self):
+        """
+        Clear current status of netcontrold.
+        """
+        self._ctl_request(b"CTLD_STATUS_CLEAR")
+        return 0
 
-        try:
-            sock.sendall(b"CTLD_STATUS")
-            ack_len = 0
-            while (ack_len < len("CTLD_DATA_ACK XXXXXX")):
-                data = sock.recv(len("CTLD_DATA_ACK XXXXXX"))
-                ack_len += len(data)
+    def version(self):
+        """
+        Get version of netcontrold.
+        """
+        sys.stdout.write(self._ctl_request(b"CTLD_VERSION", True))
+        return 0
 
-            status_len = int(re.findall('\d+', data.decode())[0])
-            data_len = 0
-            while (data_len < status_len):
-                data = sock.recv(status_len).decode()
-                data_len += len(data)
+    def hifreq(self, hf_flag):
+        """
+        Enable or disable high-frequency sampling mode.
+        """
+        if hf_flag:
+            self._ctl_request(b"CTLD_HIFREQ_ON")
+        else:
+            self._ctl_request(b"CTLD_HIFREQ_OFF")
 
-            sys.stdout.write(data)
+        return 0
 
-        finally:
-            sock.close()
+    def samples(self, n):
+        """
+        Resize sample window to n samples.
+        """
+        if not (2 <= n <= config.ncd_samples_limit):
+            sys.stderr.write("sample window must be within 2 and %d.\n"
+                             % config.ncd_samples_limit)
+            return 1
 
+        self._ctl_request(b"CTLD_SAMPLES %d" % n)
         return 0
 
-    def status_clear(self):
+    def history(self, period, resolution=None):
         """
-        Clear current status of netcontrold.
+        Show history of pmd load, rxq load and port drops in the last
+        period (in sec), optionally at given resolution (in sec).
         """
-        sock_file = config.ncd_socket
+        cmd = b"CTLD_ROLLUP %d" % period
+        if resolution:
+            cmd += b" %d" % resolution
 
-        if not os.path.exists(sock_file):
-            sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
-            sys.exit(1)
+        sys.stdout.write(self._ctl_request(cmd, True))
+        return 0
 
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(sock_file)
-        except socket.error as e:
-            sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
-            sys.exit(1)
+    def records(self, period):
+        """
+        Show samples stored in the last period (in sec). Store is read
+        directly, so the service need not be running.
+        """
+        kinds = {tsstore.KIND_PMD: "pmd",
+                 tsstore.KIND_RXQ: "rxq",
+                 tsstore.KIND_PORT: "port"}
 
-        try:
-            sock.sendall(b"CTLD_STATUS_CLEAR")
+        if not config.ncd_tsstore_dir:
+            sys.stderr.write("sample store is not enabled "
+                             "(ncd_tsstore_dir).\n")
+            return 1
 
-            ack_len = 0
-            while (ack_len < len("CTLD_ACK")):
-                data = sock.recv(64)
-                ack_len += len(data)
+        sys.stdout.write("%-19s | %-5s | %-20s | %s\n" % (
+            'Time stamp', 'Kind', 'Object', 'Counters'))
+        sys.stdout.write(('-' * 20) + '+' + ('-' * 7) + '+' +
+                         ('-' * 22) + '+' + ('-' * 30) + '\n')
+
+        reader = tsstore.TsReader()
+        for rec in reader.records(time.time() - period):
+            ts_str = datetime.fromtimestamp(rec.ts).strftime(
+                "%Y-%m-%d %H:%M:%S")
+            # cut name is marked, as it may match other ports.
+            name = rec.name + ("~" if rec.truncated else "")
+            if rec.kind == tsstore.KIND_PMD:
+                obj = "%d" % rec.id
+            elif rec.kind == tsstore.KIND_RXQ:
+                obj = "%s %d" % (name, rec.id)
+            else:
+                obj = name
 
-        finally:
-            sock.close()
+            sys.stdout.write("%-19s | %-5s | %-20s | %s\n" % (
+                ts_str, kinds.get(rec.kind, "?"), obj,
+                " ".join([str(c) for c in rec.counters])))
 
         return 0
 
-    def version(self):
+    def timings(self):
         """
-        Get version of netcontrold.
+        Show latency of every phase in the service.
         """
-        sock_file = config.ncd_socket
+        sys.stdout.write(self._ctl_request(b"CTLD_TIMINGS", True))
+        return 0
 
-        if not os.path.exists(sock_file):
-            sys.stderr.write("socket %s not found.. exiting.\n" % sock_file)
-            sys.exit(1)
+    def timings_clear(self):
+        """
+        Clear latency of every phase in the service.
+        """
+        self._ctl_request(b"CTLD_TIMINGS_CLEAR")
+        return 0
 
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        try:
-            sock.connect(sock_file)
-        except socket.error as e:
-            sys.stderr.write("unable to connect %s: %s\n" % (sock_file, e))
-            sys.exit(1)
+    def profile(self, mode=None):
+        """
+        Start profiling main loop of the service by given profiler, or
+        stop it when no profiler is given.
+        """
+        if mode:
+            cmd = b"CTLD_PROF_START %s" % mode.encode()
+        else:
+            cmd = b"CTLD_PROF_STOP"
 
-        try:
-            sock.sendall(b"CTLD_VERSION")
-            ack_len = 0
-            while (ack_len < len("CTLD_DATA_ACK XXXXXX")):
-                data = sock.recv(len("CTLD_DATA_ACK XXXXXX"))
-                ack_len += len(data)
+        sys.stdout.write(self._ctl_request(cmd, True))
+        return 0
 
-            status_len = int(re.findall('\d+', data.decode())[0])
-            data_len = 0
-            while (data_len < status_len):
-                data = sock.recv(status_len).decode()
-                data_len += len(data)
+    def overhead(self):
+        """
+        Show resources consumed by the service in every phase.
+        """
+        sys.stdout.write(self._ctl_request(b"CTLD_OVERHEAD", True))
+        return 0
 
-            sys.stdout.write(data)
+    def memory(self, action=None):
+        """
+        Show memory used by the service, take snapshot of it or diff
+        against one, or drop snapshot.
+        """
+        if action == 'snapshot':
+            self._ctl_request(b"CTLD_MEM_SNAP")
+        elif action == 'clear':
+            self._ctl_request(b"CTLD_MEM_CLEAR")
+        elif action == 'diff':
+            sys.stdout.write(self._ctl_request(b"CTLD_MEM_DIFF", True))
+        else:
+            sys.stdout.write(self._ctl_request(b"CTLD_MEM", True))
 
-        finally:
-            sock.close()
+        return 0
 
+    def hifreq_stats(self):
+        """
+        Show pmd load sampled in high-frequency mode.
+        """
+        sys.stdout.write(self._ctl_request(b"CTLD_HIFREQ_STATS", True))
         return 0
@@ -0,0 +1,444 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['SimPmd',
+           'SimPort',
+           'SimSwitch',
+           'load_scenario',
+           ]
+
+import json
+
+from netcontrold.lib import util
+from netcontrold.sim import traffic
+
+# shortest simulated time (in sec) to advance counters, so that back
+# to back commands see the same interval.
+_STEP_MIN = 0.05
+
+
+class SimPmd(object):
+    """
+    Class to represent simulated pmd.
+
+    Attributes
+    ----------
+    id : int
+        core id of the pmd.
+    numa_id : int
+        numa of the core.
+    capacity : float
+        cpu cycles per second.
+    rx : float
+        packets received so far.
+    idle : float
+        idle cpu cycles so far.
+    proc : float
+        processing cpu cycles so far.
+    last_cyc : float
+        cpu cycles in last interval.
+    """
+
+    def __init__(self, _id, numa_id=0, capacity=2.0e9):
+        self.id = _id
+        self.numa_id = numa_id
+        self.capacity = capacity
+        self.rx = 0.0
+        self.idle = 0.0
+        self.proc = 0.0
+        self.last_cyc = 0.0
+        self.isolated = False
+
+
+class SimPort(object):
+    """
+    Class to represent simulated port, with its traffic spread evenly
+    on its rxqs.
+
+    Attributes
+    ----------
+    name : str
+        name of the port.
+    id : int
+        datapath port number.
+    type : str
+        interface type.
+    numa_id : int
+        numa of the port.
+    n_rxq : int
+        number of rxqs.
+    traffic : object
+        traffic generator.
+    cycles_per_pkt : float
+        cpu cycles to process a packet.
+    affinity : str
+        pmd-rxq-affinity of the port, or None.
+    rxq_pmd : dict
+        map of rxq id and pmd id polling it.
+    rxq_cyc : dict
+        map of rxq id and its cpu cycles in last interval.
+    """
+
+    def __init__(self, name, _id, traffic_gen, n_rxq=1, numa_id=0,
+                 _type="dpdk", cycles_per_pkt=250):
+        self.name = name
+        self.id = _id
+        self.type = _type
+        self.numa_id = numa_id
+        self.n_rxq = n_rxq
+        self.traffic = traffic_gen
+        self.cycles_per_pkt = cycles_per_pkt
+        self.affinity = None
+        self.rxq_pmd = {}
+        self.rxq_cyc = {q: 0.0 for q in range(n_rxq)}
+        self.rx = 0.0
+        self.rx_drop = 0.0
+        self.tx = 0.0
+        self.tx_drop = 0.0
+        self.tx_retries = 0.0
+
+
+class SimSwitch(object):
+    """
+    Class to represent simulated vswitch, answering the commands that
+    netcontrold runs with outputs in the format of Open vSwitch. Pmds
+    drop what they could not process in their cpu cycles, and rxqs
+    are reassigned whenever pmd-rxq-affinity is changed.
+
+    Attributes
+    ----------
+    clock : object
+        clock driving the simulation.
+    pmd_map : dict
+        map of pmd id and its SimPmd object.
+    port_map : dict
+        map of port name and its SimPort object.
+    n_cmds : int
+        count of commands answered.
+    n_reconfig : int
+        count of rxq reassignments after affinity changes.
+
+    Methods
+    -------
+    advance()
+        update counters until current time of clock.
+    """
+
+    version = "2.13.0"
+
+    def __init__(self, clock=None):
+        if clock is None:
+            clock = util.Clock()
+
+        self.clock = clock
+        self.start = clock.now()
+        self.ts = self.start
+        self.pmd_map = {}
+        self.port_map = {}
+        self.n_cmds = 0
+        self.n_reconfig = 0
+        self.upcall_limit_hit = 0
+
+    def add_pmd(self, _id, numa_id=0, capacity=2.0e9):
+        pmd = SimPmd(_id, numa_id, capacity)
+        self.pmd_map[_id] = pmd
+        self.assign()
+        return pmd
+
+    def add_port(self, name, traffic_gen, n_rxq=1, numa_id=0,
+                 _type="dpdk", cycles_per_pkt=250):
+        port = SimPort(name, len(self.port_map) + 1, traffic_gen, n_rxq,
+                       numa_id, _type, cycles_per_pkt)
+        self.port_map[name] = port
+        self.assign()
+        return port
+
+    def assign(self):
+        """
+        Assign rxqs to pmds, as vswitchd does on reconfiguration. Pinned
+        rxqs go to their pmd, which is then isolated. Other rxqs go
+        round robin on non-isolated pmds, of the same numa if any.
+        """
+
+        pinned = {}
+        for port in self.port_map.values():
+            for elm in (port.affinity or "").split(","):
+                if ":" not in elm:
+                    continue
+
+                (qid, pmd_id) = [int(x) for x in elm.split(":")]
+                if qid < port.n_rxq and pmd_id in self.pmd_map:
+                    pinned[(port.name, qid)] = pmd_id
+
+        isolated = set(pinned.values())
+        for pmd in self.pmd_map.values():
+            pmd.isolated = pmd.id in isolated
+
+        free = sorted([pmd for pmd in self.pmd_map.values()
+                       if not pmd.isolated], key=lambda o: o.id)
+        rr_idx = {}
+        for name in sorted(self.port_map.keys()):
+            port = self.port_map[name]
+            port.rxq_pmd = {}
+            for qid in range(port.n_rxq):
+                if (name, qid) in pinned:
+                    port.rxq_pmd[qid] = pinned[(name, qid)]
+                    continue
+
+                cands = ([pmd for pmd in free
+                          if pmd.numa_id == port.numa_id] or free)
+                if not cands:
+                    continue
+
+                numa_id = cands[0].numa_id
+                i = rr_idx.get(numa_id, 0)
+                port.rxq_pmd[qid] = cands[i % len(cands)].id
+                rr_idx[numa_id] = i + 1
+
+    def advance(self):
+        """
+        Update counters of pmds and ports until current time of clock.
+        Offered packets beyond cpu cycles of a pmd are dropped in rx of
+        their ports.
+        """
+
+        now = self.clock.now()
+        dt = now - self.ts
+        if dt < _STEP_MIN:
+            return
+
+        # traffic at the middle of the interval.
+        t = (self.ts - self.start) + (dt / 2)
+        self.ts = now
+
+        pmd_rxqs = {pmd_id: [] for pmd_id in self.pmd_map}
+        for port in self.port_map.values():
+            pkts = (port.traffic.pps(t) * dt) / port.n_rxq
+            for qid in range(port.n_rxq):
+                pmd_id = port.rxq_pmd.get(qid)
+                if pmd_id is None:
+                    port.rx_drop += pkts
+                    port.rxq_cyc[qid] = 0.0
+                    continue
+
+                pmd_rxqs[pmd_id].append((port, qid, pkts))
+
+        for pmd_id, rxqs in pmd_rxqs.items():
+            pmd = self.pmd_map[pmd_id]
+            cyc = pmd.capacity * dt
+            demand = sum([pkts * port.cycles_per_pkt
+                          for (port, qid, pkts) in rxqs])
+            ratio = 1.0
+            if demand > cyc:
+                ratio = cyc / demand
+
+            proc = 0.0
+            for (port, qid, pkts) in rxqs:
+                done = pkts * ratio
+                port.rx += done
+                port.rx_drop += (pkts - done)
+                port.tx += done
+                port.rxq_cyc[qid] = done * port.cycles_per_pkt
+                pmd.rx += done
+                proc += port.rxq_cyc[qid]
+
+            pmd.proc += proc
+            pmd.idle += (cyc - proc)
+            pmd.last_cyc = cyc
+
+    def pmd_stats_show(self):
+        out = ""
+        for pmd_id in sorted(self.pmd_map.keys()):
+            pmd = self.pmd_map[pmd_id]
+            total = (pmd.idle + pmd.proc) or 1
+            out += "pmd thread numa_id %d core_id %d:\n" % (
+                pmd.numa_id, pmd.id)
+            out += "  packets received: %d\n" % pmd.rx
+            out += "  packet recirculations: 0\n"
+            out += "  idle cycles: %d (%.2f%%)\n" % (
+                pmd.idle, (pmd.idle * 100) / total)
+            out += "  processing cycles: %d (%.2f%%)\n" % (
+                pmd.proc, (pmd.proc * 100) / total)
+
+        out += "main thread:\n"
+        out += "  packets received: 0\n"
+        return out
+
+    def pmd_rxq_show(self):
+        out = ""
+        for pmd_id in sorted(self.pmd_map.keys()):
+            pmd = self.pmd_map[pmd_id]
+            out += "pmd thread numa_id %d core_id %d:\n" % (
+                pmd.numa_id, pmd.id)
+            out += "  isolated : %s\n" % str(pmd.isolated).lower()
+            for name in sorted(self.port_map.keys()):
+                port = self.port_map[name]
+                for qid in sorted(port.rxq_pmd.keys()):
+                    if port.rxq_pmd[qid] != pmd_id:
+                        continue
+
+                    usage = 0
+                    if pmd.last_cyc:
+                        usage = int((port.rxq_cyc[qid] * 100) /
+                                    pmd.last_cyc)
+                    out += "  port: %-16s queue-id: %2d (enabled)  " \
+                        "pmd usage: %2d %%\n" % (name, qid, usage)
+
+        return out
+
+    def dpctl_show(self):
+        out = "netdev@ovs-netdev:\n"
+        out += "  lookups: hit:0 missed:0 lost:0\n"
+        out += "  flows: 0\n"
+        for port in sorted(self.port_map.values(), key=lambda o: o.id):
+            out += "  port %d: %s (%s)\n" % (port.id, port.name, port.type)
+            out += "    RX packets:%d errors:0 dropped:%d overruns:0 " \
+                "frame:0\n" % (port.rx, port.rx_drop)
+            out += "    TX packets:%d errors:0 dropped:%d aborted:0 " \
+                "carrier:0\n" % (port.tx, port.tx_drop)
+            out += "    collisions:0\n"
+            out += "    RX bytes:0  TX bytes:0\n"
+
+        return out
+
+    def list_interface(self):
+        out = []
+        for port in sorted(self.port_map.values(), key=lambda o: o.id):
+            other_config = ""
+            if port.affinity:
+                other_config = 'pmd-rxq-affinity="%s"' % port.affinity
+
+            intf = "%-20s: \"%s\"\n" % ("name", port.name)
+            intf += "%-20s: {%s}\n" % ("other_config", other_config)
+            intf += "%-20s: {rx_dropped=%d, rx_packets=%d, " \
+                "tx_dropped=%d, tx_packets=%d, tx_retries=%d}\n" % (
+                    "statistics", port.rx_drop, port.rx, port.tx_drop,
+                    port.tx, port.tx_retries)
+            intf += "%-20s: %s\n" % ("type", port.type)
+            out.append(intf)
+
+        return "\n".join(out)
+
+    def coverage_show(self):
+        out = "Event coverage, avg rate over last: 5 seconds, " \
+            "last minute, last hour:\n"
+        out += "%-26s 0.0/sec     0.000/sec        0.0000/sec   " \
+            "total: %d\n" % ("upcall_flow_limit_hit",
+                             self.upcall_limit_hit)
+        return out
+
+    def cpuinfo(self):
+        out = ""
+        numa_of = {pmd.id: pmd.numa_id for pmd in self.pmd_map.values()}
+        for cpu in range(max(list(numa_of.keys()) + [0]) + 1):
+            out += "processor\t: %d\n" % cpu
+            out += "core id\t\t: %d\n" % cpu
+            out += "physical id\t: %d\n\n" % numa_of.get(cpu, 0)
+
+        return out
+
+    def vsctl(self, args):
+        """
+        Apply pmd-rxq-affinity set or removed in ovs-vsctl arguments.
+        """
+
+        changed = False
+        op = []
+        for arg in args + ["--"]:
+            if arg != "--":
+                op.append(arg)
+                continue
+
+            if len(op) >= 4 and op[1] == "Interface" and \
+                    op[2] in self.port_map:
+                port = self.port_map[op[2]]
+                if op[0] == "set" and \
+                        op[3].startswith("other_config:pmd-rxq-affinity="):
+                    port.affinity = op[3].split("=", 1)[1].strip('"')
+                    changed = True
+                elif op[0] == "remove" and op[3:] == [
+                        "other_config", "pmd-rxq-affinity"]:
+                    port.affinity = None
+                    changed = True
+
+            op = []
+
+        if changed:
+            self.n_reconfig += 1
+            self.assign()
+
+        return ""
+
+    def __call__(self, cmd):
+        """
+        Return output of the command, or 1 if it is not simulated.
+        """
+
+        self.n_cmds += 1
+        self.advance()
+
+        args = cmd.split()
+        if cmd == "ovs-appctl dpif-netdev/pmd-stats-show":
+            return self.pmd_stats_show()
+        elif cmd == "ovs-appctl dpif-netdev/pmd-rxq-show":
+            return self.pmd_rxq_show()
+        elif cmd == "ovs-appctl dpctl/show -s":
+            return self.dpctl_show()
+        elif cmd == "ovs-appctl coverage/show":
+            return self.coverage_show()
+        elif cmd == "ovs-vsctl list interface":
+            return self.list_interface()
+        elif cmd == "ovs-vsctl -V":
+            return "ovs-vsctl (Open vSwitch) %s\n" % self.version
+        elif cmd == "cat /proc/cpuinfo":
+            return self.cpuinfo()
+        elif args[:2] == ["ovs-vsctl", "--no-wait"]:
+            return self.vsctl(args[2:])
+
+        return 1
+
+
+def load_scenario(path, clock=None):
+    """
+    Return SimSwitch built from scenario file, such as
+    {"pmds": [{"id": 1, "numa_id": 0}],
+     "ports": [{"name": "dpdk0", "n_rxq": 2,
+                "traffic": {"kind": "constant", "rate": 1000000}}]}
+
+    Parameters
+    ----------
+    path : str
+        scenario file in json.
+    clock : object, optional
+        clock driving the simulation.
+    """
+
+    with open(path) as f:
+        spec = json.load(f)
+
+    sw = SimSwitch(clock)
+    for pmd in spec.get("pmds", []):
+        sw.add_pmd(pmd["id"], pmd.get("numa_id", 0),
+                   pmd.get("capacity", 2.0e9))
+
+    for port in spec.get("ports", []):
+        sw.add_port(port["name"],
+                    traffic.make_traffic(port.get("traffic", {"rate": 0})),
+                    port.get("n_rxq", 1), port.get("numa_id", 0),
+                    port.get("type", "dpdk"),
+                    port.get("cycles_per_pkt", 250))
+
+    return sw
@@ -0,0 +1,126 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+__all__ = ['Constant',
+           'Bursty',
+           'Diurnal',
+           'make_traffic',
+           ]
+
+import math
+
+
+class Constant(object):
+    """
+    Class to represent traffic at constant rate.
+
+    Attributes
+    ----------
+    rate : float
+        packets per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+
+    def pps(self, t):
+        """
+        Return packets per second at t seconds into simulation.
+        """
+        return self.rate
+
+
+class Bursty(object):
+    """
+    Class to represent traffic at base rate, bursting to peak rate for
+    duty fraction of every period.
+
+    Attributes
+    ----------
+    rate : float
+        packets per second out of burst.
+    peak : float
+        packets per second in burst.
+    period : float
+        seconds between start of bursts.
+    duty : float
+        fraction of period in burst.
+    """
+
+    def __init__(self, rate, peak, period=60, duty=0.1):
+        self.rate = rate
+        self.peak = peak
+        self.period = period
+        self.duty = duty
+
+    def pps(self, t):
+        if (t % self.period) < (self.period * self.duty):
+            return self.peak
+
+        return self.rate
+
+
+class Diurnal(object):
+    """
+    Class to represent traffic following a day, lowest at the beginning
+    of period and highest half way through.
+
+    Attributes
+    ----------
+    rate_min : float
+        lowest packets per second.
+    rate_max : float
+        highest packets per second.
+    period : float
+        seconds in a day.
+    """
+
+    def __init__(self, rate_min, rate_max, period=86400):
+        self.rate_min = rate_min
+        self.rate_max = rate_max
+        self.period = period
+
+    def pps(self, t):
+        phase = (1 - math.cos((2 * math.pi * t) / self.period)) / 2
+        return self.rate_min + ((self.rate_max - self.rate_min) * phase)
+
+
+def make_traffic(spec):
+    """
+    Return traffic generator for its spec, such as
+    {"kind": "bursty", "rate": 1000, "peak": 5000}.
+
+    Parameters
+    ----------
+    spec : dict
+        kind of traffic and arguments of its generator.
+
+    Raises
+    ------
+    ValueError
+        if kind of traffic is unknown.
+    """
+
+    spec = dict(spec)
+    kind = spec.pop("kind", "constant")
+    if kind == "constant":
+        return Constant(**spec)
+    elif kind == "bursty":
+        return Bursty(**spec)
+    elif kind == "diurnal":
+        return Diurnal(**spec)
+
+    raise ValueError("unknown traffic %s" % kind)
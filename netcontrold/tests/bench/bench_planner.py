@@ -0,0 +1,311 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Scorecard of dry-run algorithms on a library of seeded scenarios. Every
+planner is run on the same samples of a simulated vswitch, and its
+placement is applied back into the simulator to measure the outcome.
+
+    python -m netcontrold.tests.bench.bench_planner [--out FILE]
+        [--scenario NAME ..] [--seeds N]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from unittest import mock
+
+import netcontrold
+from netcontrold.app import ncd
+from netcontrold.lib import capture
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import util
+from netcontrold.sim import switch
+from netcontrold.sim import traffic
+from netcontrold.tests.bench.bench_scale import NlogNoop
+
+PLANNERS = {
+    "by_cyc": dataif.rebalance_dryrun_by_cyc,
+    "by_iq": dataif.rebalance_dryrun_by_iq,
+}
+
+# cpu cycles per second of every pmd, and cycles for a packet.
+_CAPACITY = 2.0e9
+_CPP = 250
+
+
+def _pps(load):
+    """
+    Return packets per second making load (in percent) on a pmd.
+    """
+    return (_CAPACITY * load) / (100 * _CPP)
+
+
+def _add_ports(sw, loads, n_rxq=1, numa_of=None):
+    for i, load in enumerate(loads):
+        numa_id = numa_of(i) if numa_of else 0
+        sw.add_port("port%d" % i, traffic.Constant(_pps(load)), n_rxq,
+                    numa_id, cycles_per_pkt=_CPP)
+
+
+def _skewed_loads(rng, n, total):
+    """
+    Return n loads adding up to about total, in pareto distribution
+    and within what a pmd could carry.
+    """
+    weights = [rng.paretovariate(1.2) for i in range(n)]
+    return [min((total * w) / sum(weights), 90) for w in weights]
+
+
+def scenario_uniform(sw, rng):
+    """
+    8 pmds and 16 single rxq ports, all at same rate.
+    """
+    for i in range(8):
+        sw.add_pmd(i + 1, 0, _CAPACITY)
+    _add_ports(sw, [35] * 16)
+
+
+def scenario_skewed(sw, rng):
+    """
+    8 pmds and 16 single rxq ports, rates in pareto distribution.
+    """
+    for i in range(8):
+        sw.add_pmd(i + 1, 0, _CAPACITY)
+    _add_ports(sw, _skewed_loads(rng, 16, 600))
+
+
+def scenario_elephant(sw, rng):
+    """
+    8 pmds and 16 single rxq ports at low rate, and one port nearly
+    filling a pmd.
+    """
+    for i in range(8):
+        sw.add_pmd(i + 1, 0, _CAPACITY)
+    _add_ports(sw, [rng.uniform(15, 35) for i in range(16)])
+    sw.add_port("elephant", traffic.Constant(_pps(85)), 1, 0,
+                cycles_per_pkt=_CPP)
+
+
+def scenario_multi_numa(sw, rng):
+    """
+    8 pmds on two numas and 16 single rxq ports on either numa, rates
+    in pareto distribution.
+    """
+    for i in range(8):
+        sw.add_pmd(i + 1, i % 2, _CAPACITY)
+    _add_ports(sw, _skewed_loads(rng, 16, 600), 1, lambda i: i % 2)
+
+
+def scenario_isolated(sw, rng):
+    """
+    8 pmds of which two are isolated by a pinned port, and 16 single
+    rxq ports in pareto distribution on the rest.
+    """
+    for i in range(8):
+        sw.add_pmd(i + 1, 0, _CAPACITY)
+    _add_ports(sw, _skewed_loads(rng, 16, 450))
+    sw.add_port("pinned", traffic.Constant(_pps(100)), 2, 0,
+                cycles_per_pkt=_CPP)
+    sw("ovs-vsctl --no-wait -- set Interface pinned "
+       "other_config:pmd-rxq-affinity=0:7,1:8")
+
+
+SCENARIOS = {
+    "uniform": scenario_uniform,
+    "skewed": scenario_skewed,
+    "elephant": scenario_elephant,
+    "multi_numa": scenario_multi_numa,
+    "isolated": scenario_isolated,
+}
+
+
+def collect(clock):
+    """
+    Collect a window of samples and return pmd_map with its loads.
+    """
+
+    ctx = dataif.Context
+    for i in range(config.ncd_samples_max):
+        dataif.get_port_stats()
+        dataif.get_interface_stats()
+        dataif.get_pmd_stats(ctx.pmd_map)
+        dataif.get_pmd_rxqs(ctx.pmd_map)
+        clock.sleep(10)
+
+    dataif.update_pmd_load(ctx.pmd_map)
+    return ctx.pmd_map
+
+
+def state(pmd_map):
+    """
+    Return max load, load variance, score and worst rx drop (in ppm)
+    of the pmds.
+    """
+
+    loads = [pmd.pmd_load for pmd in pmd_map.values()]
+    drop = 0
+    for port in dataif.Context.port_to_cls.values():
+        drop = max(drop, dataif.port_drop_ppm(port)[0])
+
+    return {"max_load": round(max(loads), 1),
+            "variance": round(util.variance(loads), 1),
+            "score": round(dataif.pmd_load_score(pmd_map), 1),
+            "drop_ppm": round(drop)}
+
+
+def run_planner(scenario, planner, seed):
+    """
+    Return state of pmds before, as estimated by dry-run and as
+    measured after applying its placement, with moves and runtime.
+    """
+
+    clock = capture.ReplayClock(0)
+    sw = switch.SimSwitch(clock)
+    SCENARIOS[scenario](sw, random.Random(seed))
+    util.set_command_backend(sw)
+    util.Memoize.forgot = True
+
+    ctx_attrs = dict(nlog=NlogNoop(), clock=clock, pmd_map={},
+                     port_to_cls={}, port_to_id={}, rxq_hold=set())
+    try:
+        with mock.patch.multiple(dataif.Context, **ctx_attrs):
+            pmd_map = collect(clock)
+            before = state(pmd_map)
+
+            start = time.perf_counter()
+            PLANNERS[planner](pmd_map)
+            runtime = (time.perf_counter() - start) * 1000
+
+            estimate = state(pmd_map)
+            moves = len(dataif.rebalance_plan(pmd_map))
+            cmd = ""
+            if moves:
+                cur_aff = {name: port.affinity
+                           for name, port in sw.port_map.items()}
+                new_aff = ncd.rebalance_affinity(pmd_map)
+                with mock.patch.object(ncd, 'nlog', NlogNoop()):
+                    cmd = ncd.affinity_command(
+                        ncd.affinity_diff(cur_aff, new_aff))
+
+        if cmd:
+            sw(cmd)
+
+        ctx_attrs.update(pmd_map={}, port_to_cls={}, port_to_id={})
+        with mock.patch.multiple(dataif.Context, **ctx_attrs):
+            after = state(collect(clock))
+    finally:
+        util.set_command_backend(None)
+        util.Memoize.forgot = False
+
+    return {"scenario": scenario,
+            "planner": planner,
+            "seed": seed,
+            "before": before,
+            "estimate": estimate,
+            "after": after,
+            "moves": moves,
+            "runtime_ms": round(runtime, 3)}
+
+
+def mean(results, fn, ndigits=1):
+    return round(sum([fn(r) for r in results]) / len(results), ndigits)
+
+
+def report(results):
+    """
+    Print comparison table, averaged over the seeds.
+    """
+
+    sys.stdout.write("%-11s | %-7s | %-17s | %-17s | %-9s | %-5s | %s\n" % (
+        'scenario', 'planner', 'max load b/est/a', 'variance b/a',
+        'drop ppm', 'moves', 'runtime ms'))
+    sys.stdout.write(('-' * 12) + '+' + ('-' * 9) + '+' + ('-' * 19) +
+                     '+' + ('-' * 19) + '+' + ('-' * 11) + '+' +
+                     ('-' * 7) + '+' + ('-' * 11) + '\n')
+
+    keys = []
+    for r in results:
+        if (r["scenario"], r["planner"]) not in keys:
+            keys.append((r["scenario"], r["planner"]))
+
+    for (scenario, planner) in keys:
+        rs = [r for r in results
+              if r["scenario"] == scenario and r["planner"] == planner]
+        sys.stdout.write(
+            "%-11s | %-7s | %-17s | %-17s | %-9s | %-5s | %s\n" % (
+                scenario, planner,
+                "%d/%d/%d" % (mean(rs, lambda r: r["before"]["max_load"]),
+                              mean(rs, lambda r: r["estimate"]["max_load"]),
+                              mean(rs, lambda r: r["after"]["max_load"])),
+                "%d/%d" % (mean(rs, lambda r: r["before"]["variance"]),
+                           mean(rs, lambda r: r["after"]["variance"])),
+                "%d" % mean(rs, lambda r: r["after"]["drop_ppm"]),
+                "%.1f" % mean(rs, lambda r: r["moves"]),
+                "%.3f" % mean(rs, lambda r: r["runtime_ms"], 3)))
+
+
+def main(argv):
+    argpobj = argparse.ArgumentParser(
+        prog='bench_planner',
+        description='scorecard of netcontrold dry-run algorithms')
+
+    argpobj.add_argument('--scenario',
+                         type=str,
+                         nargs='*',
+                         choices=sorted(SCENARIOS.keys()),
+                         default=sorted(SCENARIOS.keys()),
+                         help='scenarios to run (default: all)')
+
+    argpobj.add_argument('--planner',
+                         type=str,
+                         nargs='*',
+                         choices=sorted(PLANNERS.keys()),
+                         default=sorted(PLANNERS.keys()),
+                         help='dry-run algorithms to run (default: all)')
+
+    argpobj.add_argument('--seeds',
+                         type=int,
+                         default=5,
+                         help='seeds of every scenario (default: 5)')
+
+    argpobj.add_argument('--out',
+                         type=str,
+                         default=None,
+                         help='file to write results in json')
+
+    args = argpobj.parse_args(argv)
+
+    results = []
+    for scenario in args.scenario:
+        for planner in args.planner:
+            for seed in range(args.seeds):
+                results.append(run_planner(scenario, planner, seed))
+
+    report(results)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({"version": netcontrold.__version__,
+                       "results": results}, f, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
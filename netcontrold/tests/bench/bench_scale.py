@@ -0,0 +1,275 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Scale benchmarks of data collection, load calculation and dry-runs,
+on topologies generated by the vswitch simulator. Results are written
+as json, and compared against results of an earlier run if given.
+
+    python -m netcontrold.tests.bench.bench_scale [--out FILE]
+        [--compare FILE] [--topology PMDS:RXQS ..] [--repeat N]
+"""
+
+import argparse
+import copy
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+import netcontrold
+from netcontrold.lib import capture
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import util
+from netcontrold.sim import switch
+from netcontrold.sim import traffic
+
+# (pmds, rxqs) of the topologies benchmarked by default.
+TOPOLOGIES = [(2, 16), (16, 256), (64, 2048), (256, 8192)]
+
+# rxqs in every port of the topology.
+RXQS_PER_PORT = 32
+
+# pmd load (in percent) on average in the topology.
+LOAD_MEAN = 60
+
+
+class NlogNoop(object):
+
+    def info(self, *args):
+        pass
+
+    def debug(self, *args):
+        pass
+
+    def warn(self, *args):
+        pass
+
+
+def make_switch(n_pmds, n_rxqs, clock):
+    """
+    Return simulated vswitch of n_pmds pmds split on two numas, and
+    n_rxqs rxqs in ports of uneven traffic.
+    """
+
+    sw = switch.SimSwitch(clock)
+    capacity = 2.0e9
+    for i in range(n_pmds):
+        sw.add_pmd(i + 1, i % 2, capacity)
+
+    n_ports = max(1, n_rxqs // RXQS_PER_PORT)
+    n_rxq = n_rxqs // n_ports
+    weights = [1 + (i % 7) for i in range(n_ports)]
+    cpp = 250
+    total_pps = (n_pmds * capacity * LOAD_MEAN) / (100 * cpp)
+    for i in range(n_ports):
+        rate = (total_pps * weights[i]) / sum(weights)
+        sw.add_port("port%d" % i, traffic.Constant(rate), n_rxq, i % 2,
+                    cycles_per_pkt=cpp)
+
+    return sw
+
+
+def measure(fn, repeat, setup=None):
+    """
+    Return timing (in ms) and peak memory (in KB) of fn over repeat
+    runs. Setup, if any, is run before every run and is not measured.
+    """
+
+    times = []
+    peak = 0
+    for i in range(repeat):
+        arg = setup() if setup else None
+        tracemalloc.start()
+        start = time.perf_counter()
+        if setup:
+            fn(arg)
+        else:
+            fn()
+        times.append((time.perf_counter() - start) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {"mean_ms": round(sum(times) / len(times), 3),
+            "min_ms": round(min(times), 3),
+            "max_ms": round(max(times), 3),
+            "peak_kb": round(peak / 1024, 1)}
+
+
+def bench_topology(n_pmds, n_rxqs, repeat):
+    """
+    Return timings of every stage on the topology.
+    """
+
+    clock = capture.ReplayClock(0)
+    sw = make_switch(n_pmds, n_rxqs, clock)
+    ctx = dataif.Context
+    util.set_command_backend(sw)
+    util.Memoize.forgot = True
+
+    timings = {}
+    with mock.patch.multiple(dataif.Context, nlog=NlogNoop(), clock=clock,
+                             pmd_map={}, port_to_cls={}, port_to_id={}):
+        pmd_map = ctx.pmd_map
+        samples = {"get_port_stats": [], "get_pmd_stats": [],
+                   "get_pmd_rxqs": []}
+        for i in range(config.ncd_samples_max):
+            samples["get_port_stats"].append(measure(
+                dataif.get_port_stats, 1))
+            dataif.get_interface_stats()
+            samples["get_pmd_stats"].append(measure(
+                lambda: dataif.get_pmd_stats(pmd_map), 1))
+            samples["get_pmd_rxqs"].append(measure(
+                lambda: dataif.get_pmd_rxqs(pmd_map), 1))
+            clock.sleep(10)
+
+        # first sample creates the objects, so it is kept apart.
+        for name, runs in samples.items():
+            steady = runs[1:] or runs
+            timings[name] = {
+                "first_ms": runs[0]["mean_ms"],
+                "mean_ms": round(
+                    sum([r["mean_ms"] for r in steady]) / len(steady), 3),
+                "min_ms": min([r["min_ms"] for r in steady]),
+                "max_ms": max([r["max_ms"] for r in steady]),
+                "peak_kb": max([r["peak_kb"] for r in runs])}
+
+        timings["update_pmd_load"] = measure(
+            lambda: dataif.update_pmd_load(pmd_map), repeat)
+        timings["pmd_load_variance"] = measure(
+            lambda: dataif.pmd_load_variance(pmd_map), repeat)
+        timings["rebalance_dryrun_by_cyc"] = measure(
+            dataif.rebalance_dryrun_by_cyc, repeat,
+            lambda: copy.deepcopy(pmd_map))
+        timings["rebalance_dryrun_by_iq"] = measure(
+            dataif.rebalance_dryrun_by_iq, repeat,
+            lambda: copy.deepcopy(pmd_map))
+
+    util.set_command_backend(None)
+    util.Memoize.forgot = False
+
+    return {"pmds": n_pmds,
+            "rxqs": n_rxqs,
+            "ports": len(sw.port_map),
+            "timings": timings}
+
+
+def compare(results, base, tolerance):
+    """
+    Print ratio of mean time of every stage against base results, and
+    return count of stages slower than tolerance.
+    """
+
+    base_map = {(r["pmds"], r["rxqs"]): r["timings"]
+                for r in base["results"]}
+    n_slow = 0
+    sys.stdout.write("%-10s | %-24s | %-10s | %-10s | %s\n" % (
+        'topology', 'stage', 'base ms', 'new ms', 'ratio'))
+    for res in results["results"]:
+        topo = (res["pmds"], res["rxqs"])
+        if topo not in base_map:
+            continue
+
+        for stage, timing in sorted(res["timings"].items()):
+            if stage not in base_map[topo]:
+                continue
+
+            old = base_map[topo][stage]["mean_ms"]
+            new = timing["mean_ms"]
+            ratio = (new / old) if old else 1.0
+            flag = ""
+            if ratio > tolerance:
+                flag = " !"
+                n_slow += 1
+
+            sys.stdout.write("%-10s | %-24s | %-10.3f | %-10.3f | %.2f%s\n"
+                             % ("%d:%d" % topo, stage, old, new, ratio,
+                                flag))
+
+    return n_slow
+
+
+def main(argv):
+    argpobj = argparse.ArgumentParser(
+        prog='bench_scale',
+        description='scale benchmarks of netcontrold')
+
+    argpobj.add_argument('--topology',
+                         type=str,
+                         nargs='*',
+                         default=["%d:%d" % t for t in TOPOLOGIES],
+                         help='topologies as pmds:rxqs (default: %s)'
+                         % " ".join(["%d:%d" % t for t in TOPOLOGIES]))
+
+    argpobj.add_argument('--repeat',
+                         type=int,
+                         default=3,
+                         help='runs of every stage (default: 3)')
+
+    argpobj.add_argument('--out',
+                         type=str,
+                         default=None,
+                         help='file to write results (default: stdout)')
+
+    argpobj.add_argument('--compare',
+                         type=str,
+                         default=None,
+                         help='results of an earlier run to compare with')
+
+    argpobj.add_argument('--tolerance',
+                         type=float,
+                         default=1.5,
+                         help='slowdown ratio reported as regression '
+                         '(default: 1.5)')
+
+    args = argpobj.parse_args(argv)
+
+    results = {"version": netcontrold.__version__,
+               "python": platform.python_version(),
+               "samples_max": config.ncd_samples_max,
+               "time": time.time(),
+               "results": []}
+
+    for topo in args.topology:
+        (n_pmds, n_rxqs) = [int(x) for x in topo.split(":")]
+        results["results"].append(
+            bench_topology(n_pmds, n_rxqs, args.repeat))
+
+    results["maxrss_kb"] = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+
+        if compare(results, base, args.tolerance):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
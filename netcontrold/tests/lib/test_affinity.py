@@ -0,0 +1,301 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.app import ncd
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import error
+from netcontrold.lib import event
+from netcontrold.lib import rebal
+
+_nlog = logging.getLogger("test_affinity")
+_nlog.addHandler(logging.NullHandler())
+
+
+class TestAffinity_Base(TestCase):
+    """
+    Base to build pmds after dry-run, each pmd in numa 0 with ports of
+    given rxqs, and rxqs moved out of it.
+    """
+
+    def setUp(self):
+        for (attr, val) in (('port_to_cls', {}), ('port_to_id', {}),
+                            ('events', event.EventLog(8))):
+            patcher = mock.patch.object(dataif.Context, attr, val)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(ncd, 'nlog', _nlog)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pmd_map = {}
+
+    def add_pmd(self, pmd_id, rxqs, moved=None):
+        pmd = dataif.Dataif_Pmd(pmd_id)
+        pmd.numa_id = 0
+        self.pmd_map[pmd_id] = pmd
+        for (port_name, rxq_id) in rxqs:
+            dataif.make_dataif_port(port_name)
+            port = (pmd.find_port_by_name(port_name) or
+                    pmd.add_port(port_name))
+            port.add_rxq(rxq_id)
+
+        for ((port_name, rxq_id), dst) in (moved or {}).items():
+            dataif.make_dataif_port(port_name)
+            port = (pmd.find_port_by_name(port_name) or
+                    pmd.add_port(port_name))
+            port.rxq_rebalanced[rxq_id] = dst
+
+
+class TestAffinity_Staged(TestAffinity_Base):
+    """
+    Test for applying rebalance in batches.
+    """
+
+    # Test case:
+    #   two moves in separate batches, check first batch reconfigures
+    #   only the ports having rxqs in its source or target pmds, and
+    #   last batch sets affinity of all the ports.
+    @mock.patch.object(config, 'ncd_rebal_batch_n', 1)
+    @mock.patch.object(config, 'ncd_verify_samples', 0)
+    @mock.patch('netcontrold.app.ncd.apply_rebalance')
+    @mock.patch('netcontrold.lib.dataif.get_interface_affinity')
+    def test_batch_ports(self, mock_aff, mock_apply):
+        mock_aff.return_value = {"p1": None, "p2": None, "p3": None,
+                                 "p5": None}
+        self.add_pmd(1, [("p1", 0)])
+        self.add_pmd(2, [("p2", 0)])
+        self.add_pmd(3, [("p3", 0)], {("p3", 1): 4})
+        self.add_pmd(4, [("p3", 1)])
+        self.add_pmd(5, [], {("p5", 0): 6})
+        self.add_pmd(6, [("p5", 0)])
+
+        moves = dataif.rebalance_plan(self.pmd_map)
+        self.assertEqual(moves, {("p3", 1): (3, 4), ("p5", 0): (5, 6)})
+        pmd_load = {1: 50, 2: 50, 3: 90, 4: 10, 5: 80, 6: 10}
+        ncd.rebalance_staged(self.pmd_map, moves, pmd_load, 0, 1)
+
+        batches = [c[0][0] for c in mock_apply.call_args_list]
+        self.assertEqual(batches, [{"p3": "0:3,1:4,"},
+                                   {"p2": "0:2,", "p5": "0:6,"}])
+
+    # Test case:
+    #   port in moved pmd spans an untouched pmd, check the ports in
+    #   that pmd are pinned in the same batch, as pinning the port
+    #   isolates the untouched pmd.
+    @mock.patch.object(config, 'ncd_rebal_batch_n', 1)
+    @mock.patch.object(config, 'ncd_verify_samples', 0)
+    @mock.patch('netcontrold.app.ncd.apply_rebalance')
+    @mock.patch('netcontrold.lib.dataif.get_interface_affinity')
+    def test_batch_spanned_port(self, mock_aff, mock_apply):
+        mock_aff.return_value = {"p1": None, "p3": None, "p4": None,
+                                 "p5": None, "p6": None}
+        self.add_pmd(1, [("p1", 0)])
+        self.add_pmd(3, [("p3", 0)], {("p4", 0): 4})
+        self.add_pmd(4, [("p4", 0)])
+        self.add_pmd(5, [("p3", 1), ("p5", 0)])
+        self.add_pmd(6, [], {("p6", 0): 7})
+        self.add_pmd(7, [("p6", 0)])
+
+        moves = dataif.rebalance_plan(self.pmd_map)
+        self.assertEqual(moves, {("p4", 0): (3, 4), ("p6", 0): (6, 7)})
+        pmd_load = {1: 50, 3: 90, 4: 10, 5: 50, 6: 80, 7: 10}
+        ncd.rebalance_staged(self.pmd_map, moves, pmd_load, 0, 1)
+
+        batches = [c[0][0] for c in mock_apply.call_args_list]
+        self.assertEqual(batches, [{"p3": "0:3,1:5,", "p4": "0:4,",
+                                    "p5": "0:5,"},
+                                   {"p6": "0:7,"}])
+
+
+class TestAffinity_Diff(TestAffinity_Base):
+    """
+    Test for rxq affinity to be changed in the ports.
+    """
+
+    # Test case:
+    #   port with same affinity, though written differently, is skipped.
+    def test_unchanged(self):
+        port_aff = ncd.affinity_diff({"p1": "0:3,1:4"},
+                                     {"p1": "1:4,0:3,"})
+        self.assertEqual(port_aff, {})
+        self.assertEqual(ncd.affinity_command(port_aff), "")
+
+    # Test case:
+    #   affinity is removed only in the port having it now.
+    def test_remove(self):
+        port_aff = ncd.affinity_diff({"p1": None, "p2": "0:3,"},
+                                     {"p1": None, "p2": None})
+        self.assertEqual(port_aff, {"p2": None})
+        self.assertEqual(
+            ncd.affinity_command(port_aff),
+            "ovs-vsctl --no-wait "
+            "-- remove Interface p2 other_config pmd-rxq-affinity ")
+
+    # Test case:
+    #   port not available in vswitch is skipped, with an event.
+    def test_unavailable(self):
+        port_aff = ncd.affinity_diff({"p1": None},
+                                     {"p1": "0:3,", "p2": "0:4,"})
+        self.assertEqual(port_aff, {"p1": "0:3,"})
+        self.assertEqual(
+            ncd.affinity_command(port_aff),
+            "ovs-vsctl --no-wait "
+            "-- set Interface p1 other_config:pmd-rxq-affinity=0:3, ")
+
+        events = list(dataif.Context.events)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][:2], ("p2", "skip"))
+
+
+class TestAffinity_Collect(TestAffinity_Base):
+    """
+    Test for failing to collect rxq affinity from vswitch.
+    """
+
+    # Test case:
+    #   ovs-vsctl fails, check rebalance and rollback change nothing
+    #   and report switch error, instead of raising it.
+    @mock.patch('netcontrold.app.ncd.switch_affinity')
+    @mock.patch('netcontrold.lib.dataif.get_interface_affinity')
+    def test_collect_error(self, mock_aff, mock_switch):
+        mock_aff.side_effect = error.OsCommandExc("unable to collect data")
+        self.add_pmd(3, [("p3", 0)], {("p3", 1): 4})
+        self.add_pmd(4, [("p3", 1)])
+
+        self.assertIsNone(ncd.interface_affinity())
+        self.assertEqual(ncd.rebalance_switch(self.pmd_map), {})
+        self.assertEqual(ncd.rollback_rebalance({"p3": None}), 1)
+        mock_switch.assert_not_called()
+
+        events = list(dataif.Context.events)
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0][:2], ("switch", "error"))
+
+
+class TestAffinity_Rebalance(TestAffinity_Base):
+    """
+    Test for rxq affinity of the ports after dry-run.
+    """
+
+    def setUp(self):
+        super(TestAffinity_Rebalance, self).setUp()
+
+        # pmd 1 is non-isolated. p3 rxq 1 and p5 rxq 0 moved in dry-run.
+        self.add_pmd(1, [("p1", 0)])
+        self.add_pmd(3, [("p3", 0)], {("p3", 1): 4})
+        self.add_pmd(4, [("p3", 1)])
+        self.add_pmd(5, [], {("p5", 0): 6})
+        self.add_pmd(6, [("p5", 0)])
+
+    # Test case:
+    #   all the moves are applied.
+    def test_all(self):
+        self.assertEqual(ncd.rebalance_affinity(self.pmd_map),
+                         {"p1": None, "p3": "0:3,1:4,", "p5": "0:6,"})
+
+    # Test case:
+    #   moves not applied retain rxqs in their source pmd.
+    def test_subset(self):
+        moves = {("p3", 1): (3, 4)}
+        self.assertEqual(ncd.rebalance_affinity(self.pmd_map, moves),
+                         {"p1": None, "p3": "0:3,1:4,", "p5": "0:5,"})
+
+        self.assertEqual(ncd.rebalance_affinity(self.pmd_map, {}),
+                         {"p1": None, "p3": "0:3,1:3,", "p5": "0:5,"})
+
+
+class TestAffinity_Apply(TestAffinity_Base):
+    """
+    Test for waiting on vswitch once rxq affinity is set.
+    """
+
+    def setUp(self):
+        super(TestAffinity_Apply, self).setUp()
+
+        patcher = mock.patch.object(dataif.Context, 'clock', mock.Mock())
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # Test case:
+    #   vswitch not known to have applied affinity, check pmds are let
+    #   to settle before verifying their load.
+    @mock.patch.object(config, 'ncd_vsw_wait_min', 0)
+    @mock.patch.object(config, 'ncd_vsw_settle_min', 2)
+    @mock.patch('netcontrold.app.ncd.switch_affinity')
+    def test_settle(self, mock_switch):
+        mock_switch.return_value = (True, False)
+        with mock.patch.object(config, 'ncd_verify_samples', 3):
+            self.assertTrue(ncd.apply_rebalance({"p1": "0:3,"}))
+        self.clock.sleep.assert_called_once_with(2)
+
+        self.clock.reset_mock()
+        with mock.patch.object(config, 'ncd_verify_samples', 0):
+            ncd.apply_rebalance({"p1": "0:3,"})
+        self.clock.sleep.assert_called_once_with(0)
+
+        self.clock.reset_mock()
+        mock_switch.return_value = (True, True)
+        ncd.apply_rebalance({"p1": "0:3,"})
+        self.clock.sleep.assert_not_called()
+
+
+class TestAffinity_Verify(TestAffinity_Base):
+    """
+    Test for rolling back rxq affinity when rebalance did not help.
+    """
+
+    def setUp(self):
+        super(TestAffinity_Verify, self).setUp()
+
+        self.ctrl = rebal.RebalController()
+        patcher = mock.patch.object(ncd.RebalContext, 'rebal_ctrl',
+                                    self.ctrl)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.moves = {("p3", 1): (3, 4)}
+        self.port_aff = {"p3": None}
+
+    # Test case:
+    #   pmd load improved close to estimate, check rebalance is kept.
+    @mock.patch('netcontrold.app.ncd.rollback_rebalance')
+    def test_verified(self, mock_rollback):
+        plan = self.ctrl.record(self.moves, 100, 40, now=0)
+        self.assertTrue(ncd.verify_rebalance(plan, self.port_aff, 0,
+                                             (60, 0)))
+        self.assertEqual(plan.outcome, "verified")
+        mock_rollback.assert_not_called()
+
+    # Test case:
+    #   pmd load improved but far short of estimate, check rebalance
+    #   is rolled back and its rxqs are no more in cooldown.
+    @mock.patch.object(config, 'ncd_verify_var_margin', 50)
+    @mock.patch('netcontrold.app.ncd.rollback_rebalance')
+    def test_short_of_estimate(self, mock_rollback):
+        mock_rollback.return_value = 0
+        plan = self.ctrl.record(self.moves, 100, 40, now=0)
+        self.assertEqual(self.ctrl.rxq_on_hold(1), {("p3", 1)})
+
+        self.assertFalse(ncd.verify_rebalance(plan, self.port_aff, 0,
+                                              (90, 0)))
+        self.assertEqual(plan.outcome, "rollback")
+        mock_rollback.assert_called_once_with(self.port_aff)
+        self.assertEqual(self.ctrl.rxq_on_hold(1), set())
@@ -0,0 +1,88 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+import shutil
+import tempfile
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import capture
+from netcontrold.lib import util
+from netcontrold.lib.error import OsCommandExc
+
+
+class TestCapture(TestCase):
+    """
+    Test for record and replay of vswitch commands.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cap_file = os.path.join(self.path, "ncd.cap")
+
+    # cleanup test environment
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        util.set_command_backend(None)
+
+    def record(self, close=True):
+        writer = capture.CaptureWriter(self.cap_file, 2)
+        for i in range(5):
+            writer.append(1000.0 + (i * 10), "ovs-appctl pmd-stats",
+                          "stats %d" % i)
+        if close:
+            writer.close()
+        else:
+            writer.f.close()
+
+    # Test case:
+    #   capture closed or not, check index of blocks and records are
+    #   read back.
+    def test_read_index(self):
+        self.record()
+        reader = capture.CaptureReader(self.cap_file)
+        self.assertEqual(len(reader.index), 3)
+        self.assertEqual(reader.cmds, {"ovs-appctl pmd-stats"})
+        self.assertEqual([r[2] for r in reader.records(1025)],
+                         ["stats 2", "stats 3", "stats 4"])
+
+        # last block is lost without closing the capture.
+        self.record(close=False)
+        reader = capture.CaptureReader(self.cap_file)
+        self.assertEqual(len(reader.index), 2)
+        self.assertEqual(reader.end_time(), 1030.0)
+
+    # Test case:
+    #   replay at no delay, check outputs follow replay clock and end
+    #   of capture stops it.
+    @mock.patch('netcontrold.lib.util.run_host_command')
+    def test_replay(self, mock_run):
+        self.record()
+        reader = capture.CaptureReader(self.cap_file)
+        clock = capture.ReplayClock(0, reader.start_time())
+        util.set_command_backend(capture.Replayer(reader, clock))
+
+        self.assertEqual(util.exec_host_command("ovs-appctl pmd-stats"),
+                         "stats 0")
+        clock.sleep(25)
+        self.assertEqual(util.exec_host_command("ovs-appctl pmd-stats"),
+                         "stats 2")
+        self.assertEqual(util.exec_host_command("ovs-vsctl set x"), "")
+        clock.sleep(25)
+        self.assertRaises(OsCommandExc, util.exec_host_command,
+                          "ovs-appctl pmd-stats")
+        mock_run.assert_not_called()
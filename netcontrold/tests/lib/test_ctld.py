@@ -0,0 +1,128 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.app import ncd
+from netcontrold.lib import dataif
+from netcontrold.lib import event
+from netcontrold.lib import util
+
+
+class TestCtld_Server(TestCase):
+    """
+    Test for serving control commands to concurrent clients.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.sock_file = os.path.join(self.tmpdir, "ncd.sock")
+
+        nlog = logging.getLogger("test_ctld")
+        nlog.addHandler(logging.NullHandler())
+        log = event.EventLog(8)
+        log.append(("pmd", "rebalance", "t0"))
+        for (target, attr, val) in (
+                ('netcontrold.lib.config', 'ncd_socket', self.sock_file),
+                ('netcontrold.app.ncd', 'nlog', nlog),
+                ('netcontrold.app.ncd.RebalContext', 'rebal_mode', True),
+                ('netcontrold.lib.dataif.Context', 'events', log)):
+            patcher = mock.patch('%s.%s' % (target, attr), val)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.eobj = threading.Event()
+        self.ctld = ncd.CtlDThread(self.eobj)
+        self.ctld.daemon = True
+        self.ctld.start()
+        self.addCleanup(self.ctld.join)
+        self.addCleanup(self.eobj.set)
+
+        for i in range(100):
+            if os.path.exists(self.sock_file):
+                break
+            time.sleep(0.01)
+
+    # Test case:
+    #   several commands in one connection, check every reply is in
+    #   order, including unknown command and one longer than 24 chars.
+    def test_session(self):
+        session = util.CtlSession(self.sock_file)
+        self.addCleanup(session.close)
+
+        self.assertIn("rebalance", session.request(b"CTLD_STATUS"))
+        self.assertEqual(session.request(b"CTLD_REBAL_CNT"), "1")
+        self.assertIsNone(session.request(b"CTLD_TIMINGS_CLEAR"))
+        self.assertIsNone(session.request(b"CTLD_NO_SUCH_COMMAND"))
+        self.assertTrue(session.request(
+            b"CTLD_EVENTS 1234567890123456").endswith("next: 1\n"))
+
+    # Test case:
+    #   idle client holding its connection, check other client is
+    #   served meanwhile.
+    def test_idle_client(self):
+        idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        idle.connect(self.sock_file)
+        idle.sendall(b"CTLD_STA")
+        self.addCleanup(idle.close)
+
+        session = util.CtlSession(self.sock_file)
+        self.addCleanup(session.close)
+        session.sock.settimeout(5)
+        self.assertEqual(session.request(b"CTLD_REBAL_CNT"), "1")
+
+    # Test case:
+    #   read-only command and one switching a mode, check only the
+    #   latter persists mode flags in journal.
+    @mock.patch('netcontrold.app.ncd.TraceContext.trace_mode', False)
+    @mock.patch('netcontrold.lib.dataif.Context.log_handler',
+                logging.NullHandler())
+    @mock.patch('netcontrold.app.ncd.JournalContext.journal')
+    def test_journal_flags(self, mock_jnl):
+        self.ctld.handle("CTLD_REBAL_CNT")
+        mock_jnl.set_flags.assert_not_called()
+
+        self.ctld.handle("CTLD_TRACE_ON")
+        mock_jnl.set_flags.assert_called_once_with(ncd.journal_flags())
+
+    # Test case:
+    #   read-only command while main loop changes sampled state, check
+    #   it is replied only after main loop releases the state.
+    def test_read_during_sampling(self):
+        session = util.CtlSession(self.sock_file)
+        self.addCleanup(session.close)
+        session.sock.settimeout(5)
+
+        reply = []
+        client = threading.Thread(
+            target=lambda: reply.append(session.request(b"CTLD_REBAL_CNT")))
+
+        with dataif.Context.lock:
+            client.start()
+            client.join(0.2)
+            self.assertEqual(reply, [])
+
+        client.join(5)
+        self.assertEqual(reply, ["1"])
@@ -0,0 +1,123 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import copy
+from unittest import TestCase
+from unittest import mock
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+
+
+class TestCycRing(TestCase):
+    """
+    Test for aggregates of sampling slots.
+    """
+
+    # Test case:
+    #   write slots one by one, check total follows the slots.
+    def test_total(self):
+        ring = dataif.CycRing([0, ] * 4)
+        for i, val in enumerate([10, 40, 20, 30]):
+            ring[i] = val
+
+        self.assertEqual(ring.total, 100)
+
+        ring[1] = 5
+        self.assertEqual(ring.total, 65)
+
+        ring[:] = [1, 2, 3, 4]
+        self.assertEqual(ring.total, 10)
+
+        # copies keep their own aggregates.
+        ring_copy = copy.deepcopy(ring)
+        ring_copy[0] = 11
+        self.assertEqual(ring_copy.total, 20)
+        self.assertEqual(ring.total, 10)
+
+    # Test case:
+    #   partial and full windows of a counter, check delta uses only
+    #   the filled slots.
+    def test_delta(self):
+        ring = dataif.CycRing([0, ] * 4)
+        ring[0] = 100
+        ring[1] = 300
+        self.assertEqual(dataif.cyc_delta(ring, 1, 2), 200)
+
+        ring[2] = 350
+        ring[3] = 500
+        self.assertEqual(dataif.cyc_delta(ring, 3, 4), 400)
+
+    # Test case:
+    #   full window wrapped around the ring, check delta is latest
+    #   sample less the oldest one next to it.
+    def test_delta_wrapped(self):
+        ring = dataif.CycRing([70, 20, 30, 40, 50, 60])
+        self.assertEqual(dataif.cyc_delta(ring, 0, 6), 50)
+
+        ring[1] = 80
+        self.assertEqual(dataif.cyc_delta(ring, 1, 6), 50)
+
+    # Test case:
+    #   window partly filled or wrapped around the ring, check only
+    #   the intervals after the oldest sample are added up.
+    def test_window_sum_partial(self):
+        ring = dataif.CycRing([9, 40, 50, 60, 7, 8])
+        self.assertEqual(dataif.cyc_window_sum(ring, 3, 4), 150)
+        self.assertEqual(dataif.cyc_window_sum(ring, 3, 1), 0)
+
+        # partial and full windows wrapped around the ring.
+        self.assertEqual(dataif.cyc_window_sum(ring, 0, 3), 17)
+        self.assertEqual(dataif.cyc_window_sum(ring, 0, 6), 134)
+
+    # Test case:
+    #   move rxq between pmds in a long window, check load of pmds are
+    #   same as adding rxq cycles into every sample of the pmds.
+    @mock.patch.object(config, 'ncd_samples_max', 1000)
+    def test_move_rxq_long_window(self):
+        n = config.ncd_samples_max
+        pmd1 = dataif.Dataif_Pmd(1)
+        pmd2 = dataif.Dataif_Pmd(2)
+        rxq = dataif.Dataif_Rxq(0)
+        for i in range(n):
+            pmd1.rx_cyc[i] = i * 100
+            pmd1.proc_cpu_cyc[i] = i * 80
+            pmd1.idle_cpu_cyc[i] = i * 20
+            pmd2.rx_cyc[i] = i * 10
+            pmd2.proc_cpu_cyc[i] = i * 10
+            pmd2.idle_cpu_cyc[i] = i * 90
+            rxq.rx_cyc[i] = 50
+            rxq.cpu_cyc[i] = 40
+
+        pmd1.cyc_idx = pmd2.cyc_idx = n - 1
+        pmd1.cyc_n = pmd2.cyc_n = n
+
+        # moving rxq adds up cycles of n - 1 intervals of the window.
+        cpu = dataif.cyc_window_sum(rxq.cpu_cyc, pmd1.cyc_idx,
+                                    pmd1.cyc_n)
+        rx = dataif.cyc_window_sum(rxq.rx_cyc, pmd1.cyc_idx,
+                                   pmd1.cyc_n)
+        self.assertEqual(cpu, 40 * (n - 1))
+        self.assertEqual(rx, 50 * (n - 1))
+
+        pmd2.proc_cpu_adj += cpu
+        pmd2.idle_cpu_adj -= cpu
+        pmd2.rx_adj += rx
+        pmd1.proc_cpu_adj -= cpu
+        pmd1.idle_cpu_adj += cpu
+        pmd1.rx_adj -= rx
+
+        self.assertEqual(dataif.pmd_load(pmd1), 40.0)
+        self.assertEqual(dataif.pmd_load(pmd2), 50.0)
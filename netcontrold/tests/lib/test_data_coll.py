@@ -16,6 +16,8 @@
 from unittest import mock
 from unittest import TestCase
 
+from netcontrold.app import ncd
+from netcontrold.lib import config
 from netcontrold.lib import dataif
 import copy
 
@@ -329,6 +331,24 @@ class TestDataif_Collection(TestCase):
             expected_pmd_2,
             "pmd 2 stats to be matched")
 
+    # Test case:
+    #   getting pmd stats in two samples, check monotonic time of every
+    #   sample is stored in its slot.
+    @mock.patch('netcontrold.lib.util.exec_host_command', mock_pmd_stats)
+    @mock.patch('netcontrold.lib.util.time.monotonic')
+    def test_get_pmd_stats_ts(self, mock_mono):
+        mock_mono.side_effect = [10.0, 12.5]
+        pmd_map = dict()
+        dataif.get_pmd_stats(pmd_map)
+        dataif.get_pmd_stats(pmd_map)
+
+        pmd = pmd_map[1]
+        self.assertEqual(pmd.cyc_n, 2)
+        self.assertEqual(pmd.cyc_ts[0], 10.0)
+        self.assertEqual(pmd.cyc_ts[1], 12.5)
+        self.assertEqual(
+            dataif.cyc_elapsed(pmd.cyc_ts, pmd.cyc_idx, pmd.cyc_n), 2.5)
+
     # Test case:
     #   getting interface stats from get_interface_stats function and checking
     #   if declared port objects are modified or not
@@ -365,6 +385,50 @@ class TestDataif_Collection(TestCase):
         self.assertEqual(port2, expected_port2, "port 2 to be matched")
 
 
+class TestDataif_Affinity(TestCase):
+    """
+    Test for getting rxq affinity of interfaces.
+    """
+
+    def setUp(self):
+        dataif.Context.nlog = NlogNoop()
+
+    # Test case:
+    #   getting rxq affinity from get_interface_affinity function and
+    #   checking no affinity is reported for interfaces without it.
+    @mock.patch('netcontrold.lib.util.exec_host_command', mock_interface_stats)
+    def test_get_interface_affinity_1(self):
+        out = dataif.get_interface_affinity()
+
+        self.assertEqual(out, {'port1': None, 'port2': None})
+
+    # Test case:
+    #   getting rxq affinity from get_interface_affinity function and
+    #   checking affinity is reported for interface configured with it.
+    @mock.patch('netcontrold.lib.util.exec_host_command')
+    def test_get_interface_affinity_2(self, mock_cmd):
+        data = mock_interface_stats()
+        data = data.replace(
+            'other_config        : {}',
+            'other_config        : {pmd-rxq-affinity="0:1,1:13"}', 1)
+        mock_cmd.return_value = data
+
+        out = dataif.get_interface_affinity()
+
+        self.assertEqual(out, {'port1': "0:1,1:13", 'port2': None})
+
+    # Test case:
+    #   parsing rxq affinity in different order and format, and checking
+    #   same map of rxq and pmd is returned.
+    def test_parse_affinity_1(self):
+        out1 = dataif.parse_affinity("0:1,1:13,")
+        out2 = dataif.parse_affinity("1:13, 0:1")
+
+        self.assertEqual(out1, {0: 1, 1: 13})
+        self.assertEqual(out1, out2)
+        self.assertEqual(dataif.parse_affinity(None), {})
+
+
 class TestCoverageif_Collection(TestCase):
     """
     Test for getting coverage stats.
@@ -405,3 +469,30 @@ class TestCoverageif_Collection(TestCase):
             coverage,
             expected_coverage_1,
             "coverage object to be matched")
+
+    # Test case:
+    #   sample window resized to a larger one, check coverage samples
+    #   are taken afresh in the new window.
+    @mock.patch.object(config, 'ncd_samples_max', 2)
+    @mock.patch.object(dataif.Context, 'coverage_map', {})
+    @mock.patch('netcontrold.lib.util.exec_host_command', mock_coverage_stats)
+    def test_coverage_resize(self):
+        coverage_map = dataif.Context.coverage_map
+        for i in range(2):
+            dataif.get_coverage_stats(coverage_map)
+
+        ncd.resize_samples(6)
+        self.assertEqual(coverage_map, {})
+        for i in range(6):
+            dataif.get_coverage_stats(coverage_map)
+
+        coverage = coverage_map["coverage"]
+        self.assertEqual(len(coverage.upcall), 6)
+        self.assertEqual(coverage.index, 5)
+
+        # coverage sized for older window wraps within its own slots.
+        coverage_map["coverage"] = dataif.Dataif_Coverage()
+        config.ncd_samples_max = 8
+        for i in range(8):
+            dataif.get_coverage_stats(coverage_map)
+        self.assertEqual(coverage_map["coverage"].index, 2)
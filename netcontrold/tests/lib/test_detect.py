@@ -0,0 +1,117 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import TestCase
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import detect
+
+
+class TestDetect_Cusum(TestCase):
+    """
+    Test for CUSUM test on series of values.
+    """
+
+    # Test case:
+    #   values within drift of their mean, check test never fires.
+    def test_cusum_steady(self):
+        test = detect.Cusum(drift=5, limit=40)
+        for value in [50, 53, 48, 52, 47, 51, 50, 49] * 4:
+            self.assertFalse(test.update(value))
+
+    # Test case:
+    #   values step up suddenly, check test fires in that sample and
+    #   restarts from new level.
+    def test_cusum_step(self):
+        test = detect.Cusum(drift=5, limit=40)
+        for value in [20, 21, 19, 20]:
+            self.assertFalse(test.update(value))
+
+        self.assertTrue(test.update(90))
+        self.assertFalse(test.update(91))
+
+
+class TestDetect_Shift(TestCase):
+    """
+    Test for detecting sudden shift in pmd load, sample by sample.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.pmd = dataif.Dataif_Pmd(1)
+        self.pmd.numa_id = 0
+        self.pmd.cyc_n = 0
+        self.pmd.cyc_idx = config.ncd_samples_max - 1
+        self.pmd_map = {1: self.pmd}
+        self.detector = detect.ShiftDetector()
+
+    def sample(self, proc, idle):
+        pmd = self.pmd
+        prev_idx = pmd.cyc_idx
+        pmd.cyc_idx = (pmd.cyc_idx + 1) % config.ncd_samples_max
+        pmd.cyc_n = min(pmd.cyc_n + 1, config.ncd_samples_max)
+        pmd.proc_cpu_cyc[pmd.cyc_idx] = pmd.proc_cpu_cyc[prev_idx] + proc
+        pmd.idle_cpu_cyc[pmd.cyc_idx] = pmd.idle_cpu_cyc[prev_idx] + idle
+        return self.detector.update(self.pmd_map, {})
+
+    # Test case:
+    #   pmd load steady below threshold, check no shift is found.
+    def test_shift_none(self):
+        for i in range(0, 10):
+            self.assertEqual(self.sample(50, 50), [])
+
+    # Test case:
+    #   pmd load jumps above threshold, check shift is found in the
+    #   same sample.
+    def test_shift_threshold(self):
+        for i in range(0, 4):
+            self.assertEqual(self.sample(90, 10), [])
+
+        self.assertEqual(self.sample(99, 1), ["pmd 1"])
+
+    # Test case:
+    #   sample taken right after a cut, with much shorter interval,
+    #   check it is left out and the samples after are checked.
+    def test_skip_next(self):
+        for i in range(0, 4):
+            self.assertEqual(self.sample(50, 50), [])
+
+        self.detector.skip_next()
+        self.assertEqual(self.sample(1, 0), [])
+        self.assertEqual(self.sample(50, 50), [])
+        self.assertEqual(self.sample(99, 1), ["pmd 1"])
+
+    # Test case:
+    #   partial sampling window of a pmd, check load uses filled slots
+    #   only.
+    def test_partial_window(self):
+        self.sample(60, 40)
+        self.sample(60, 40)
+        self.sample(60, 40)
+
+        self.assertEqual(self.pmd.cyc_n, 3)
+        self.pmd.rx_cyc = [100, 200, 300, 0, 0, 0]
+        self.assertEqual(dataif.pmd_load(self.pmd), 60)
+
+    # Test case:
+    #   sampling index wrapped around a full window, check samples are
+    #   returned oldest first, partial or full.
+    def test_samples_wrapped(self):
+        cyc = [70, 80, 30, 40, 50, 60]
+        self.assertEqual(dataif.cyc_samples(cyc, 1, 6),
+                         [30, 40, 50, 60, 70, 80])
+        self.assertEqual(dataif.cyc_samples(cyc, 1, 3), [60, 70, 80])
+        self.assertEqual(dataif.cyc_samples(cyc, 5, 6), cyc)
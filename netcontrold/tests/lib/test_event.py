@@ -0,0 +1,71 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import TestCase
+
+from netcontrold.lib import event
+
+
+class TestEvent_Log(TestCase):
+    """
+    Test for bounded ring of events.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.log = event.EventLog(3)
+        self.log.append(("pmd", "rebalance", "t0"))
+        self.log.append(("dpdk0", "rx_drop", "t1"))
+        self.log.append(("pmd", "rebalance", "t2"))
+        self.log.append(["pmd", "rebalance", "t3"])
+
+    # Test case:
+    #   more events than ring size, check oldest is overwritten while
+    #   counts still include it.
+    def test_append(self):
+        self.assertEqual(len(self.log), 3)
+        self.assertEqual(list(self.log), [("dpdk0", "rx_drop", "t1"),
+                                          ("pmd", "rebalance", "t2"),
+                                          ("pmd", "rebalance", "t3")])
+        self.assertEqual(self.log.count("rebalance"), 3)
+        self.assertEqual(self.log.count("tx_drop"), 0)
+
+    # Test case:
+    #   query in pages, check cursor skips overwritten events and
+    #   resumes after the last event returned.
+    def test_query(self):
+        (evs, cursor) = self.log.query(0, 2)
+        self.assertEqual(evs, [("dpdk0", "rx_drop", "t1"),
+                               ("pmd", "rebalance", "t2")])
+        self.assertEqual(cursor, 3)
+
+        (evs, cursor) = self.log.query(cursor, 2)
+        self.assertEqual(evs, [("pmd", "rebalance", "t3")])
+        self.assertEqual(cursor, 4)
+
+        self.assertEqual(self.log.query(cursor), ([], 4))
+
+    # Test case:
+    #   check events are rendered as status rows, and cleared along
+    #   with their counts.
+    def test_rows_clear(self):
+        (rows, cursor) = self.log.rows(3)
+        self.assertEqual(rows, "%-16s | %-12s | %s\n"
+                         % ("pmd", "rebalance", "t3"))
+
+        self.log.clear()
+        self.assertEqual(len(self.log), 0)
+        self.assertEqual(self.log.count("rebalance"), 0)
+        self.assertEqual(self.log.rows(), ("", 0))
@@ -0,0 +1,76 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import hifreq
+
+_PMD_STATS = """pmd thread numa_id 0 core_id 1:
+  packets received: 1000
+  packet recirculations: 0
+  idle cycles: 1100 (93.95%)
+  processing cycles: 1200 (6.05%)
+pmd thread numa_id 0 core_id 13:
+  packets received: 3000
+  idle cycles: 3100 (87.83%)
+  processing cycles: 3200 (12.17%)
+main thread:
+  packets received: 108
+  idle cycles: 1 (0.00%)
+"""
+
+
+class TestHifreq_Parse(TestCase):
+    """
+    Test for parsing pmd counters in high-frequency mode.
+    """
+
+    # Test case:
+    #   two pmds and main thread in the stats, check only pmd counters
+    #   are returned.
+    def test_parse_pmd_counters(self):
+        out = hifreq.parse_pmd_counters(_PMD_STATS)
+        self.assertEqual(out, {1: (1000, 1100, 1200),
+                               13: (3000, 3100, 3200)})
+
+    # Test case:
+    #   vswitchd pid file available, check its unixctl socket is found.
+    @mock.patch('netcontrold.lib.hifreq.open',
+                mock.mock_open(read_data="4242\n"), create=True)
+    def test_unixctl_socket(self):
+        self.assertEqual(hifreq.unixctl_socket(),
+                         "/var/run/openvswitch/ovs-vswitchd.4242.ctl")
+
+
+class TestHifreq_Ring(TestCase):
+    """
+    Test for ring of high-frequency samples.
+    """
+
+    # Test case:
+    #   pmd busy in one interval among others, check summary reports
+    #   the burst as highest load.
+    def test_ring_summary(self):
+        ring = hifreq.HfRing(3)
+        ring.append(0.0, {1: (0, 0, 0)})
+        ring.append(0.2, {1: (100, 80, 20)})
+        ring.append(0.4, {1: (300, 80, 120)})
+        ring.append(0.6, {1: (400, 160, 140)})
+
+        # oldest sample is dropped once ring is full.
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.pmd_load(), {1: [100.0, 20.0]})
+        self.assertEqual(ring.summary(), {1: (20.0, 100.0, 60.0)})
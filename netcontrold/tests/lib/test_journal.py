@@ -0,0 +1,129 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+import shutil
+import tempfile
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import dataif
+from netcontrold.lib import event
+from netcontrold.lib import journal
+
+_FLAGS = {"trace_mode": False, "rebalance_mode": True, "verbose_log": False}
+
+
+class TestJournal_Replay(TestCase):
+    """
+    Test for appending and replaying journal of events and modes.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, "ncd.journal")
+
+    def open(self, **kwargs):
+        jnl = journal.Journal(self.path, sync_n=2, events_max=3, **kwargs)
+        self.addCleanup(jnl.close)
+        return jnl
+
+    # Test case:
+    #   events appended through event log and modes set, check they
+    #   are restored on reopening, without unchanged modes repeated.
+    def test_replay(self):
+        jnl = self.open()
+        log = event.EventLog(3)
+        log.journal = jnl
+        log.append(("pmd", "rebalance", "t0"))
+        jnl.set_flags(_FLAGS)
+        jnl.set_flags(_FLAGS)
+        log.clear()
+        for i in range(1, 5):
+            log.append(("pmd", "rebalance", "t%d" % i))
+        jnl.close()
+
+        (recs, end) = journal.read_records(self.path)
+        self.assertEqual(len(recs), 7)
+        self.assertEqual(end, os.path.getsize(self.path))
+
+        jnl = self.open()
+        self.assertEqual(list(jnl.events), [("pmd", "rebalance", "t2"),
+                                            ("pmd", "rebalance", "t3"),
+                                            ("pmd", "rebalance", "t4")])
+        self.assertEqual(jnl.flags, _FLAGS)
+
+    # Test case:
+    #   torn record at the end, check it is dropped and appends resume
+    #   after the last valid record.
+    def test_torn_tail(self):
+        jnl = self.open()
+        jnl.append_event(("dpdk0", "rx_drop", "t0"))
+        jnl.close()
+        valid = os.path.getsize(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(journal.encode_record({"t": "clear"})[:-1])
+
+        jnl = self.open()
+        self.assertEqual(list(jnl.events), [("dpdk0", "rx_drop", "t0")])
+        self.assertEqual(os.path.getsize(self.path), valid)
+        jnl.append_event(("dpdk0", "tx_drop", "t1"))
+        jnl.close()
+
+        jnl = self.open()
+        self.assertEqual(len(jnl.events), 2)
+
+    # Test case:
+    #   journal grown past its size, check it is compacted to retained
+    #   events and latest modes.
+    def test_compact(self):
+        jnl = self.open(size_max=256)
+        jnl.set_flags(_FLAGS)
+        for i in range(20):
+            jnl.append_event(("pmd", "rebalance", "t%d" % i))
+
+        self.assertTrue(os.path.getsize(self.path) <= 256)
+        jnl.close()
+
+        (recs, end) = journal.read_records(self.path)
+        self.assertEqual(recs[0], {"t": "flags", "flags": _FLAGS})
+        jnl = self.open()
+        self.assertEqual(list(jnl.events)[-1], ("pmd", "rebalance", "t19"))
+        self.assertEqual(jnl.flags, _FLAGS)
+
+    # Test case:
+    #   fsync failing, check event log keeps appending, error is logged
+    #   once and nothing more is journaled.
+    def test_write_error(self):
+        jnl = self.open()
+        log = event.EventLog(3)
+        log.journal = jnl
+        log.append(("pmd", "rebalance", "t0"))
+        nlog = mock.Mock()
+        with mock.patch.object(dataif.Context, 'nlog', nlog), \
+                mock.patch('netcontrold.lib.journal.os.fsync',
+                           side_effect=OSError(5, "I/O error")):
+            log.append(("pmd", "rebalance", "t1"))
+            log.append(("pmd", "rebalance", "t2"))
+            jnl.set_flags(_FLAGS)
+            jnl.sync()
+            jnl.compact()
+            jnl.close()
+
+        self.assertEqual(nlog.warn.call_count, 1)
+        self.assertEqual(len(log), 3)
+        self.assertEqual(len(journal.read_records(self.path)[0]), 2)
@@ -0,0 +1,92 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import TestCase
+
+from netcontrold.lib import dataif
+from netcontrold.lib import memtrack
+
+
+class _Ctx(object):
+    pmd_map = {}
+    events = []
+
+
+class TestMemtrack_Model(TestCase):
+    """
+    Test for counting model objects and ring buffers.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.pmd = dataif.Dataif_Pmd(1)
+        self.port_cls = dataif.make_dataif_port("virtport")
+        self.addCleanup(dataif.Context.port_to_cls.pop, "virtport", None)
+        port = self.pmd.add_port("virtport")
+        port.add_rxq(0)
+        port.add_rxq(1)
+
+    # Test case:
+    #   pmd with a port of two rxqs, check every model object and the
+    #   port class are counted.
+    def test_model_counts(self):
+        counts = memtrack.model_counts()
+        self.assertTrue(counts["Dataif_Pmd"] >= 1)
+        self.assertTrue(counts["Dataif_Rxq"] >= 2)
+        self.assertTrue(counts["Dataif_Port"] >= 1)
+        self.assertTrue(counts["Dataif_Port (class)"] >= 1)
+
+    # Test case:
+    #   check samples of pmd and rxqs and events are reported as ring
+    #   sizes.
+    def test_ring_sizes(self):
+        ctx = _Ctx()
+        ctx.pmd_map = {1: self.pmd}
+        ctx.events = [("ncd", "error", "now")]
+        sizes = memtrack.ring_sizes(ctx)
+        n = len(self.pmd.rx_cyc)
+        self.assertEqual(sizes, {"events": 1,
+                                 "pmd samples": n,
+                                 "rxq samples": 2 * n})
+
+
+class TestMemtrack_Tracker(TestCase):
+    """
+    Test for tracking allocations between snapshots.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.tracker = memtrack.MemTracker()
+        self.addCleanup(self.tracker.clear)
+
+    # Test case:
+    #   allocate after snapshot, check diff reports growth at this
+    #   file and nothing is reported once cleared.
+    def test_diff(self):
+        self.assertEqual(self.tracker.top(), [])
+        self.assertEqual(self.tracker.diff(), [])
+
+        self.tracker.take_snapshot()
+        self.leak = [bytearray(1024) for _ in range(100)]
+
+        diff = self.tracker.diff()
+        (where, (size, count)) = diff[0]
+        self.assertIn("test_memtrack.py", where)
+        self.assertTrue(size >= 100 * 1024)
+        self.assertTrue(self.tracker.top())
+
+        self.tracker.clear()
+        self.assertEqual(self.tracker.diff(), [])
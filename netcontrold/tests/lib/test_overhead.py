@@ -0,0 +1,84 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import overhead
+
+_STATUS = """Name:\tpython
+voluntary_ctxt_switches:\t120
+nonvoluntary_ctxt_switches:\t7
+"""
+
+
+class TestOverhead_Usage(TestCase):
+    """
+    Test for reading resources consumed by the process.
+    """
+
+    # Test case:
+    #   check context switches are read from proc status.
+    @mock.patch('netcontrold.lib.overhead.open',
+                mock.mock_open(read_data=_STATUS), create=True)
+    def test_ctx_switches(self):
+        self.assertEqual(overhead.ctx_switches(), (120, 7))
+
+    # Test case:
+    #   check usage formats cpu share of wall time.
+    def test_usage_str(self):
+        u = overhead.Usage(10.0, 0.3, 0.2, 1.0, 0.5, 12, 3)
+        self.assertEqual(overhead.usage_str(u),
+                         "wall 10.000s, cpu 0.500s (user 0.300s sys "
+                         "0.200s, 5.00%), child cpu 1.500s, "
+                         "ctx switches 12/3")
+
+
+class TestOverhead_Phase(TestCase):
+    """
+    Test for accounting resources in every phase.
+    """
+
+    # Test case:
+    #   two runs of a phase, check latest run and their sum are kept.
+    def test_record(self):
+        acct = overhead.Overhead()
+        acct.record("cycle", overhead.Usage(1, 2, 3, 4, 5, 6, 7))
+        acct.record("cycle", overhead.Usage(1, 1, 1, 1, 1, 1, 1))
+        (n, last, total) = acct.summary()["cycle"]
+        self.assertEqual(n, 2)
+        self.assertEqual(last, overhead.Usage(1, 1, 1, 1, 1, 1, 1))
+        self.assertEqual(total, overhead.Usage(2, 3, 4, 5, 6, 7, 8))
+
+    # Test case:
+    #   check block is recorded as a run of the phase.
+    @mock.patch('netcontrold.lib.overhead.overhead', overhead.Overhead())
+    def test_accounted(self):
+        with overhead.accounted("dry-run"):
+            sum(range(1000))
+
+        (n, last, total) = overhead.overhead.summary()["dry-run"]
+        self.assertEqual(n, 1)
+        self.assertTrue(last.wall >= 0)
+
+    # Test case:
+    #   check summary is due only once in every log interval.
+    @mock.patch('netcontrold.lib.config.ncd_overhead_log_interval', 60)
+    def test_log_due(self):
+        acct = overhead.Overhead()
+        acct.log_ts = 100
+        self.assertFalse(acct.log_due(159))
+        self.assertTrue(acct.log_due(160))
+        self.assertFalse(acct.log_due(200))
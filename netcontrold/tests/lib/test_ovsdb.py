@@ -0,0 +1,82 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import TestCase
+from unittest import mock
+
+from netcontrold.lib import ovsdb
+from netcontrold.lib.error import OsCommandExc
+
+
+class TestOvsdb_Affinity(TestCase):
+    """
+    Test for setting rxq affinity through OVSDB transaction.
+    """
+
+    # Test case:
+    #   one port to set affinity and other to remove it, check both are
+    #   in one transaction along with next_cfg bump.
+    def test_affinity_ops(self):
+        ops = ovsdb.affinity_ops({"virtport": "0:2,1:3", "dpdk0": None})
+
+        self.assertEqual(len(ops), 5)
+        self.assertEqual(ops[0]["where"], [["name", "==", "dpdk0"]])
+        self.assertEqual(len(ops[0]["mutations"]), 1)
+        self.assertEqual(ops[1]["where"], [["name", "==", "virtport"]])
+        self.assertEqual(ops[1]["mutations"][1],
+                         ["other_config", "insert",
+                          ["map", [["pmd-rxq-affinity", "0:2,1:3"]]]])
+        self.assertEqual(ops[2]["mutations"], [["next_cfg", "+=", 1]])
+        self.assertEqual(ops[3]["columns"], ["next_cfg"])
+
+    # Test case:
+    #   vswitchd catches up next_cfg after a poll, check it is reported
+    #   applied.
+    @mock.patch('netcontrold.lib.ovsdb.time.sleep')
+    @mock.patch('netcontrold.lib.jsonrpc.Connection.request')
+    def test_set_affinity(self, mock_req, mock_sleep):
+        mock_req.side_effect = [
+            [{"count": 1}, {"count": 1}, {"rows": [{"next_cfg": 7}]}, {}],
+            [{"rows": [{"cur_cfg": 6}]}],
+            [{"rows": [{"cur_cfg": 7}]}],
+        ]
+
+        self.assertTrue(ovsdb.set_affinity({"virtport": "0:2"},
+                                           "/nonexistent", 10))
+        self.assertEqual(mock_req.call_count, 3)
+        self.assertEqual(mock_req.call_args_list[0][0][0], "transact")
+
+    # Test case:
+    #   vswitchd does not catch up next_cfg within timeout, check it is
+    #   reported not applied.
+    @mock.patch('netcontrold.lib.jsonrpc.Connection.request')
+    def test_set_affinity_timeout(self, mock_req):
+        mock_req.side_effect = [
+            [{"count": 1}, {"count": 1}, {"rows": [{"next_cfg": 7}]}, {}],
+            [{"rows": [{"cur_cfg": 6}]}],
+        ]
+
+        self.assertFalse(ovsdb.set_affinity({"virtport": "0:2"},
+                                            "/nonexistent", 0))
+
+    # Test case:
+    #   transaction failed in OVSDB server, check it is raised.
+    @mock.patch('netcontrold.lib.jsonrpc.Connection.request')
+    def test_set_affinity_error(self, mock_req):
+        mock_req.return_value = [{"count": 1},
+                                 {"error": "constraint violation"}]
+
+        self.assertRaises(OsCommandExc, ovsdb.set_affinity,
+                          {"virtport": "0:2"}, "/nonexistent", 10)
@@ -0,0 +1,70 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import perf
+from netcontrold.lib import util
+
+
+class TestPerf_Histogram(TestCase):
+    """
+    Test for latency histogram.
+    """
+
+    # Test case:
+    #   hundred latencies of 1 ms and one of 1 sec, check percentiles
+    #   are within resolution of the buckets.
+    def test_percentile(self):
+        hist = perf.Histogram()
+        for i in range(99):
+            hist.record(0.001)
+        hist.record(1.0)
+
+        self.assertEqual(hist.count, 100)
+        self.assertEqual(hist.max, 1.0)
+        self.assertGreaterEqual(hist.percentile(50), 0.001)
+        self.assertLess(hist.percentile(50), 0.0012)
+        self.assertLess(hist.percentile(99), 0.0012)
+        self.assertEqual(hist.percentile(100), 1.0)
+        self.assertEqual(perf.Histogram().percentile(50), 0.0)
+
+
+class TestPerf_Timings(TestCase):
+    """
+    Test for timing phases of the daemon.
+    """
+
+    # setup test environment
+    def setUp(self):
+        perf.timings.clear()
+
+    # Test case:
+    #   function and host command timed, check both phases are found.
+    @mock.patch('netcontrold.lib.util.run_host_command',
+                return_value="out")
+    def test_timed(self, mock_run):
+        @perf.timed("phase_a")
+        def phase_a():
+            return util.exec_host_command("ovs-vsctl --no-wait -- set x")
+
+        self.assertEqual(phase_a(), "out")
+        self.assertEqual(phase_a.__name__, "phase_a")
+
+        summary = perf.timings.summary()
+        self.assertEqual(sorted(summary.keys()),
+                         ["exec ovs-vsctl set", "phase_a"])
+        self.assertEqual(summary["phase_a"][0], 1)
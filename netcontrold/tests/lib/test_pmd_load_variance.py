@@ -319,3 +319,55 @@ class Test_pmd_load_variance_TwoPmd(TestCase):
         self.assertEqual(int(variance_value), 17)
         pmd1.del_port('virtport1')
         pmd2.del_port('virtport2')
+
+
+class Test_pmd_load_score_TwoPmd(Test_pmd_load_variance_TwoPmd):
+    """
+    Test load score for rxqs of lossy ports handled by two pmds.
+    """
+
+    # Test case:
+    #   With two threads from same numa, each handling one single-queued
+    #   port, where no port drops packets, check score is same as variance.
+    def test_one_rxq_nodrop(self):
+        pmd1 = self.pmd_map[self.core1_id]
+        pmd2 = self.pmd_map[self.core2_id]
+
+        fx_2pmd_for_1rxq_each(self)
+
+        dataif.update_pmd_load(self.pmd_map)
+        variance_value = dataif.pmd_load_variance(self.pmd_map)
+        score_value = dataif.pmd_load_score(self.pmd_map)
+
+        self.assertEqual(score_value, variance_value)
+
+        pmd1.del_port('virtport1')
+        pmd2.del_port('virtport2')
+
+    # Test case:
+    #   With two threads from same numa, each handling one single-queued
+    #   port, where port in less loaded pmd drops packets, check score
+    #   accounts drops as extra load on that pmd.
+    def test_one_rxq_drop(self):
+        pmd1 = self.pmd_map[self.core1_id]
+        pmd2 = self.pmd_map[self.core2_id]
+
+        fx_2pmd_for_1rxq_each(self)
+
+        # 1 % drop of packets in rx of the port in pmd2.
+        port2 = pmd2.find_port_by_name('virtport2')
+        port2.rx_cyc = [(100000 * (i + 1))
+                        for i in range(0, config.ncd_samples_max)]
+        port2.rx_drop_cyc = [(1000 * (i + 1))
+                             for i in range(0, config.ncd_samples_max)]
+
+        dataif.update_pmd_load(self.pmd_map)
+        penalty = dataif.pmd_drop_penalty(self.pmd_map)
+
+        self.assertEqual(penalty[self.core1_id], 0)
+        self.assertEqual(round(penalty[self.core2_id]), 10)
+        self.assertLess(dataif.pmd_load_score(self.pmd_map),
+                        dataif.pmd_load_variance(self.pmd_map))
+
+        pmd1.del_port('virtport1')
+        pmd2.del_port('virtport2')
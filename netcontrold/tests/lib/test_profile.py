@@ -0,0 +1,91 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import profile
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+class TestProfile_Profiler(TestCase):
+    """
+    Test for on-demand profiler of main loop.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        patcher = mock.patch('netcontrold.lib.config.ncd_profile_dir',
+                             self.tmpdir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.eobj = threading.Event()
+
+    # Test case:
+    #   sample stack of a busy thread, check collapsed stacks are
+    #   written with its function in them.
+    def test_stack_sample(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy_loop, args=(stop,))
+        worker.start()
+
+        prof = profile.Profiler()
+        path = prof.start(profile.MODE_SAMPLE, self.eobj, worker.ident)
+        self.assertTrue(path.endswith(".folded"))
+        self.assertIsNone(prof.start(profile.MODE_SAMPLE, self.eobj))
+
+        stop.wait(0.1)
+        self.assertEqual(prof.stop(), path)
+        stop.set()
+        worker.join()
+
+        with open(path) as f:
+            lines = f.read().splitlines()
+
+        self.assertTrue(lines)
+        for line in lines:
+            (stack, count) = line.rsplit(" ", 1)
+            self.assertIn("test_profile.py:_busy_loop", stack)
+            self.assertTrue(int(count) > 0)
+
+    # Test case:
+    #   cprofile started and stopped, check stats are dumped only once
+    #   the profiled thread polls.
+    def test_cprofile(self):
+        prof = profile.Profiler()
+        path = prof.start(profile.MODE_CPROFILE, self.eobj)
+        self.assertTrue(path.endswith(".pstats"))
+
+        prof.poll()
+        sorted([3, 1, 2])
+        self.assertEqual(prof.stop(), path)
+        self.assertIsNone(prof.stop())
+        self.assertFalse(os.path.exists(path))
+
+        prof.poll()
+        stats = pstats.Stats(path)
+        funcs = [func for (fname, line, func) in stats.stats.keys()]
+        self.assertIn("<built-in method builtins.sorted>", funcs)
@@ -0,0 +1,185 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import TestCase
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import rebal
+
+
+# A noop handler for netcontrold logging.
+class NlogNoop(object):
+
+    def info(self, *args):
+        None
+
+    def debug(self, *args):
+        None
+
+
+class TestRebal_plan(TestCase):
+    """
+    Test for rxq moves found in pmds after dry-run.
+    """
+
+    # setup test environment
+    def setUp(self):
+        dataif.Context.nlog = NlogNoop()
+
+        self.pmd_map = dict()
+        for pmd_id in (1, 2, 3):
+            pmd = dataif.Dataif_Pmd(pmd_id)
+            pmd.numa_id = 0
+            self.pmd_map[pmd_id] = pmd
+
+        dataif.make_dataif_port('planport')
+
+    # Test case:
+    #   rxq moved from one pmd into other, check the move is reported.
+    def test_plan_one_move(self):
+        port = self.pmd_map[1].add_port('planport')
+        port.rxq_rebalanced[0] = 2
+
+        plan = dataif.rebalance_plan(self.pmd_map)
+        self.assertEqual(plan, {('planport', 0): (1, 2)})
+
+    # Test case:
+    #   rxq moved twice in repeated dry-runs, check only the origin and
+    #   final pmd are reported.
+    def test_plan_chained_move(self):
+        port1 = self.pmd_map[1].add_port('planport')
+        port1.rxq_rebalanced[0] = 2
+        port2 = self.pmd_map[2].add_port('planport')
+        port2.rxq_rebalanced[0] = 3
+
+        plan = dataif.rebalance_plan(self.pmd_map)
+        self.assertEqual(plan, {('planport', 0): (1, 3)})
+
+    # Test case:
+    #   rxq moved into other pmd and back into its pmd, check no move
+    #   is reported.
+    def test_plan_move_back(self):
+        port1 = self.pmd_map[1].add_port('planport')
+        port1.rxq_rebalanced[0] = 2
+        port2 = self.pmd_map[2].add_port('planport')
+        port2.rxq_rebalanced[0] = 1
+
+        plan = dataif.rebalance_plan(self.pmd_map)
+        self.assertEqual(plan, {})
+
+
+class TestRebal_controller(TestCase):
+    """
+    Test for deciding rebalance with hysteresis.
+    """
+
+    # setup test environment
+    def setUp(self):
+        dataif.Context.nlog = NlogNoop()
+        self.ctrl = rebal.RebalController()
+        self.moves = {('port1', 0): (1, 2)}
+
+    # Test case:
+    #   improvement above minimum, check rebalance is decided.
+    def test_decide_improve(self):
+        self.assertTrue(self.ctrl.decide(self.moves, 100, 40, now=0))
+
+    # Test case:
+    #   improvement below minimum, check rebalance is skipped.
+    def test_decide_no_improve(self):
+        self.assertFalse(self.ctrl.decide(self.moves, 100, 90, now=0))
+
+    # Test case:
+    #   improvement above minimum but not above the stricter threshold
+    #   soon after last rebalance, check rebalance is skipped until
+    #   cooldown elapses.
+    def test_decide_cooldown(self):
+        self.ctrl.record({('port2', 0): (1, 2)}, 100, 40, now=0)
+
+        now = config.ncd_rebal_cooldown - 1
+        self.assertFalse(self.ctrl.decide(self.moves, 100, 60, now=now))
+
+        now = config.ncd_rebal_cooldown
+        self.assertTrue(self.ctrl.decide(self.moves, 100, 60, now=now))
+
+    # Test case:
+    #   rxq moved recently, check it is on hold only until its cooldown.
+    def test_rxq_on_hold(self):
+        self.ctrl.record(self.moves, 100, 40, now=0)
+
+        now = config.ncd_rxq_cooldown - 1
+        self.assertEqual(self.ctrl.rxq_on_hold(now), {('port1', 0)})
+
+        now = config.ncd_rxq_cooldown
+        self.assertEqual(self.ctrl.rxq_on_hold(now), set())
+
+    # Test case:
+    #   rxq moving back into the pmd it left, check rebalance is skipped
+    #   and the rxq is held for flapping.
+    def test_decide_flap(self):
+        self.ctrl.record(self.moves, 100, 40, now=0)
+
+        now = config.ncd_rebal_cooldown
+        moves = {('port1', 0): (2, 1)}
+        self.assertFalse(self.ctrl.decide(moves, 100, 10, now=now))
+
+        now = config.ncd_rxq_flap_hold - 1
+        self.assertIn(('port1', 0), self.ctrl.rxq_on_hold(now))
+
+    # Test case:
+    #   plan rolled back, check its rxqs are no more in cooldown while
+    #   rxq moved by a later plan is.
+    def test_revert(self):
+        plan = self.ctrl.record(self.moves, 100, 40, now=0)
+        self.ctrl.record({('port2', 0): (1, 2)}, 100, 40, now=1)
+        self.ctrl.revert(plan)
+        self.assertEqual(self.ctrl.rxq_on_hold(2), {('port2', 0)})
+
+
+class TestRebal_order_moves(TestCase):
+    """
+    Test for ordering rxq moves by their benefit.
+    """
+
+    # setup test environment
+    def setUp(self):
+        dataif.Context.nlog = NlogNoop()
+
+        self.pmd_map = dict()
+        for pmd_id in (1, 2, 3):
+            pmd = dataif.Dataif_Pmd(pmd_id)
+            pmd.numa_id = 0
+            self.pmd_map[pmd_id] = pmd
+
+        dataif.make_dataif_port('orderport')
+
+    # Test case:
+    #   two rxqs moved out of a busy pmd, check the one moving into the
+    #   least loaded pmd is ordered first, though it has less cycles.
+    def test_order_two_moves(self):
+        port2 = self.pmd_map[2].add_port('orderport')
+        rxq0 = port2.add_rxq(0)
+        rxq0.cpu_cyc = [10, ] * config.ncd_samples_max
+
+        port3 = self.pmd_map[3].add_port('orderport')
+        rxq1 = port3.add_rxq(1)
+        rxq1.cpu_cyc = [20, ] * config.ncd_samples_max
+
+        moves = {('orderport', 0): (1, 2), ('orderport', 1): (1, 3)}
+        pmd_load = {1: 96, 2: 50, 3: 80}
+
+        out = rebal.order_moves(self.pmd_map, moves, pmd_load)
+        self.assertEqual(out, [('orderport', 0), ('orderport', 1)])
@@ -0,0 +1,125 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import TestCase
+
+from netcontrold.lib import dataif
+from netcontrold.lib import rollup
+
+
+class TestRollup_Tier(TestCase):
+    """
+    Test for downsampled history of a value.
+    """
+
+    # Test case:
+    #   values in two buckets, check lowest, mean, highest and count
+    #   of each bucket.
+    def test_tier_buckets(self):
+        tier = rollup.RollupTier(60, 4)
+        for (ts, val) in [(0, 10), (20, 30), (40, 20), (70, 50)]:
+            tier.add(ts, val)
+
+        self.assertEqual(tier.query(0, 120),
+                         [(0, 10.0, 20.0, 30.0, 3),
+                          (60, 50.0, 50.0, 50.0, 1)])
+
+    # Test case:
+    #   values beyond number of buckets, check expired buckets are
+    #   reused and not reported.
+    def test_tier_wrap(self):
+        tier = rollup.RollupTier(60, 2)
+        for ts in [0, 60, 120]:
+            tier.add(ts, ts)
+
+        self.assertEqual(tier.query(0, 179),
+                         [(60, 60.0, 60.0, 60.0, 1),
+                          (120, 120.0, 120.0, 120.0, 1)])
+        self.assertEqual(len(tier.bucket), 2)
+
+    # Test case:
+    #   values in few buckets, check only those buckets are allocated.
+    def test_tier_lazy(self):
+        tier = rollup.RollupTier(60, 1440)
+        for ts in [0, 30, 60]:
+            tier.add(ts, ts)
+
+        self.assertEqual(len(tier.bucket), 2)
+        self.assertEqual([b[0] for b in tier.query(0, 119)], [0, 60])
+
+    # Test case:
+    #   query for short and long time, check finest tier covering the
+    #   time is used.
+    def test_rollup_tier_choice(self):
+        roll = rollup.Rollup([(600, 6), (60, 10)])
+        for ts in range(0, 3600, 30):
+            roll.add(ts, 1)
+
+        self.assertEqual(len(roll.query(3000, 3599)), 10)
+        self.assertEqual(roll.query(3000, 3599)[0][4], 2)
+        self.assertEqual(len(roll.query(0, 3599)), 6)
+        self.assertEqual(roll.query(0, 3599)[0][4], 20)
+        self.assertEqual(roll.query(3000, 3599, 7), [])
+
+
+class TestRollup_Store(TestCase):
+    """
+    Test for history of pmds and rxqs.
+    """
+
+    # Test case:
+    #   pmd with one rxq sampled twice, check load of both are added
+    #   into history.
+    def test_store_feed(self):
+        dataif.make_dataif_port("virtport")
+        pmd = dataif.Dataif_Pmd(1)
+        port = pmd.add_port("virtport", 0)
+        rxq = port.add_rxq(0)
+        pmd.cyc_n = 2
+        pmd.cyc_idx = 1
+        pmd.proc_cpu_cyc[1] = 40
+        pmd.idle_cpu_cyc[1] = 60
+        rxq.cpu_cyc[1] = 10
+
+        store = rollup.RollupStore([(60, 2)])
+        store.feed(30, {1: pmd}, {})
+        out = store.query(0, 59)
+        self.assertEqual(out[("pmd", 1)], [(0, 40.0, 40.0, 40.0, 1)])
+        self.assertEqual(out[("rxq", "virtport", 0)],
+                         [(0, 10.0, 10.0, 10.0, 1)])
+
+    # Test case:
+    #   pmd sampled with no rxq, as in the first sample after reset,
+    #   check history of rxq is kept until it is not sampled for as
+    #   long as the finest tier spans.
+    def test_store_prune(self):
+        dataif.make_dataif_port("virtport")
+        pmd = dataif.Dataif_Pmd(1)
+        port = pmd.add_port("virtport", 0)
+        port.add_rxq(0)
+        pmd.cyc_n = 2
+
+        store = rollup.RollupStore([(60, 2)])
+        store.feed(30, {1: pmd}, {})
+        self.assertIn(("rxq", "virtport", 0), store.rollup_map)
+
+        pmd.port_map.clear()
+        store.feed(90, {1: pmd}, {})
+        self.assertEqual(len(store.query(0, 119)[("rxq", "virtport", 0)]),
+                         1)
+
+        store.feed(151, {1: pmd}, {})
+        self.assertEqual(list(store.rollup_map.keys()), [("pmd", 1)])
+        self.assertEqual(len(store.query(60, 179)[("pmd", 1)]), 2)
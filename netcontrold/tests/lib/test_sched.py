@@ -0,0 +1,64 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import TestCase
+
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import sched
+
+
+class TestSched_Interval(TestCase):
+    """
+    Test for adapting sampling interval to pmd load.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.pmd = dataif.Dataif_Pmd(1)
+        self.pmd.numa_id = 0
+        self.pmd.cyc_n = 0
+        self.pmd.cyc_idx = config.ncd_samples_max - 1
+        self.pmd_map = {1: self.pmd}
+        self.sched = sched.SampleScheduler(1, 8, 2)
+
+    def sample(self, proc, idle):
+        pmd = self.pmd
+        prev_idx = pmd.cyc_idx
+        pmd.cyc_idx = (pmd.cyc_idx + 1) % config.ncd_samples_max
+        pmd.cyc_n = min(pmd.cyc_n + 1, config.ncd_samples_max)
+        pmd.proc_cpu_cyc[pmd.cyc_idx] = pmd.proc_cpu_cyc[prev_idx] + proc
+        pmd.idle_cpu_cyc[pmd.cyc_idx] = pmd.idle_cpu_cyc[prev_idx] + idle
+        return self.sched.next_interval(self.pmd_map)
+
+    # Test case:
+    #   pmd steady below threshold, check interval backs off up to its
+    #   longest.
+    def test_interval_backoff(self):
+        self.assertEqual(self.sample(30, 70), 2)
+        self.assertEqual(self.sample(30, 70), 4)
+        self.assertEqual(self.sample(31, 69), 8)
+        self.assertEqual(self.sample(30, 70), 8)
+
+    # Test case:
+    #   pmd load changes or nears threshold, check interval drops to
+    #   its shortest.
+    def test_interval_busy(self):
+        self.sample(30, 70)
+        self.assertEqual(self.sample(30, 70), 4)
+        self.assertEqual(self.sample(60, 40), 1)
+        self.assertEqual(self.sample(60, 40), 2)
+        self.assertEqual(self.sample(90, 10), 1)
+        self.assertEqual(self.sample(90, 10), 1)
@@ -0,0 +1,179 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+import shutil
+import signal
+import tempfile
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.app import ncd
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import error
+from netcontrold.lib import snapshot
+
+_PMD_RXQ = """pmd thread numa_id 0 core_id 1:
+  isolated : false
+  port: dpdk0             queue-id:  0 (enabled)   pmd usage: 40 %
+pmd thread numa_id 0 core_id 2:
+  isolated : false
+  port: dpdk0             queue-id:  1 (enabled)   pmd usage: 20 %
+"""
+
+
+class _Clock(object):
+
+    def __init__(self, now, wall):
+        self.t_now = now
+        self.t_wall = wall
+
+    def now(self):
+        return self.t_now
+
+    def wall(self):
+        return self.t_wall
+
+
+class TestSnapshot_Restore(TestCase):
+    """
+    Test for saving and restoring samples across restart.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, "ncd.snapshot")
+
+        for (attr, val) in (('pmd_map', {}), ('port_to_cls', {}),
+                            ('port_to_id', {}), ('coverage_map', {}),
+                            ('clock', _Clock(1000.0, 5000.0))):
+            patcher = mock.patch.object(dataif.Context, attr, val)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        ctx = dataif.Context
+        port_cls = dataif.make_dataif_port("dpdk0")
+        port_cls.id = "3"
+        port_cls.rebalance = True
+        port_cls.rx_cyc[1] = 500
+        port_cls.cyc_ts = [990.0, ] * config.ncd_samples_max
+        ctx.port_to_id["dpdk0"] = 3
+
+        for (pmd_id, qid) in ((1, 0), (2, 1)):
+            pmd = dataif.Dataif_Pmd(pmd_id)
+            pmd.numa_id = 0
+            pmd.isolated = False
+            pmd.cyc_idx = 2
+            pmd.cyc_ts = [995.0, ] * config.ncd_samples_max
+            pmd.proc_cpu_cyc[2] = 300 * pmd_id
+            port = pmd.add_port("dpdk0", 3, 0)
+            rxq = port.add_rxq(qid)
+            rxq.pmd = pmd
+            rxq.enabled = True
+            rxq.cpu_cyc[2] = 100 * pmd_id
+            ctx.pmd_map[pmd_id] = pmd
+
+        snapshot.save(self.path, ctx)
+
+    # Test case:
+    #   ncd stopped and restarted after saving samples, check affinity
+    #   is removed in rebalanced port only when stopped.
+    @mock.patch('netcontrold.app.ncd.JournalContext.journal', None)
+    @mock.patch('netcontrold.app.ncd.nlog', logging.getLogger("test"))
+    @mock.patch('netcontrold.lib.util.exec_host_command')
+    def test_kill_affinity(self, mock_cmd):
+        mock_cmd.return_value = 0
+        self.assertIn("dpdk0", dataif.Context.port_to_cls)
+        with mock.patch.object(config, 'ncd_snapshot_file', self.path):
+            with self.assertRaises(error.NcdShutdownExc):
+                ncd.ncd_kill(signal.SIGTERM, None)
+            mock_cmd.assert_called_once_with(
+                "ovs-vsctl --no-wait "
+                "-- remove Interface dpdk0 other_config pmd-rxq-affinity ")
+
+            mock_cmd.reset_mock()
+            with self.assertRaises(error.NcdShutdownExc):
+                ncd.ncd_kill(signal.SIGHUP, None)
+            mock_cmd.assert_not_called()
+
+        self.assertTrue(os.path.exists(self.path))
+
+    # Test case:
+    #   saved and restored 20 sec later, check samples and their times
+    #   are restored, with port classes rebuilt.
+    def test_restore(self):
+        ctx = dataif.Context
+        ctx.pmd_map.clear()
+        ctx.port_to_cls.clear()
+        ctx.port_to_id.clear()
+        ctx.clock = _Clock(50.0, 5020.0)
+
+        state = snapshot.load(self.path)
+        snapshot.restore(state, ctx)
+
+        self.assertEqual(sorted(ctx.pmd_map.keys()), [1, 2])
+        pmd = ctx.pmd_map[2]
+        self.assertEqual(pmd.cyc_idx, 2)
+        self.assertEqual(pmd.proc_cpu_cyc.total, 600)
+        self.assertEqual(pmd.cyc_ts[0], 25.0)
+
+        rxq = pmd.find_port_by_name("dpdk0").find_rxq_by_id(1)
+        self.assertIs(rxq.pmd, pmd)
+        self.assertEqual(rxq.cpu_cyc.total, 200)
+
+        port_cls = ctx.port_to_cls["dpdk0"]
+        self.assertTrue(port_cls.rebalance)
+        self.assertEqual(port_cls.id, "3")
+        self.assertEqual(port_cls.rx_cyc[1], 500)
+        self.assertEqual(port_cls.cyc_ts[0], 20.0)
+        self.assertEqual(ctx.port_to_id, {"dpdk0": 3})
+
+    # Test case:
+    #   check snapshot is restored only when vswitchd and its rxq
+    #   placement are unchanged, and snapshot is recent.
+    @mock.patch('netcontrold.lib.snapshot.vswitchd_pid', return_value=None)
+    @mock.patch('netcontrold.lib.util.exec_host_command',
+                return_value=_PMD_RXQ)
+    def test_check(self, mock_cmd, mock_pid):
+        ctx = dataif.Context
+        state = snapshot.load(self.path)
+        topo = snapshot.topology()
+        self.assertEqual(topo, [[1, 0, "dpdk0", 0], [2, 0, "dpdk0", 1]])
+        self.assertIsNone(snapshot.check(state, ctx, topo))
+
+        self.assertEqual(snapshot.check(state, ctx, topo[:1]),
+                         "pmd or rxq topology changed")
+
+        mock_pid.return_value = 4242
+        self.assertEqual(snapshot.check(state, ctx, topo),
+                         "vswitchd restarted")
+
+        ctx.clock = _Clock(1000.0, 6000.0)
+        self.assertEqual(snapshot.check(state, ctx, topo),
+                         "snapshot is 1000 sec old")
+
+    # Test case:
+    #   check corrupt snapshot is not loaded.
+    def test_load_corrupt(self):
+        with open(self.path, 'r+b') as f:
+            f.seek(12)
+            f.write(b"\xff\xff\xff")
+
+        self.assertIsNone(snapshot.load(self.path))
+        self.assertIsNone(snapshot.load(self.path + ".none"))
@@ -0,0 +1,122 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import errno
+import os
+import shutil
+import tempfile
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import dataif
+from netcontrold.lib import tsstore
+
+
+class TestTsStore(TestCase):
+    """
+    Test for store of collected samples.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    # cleanup test environment
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # Test case:
+    #   pmd with one rxq sampled, check records are read back while
+    #   store is still open.
+    def test_feed_read(self):
+        dataif.make_dataif_port("virtport")
+        pmd = dataif.Dataif_Pmd(1)
+        port = pmd.add_port("virtport", 0)
+        rxq = port.add_rxq(2)
+        pmd.cyc_idx = 1
+        pmd.rx_cyc[1] = 10
+        pmd.idle_cpu_cyc[1] = 20
+        pmd.proc_cpu_cyc[1] = 30
+        rxq.rx_cyc[1] = 4
+        rxq.cpu_cyc[1] = 5
+
+        store = tsstore.TsStore(self.path, 4096, 8192)
+        store.feed(100.0, {1: pmd}, {})
+
+        reader = tsstore.TsReader(self.path)
+        out = list(reader.records())
+        self.assertEqual(out, [
+            tsstore.Record(100.0, tsstore.KIND_PMD, 1, "",
+                           (10, 20, 30, 0, 0), False),
+            tsstore.Record(100.0, tsstore.KIND_RXQ, 2, "virtport",
+                           (4, 5, 0, 0, 0), False)])
+        self.assertEqual(
+            len(list(reader.records(kind=tsstore.KIND_RXQ))), 1)
+        store.close()
+
+    # Test case:
+    #   records beyond size of the store, check oldest segments are
+    #   removed and only newer records are read.
+    def test_retention(self):
+        store = tsstore.TsStore(self.path, 1024, 2048)
+        n = 100
+        for i in range(n):
+            store.append(float(i), tsstore.KIND_PORT, -1, "virtport",
+                         (i, ))
+        store.close()
+
+        reader = tsstore.TsReader(self.path)
+        self.assertEqual(len(reader.segments()), 2)
+        out = list(reader.records())
+        self.assertEqual(out[-1].counters[0], n - 1)
+        self.assertLess(len(out), n)
+        self.assertEqual([r.ts for r in reader.records(start=95)],
+                         [95.0, 96.0, 97.0, 98.0, 99.0])
+
+        # new store continues after the existing segments.
+        store = tsstore.TsStore(self.path, 1024, 2048)
+        store.append(200.0, tsstore.KIND_PMD, 1, "", (1, 2, 3))
+        store.close()
+        self.assertEqual(list(reader.records())[-1].ts, 200.0)
+
+    # Test case:
+    #   long port names sharing their prefix, one with multibyte chars
+    #   across the cut, check names are cut at a char boundary and
+    #   flagged, while short names are kept whole.
+    def test_long_name(self):
+        prefix = "x" * 63
+        names = ["vhu-short", prefix + "a1", prefix + "a2",
+                 prefix + "\u00e9\u00e9"]
+        store = tsstore.TsStore(self.path, 4096, 8192)
+        for name in names:
+            store.append(1.0, tsstore.KIND_PORT, -1, name, (1, ))
+        store.close()
+
+        out = list(tsstore.TsReader(self.path).records())
+        self.assertEqual([(r.name, r.truncated) for r in out],
+                         [("vhu-short", False), (prefix + "a", True),
+                          (prefix + "a", True), (prefix, True)])
+
+    # Test case:
+    #   no space to allocate a segment, check append fails with an
+    #   error and no segment is left behind.
+    @mock.patch('os.posix_fallocate')
+    def test_no_space(self, mock_falloc):
+        mock_falloc.side_effect = OSError(errno.ENOSPC, "No space")
+        store = tsstore.TsStore(self.path, 1024, 2048)
+        with self.assertRaises(OSError):
+            store.append(1.0, tsstore.KIND_PMD, 1, "", (1, 2, 3))
+
+        self.assertEqual(os.listdir(self.path), [])
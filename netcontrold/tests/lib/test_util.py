@@ -262,3 +262,22 @@ class TestUtil_rr_cpu_in_numa(TestCase):
         out = util.rr_cpu_in_numa()
         expected = [0, 2, 1, 3]
         self.assertEqual(out, expected)
+
+
+class TestUtil_Clock(TestCase):
+
+    # Test case:
+    #   deadline ahead, check clock sleeps only the remaining time.
+    @mock.patch('netcontrold.lib.util.time.sleep')
+    @mock.patch('netcontrold.lib.util.time.monotonic', return_value=100.0)
+    def test_clock_sleep_until(self, mock_mono, mock_sleep):
+        util.Clock().sleep_until(102.5)
+        mock_sleep.assert_called_once_with(2.5)
+
+    # Test case:
+    #   deadline past already, check clock does not sleep.
+    @mock.patch('netcontrold.lib.util.time.sleep')
+    @mock.patch('netcontrold.lib.util.time.monotonic', return_value=100.0)
+    def test_clock_sleep_until_past(self, mock_mono, mock_sleep):
+        util.Clock().sleep_until(99.0)
+        mock_sleep.assert_not_called()
@@ -0,0 +1,120 @@
+#
+#  Copyright (c) 2020 Red Hat, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at:
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+from unittest import mock
+from unittest import TestCase
+
+from netcontrold.lib import capture
+from netcontrold.lib import config
+from netcontrold.lib import dataif
+from netcontrold.lib import util
+from netcontrold.sim import switch
+from netcontrold.sim import traffic
+
+
+class NlogNoop(object):
+
+    def info(self, *args):
+        pass
+
+    def debug(self, *args):
+        pass
+
+
+class TestSim_Traffic(TestCase):
+    """
+    Test for traffic generators.
+    """
+
+    # Test case:
+    #   check rate of bursty and diurnal traffic over their period.
+    def test_traffic_rate(self):
+        burst = traffic.make_traffic({"kind": "bursty", "rate": 10,
+                                      "peak": 50, "period": 10,
+                                      "duty": 0.2})
+        self.assertEqual([burst.pps(t) for t in (0, 1, 2, 9, 11)],
+                         [50, 50, 10, 10, 50])
+
+        day = traffic.Diurnal(10, 30, 100)
+        self.assertEqual(day.pps(0), 10)
+        self.assertEqual(day.pps(50), 30)
+        self.assertRaises(ValueError, traffic.make_traffic,
+                          {"kind": "unknown"})
+
+
+class TestSim_Switch(TestCase):
+    """
+    Test for simulated vswitch against data collection of ncd.
+    """
+
+    # setup test environment
+    def setUp(self):
+        self.clock = capture.ReplayClock(0)
+        self.sw = switch.SimSwitch(self.clock)
+        self.sw.add_pmd(1, 0, 1e9)
+        self.sw.add_pmd(2, 0, 1e9)
+        self.sw.add_port("dpdk0", traffic.Constant(6e6), 2)
+        self.sw.add_port("dpdk1", traffic.Constant(2e6), 1)
+        util.set_command_backend(self.sw)
+
+        self.ctx_patch = mock.patch.multiple(
+            dataif.Context, nlog=NlogNoop(), clock=self.clock,
+            pmd_map={}, port_to_cls={}, port_to_id={})
+        self.ctx_patch.start()
+
+    # cleanup test environment
+    def tearDown(self):
+        self.ctx_patch.stop()
+        util.set_command_backend(None)
+
+    def collect(self):
+        ctx = dataif.Context
+        for i in range(config.ncd_samples_max):
+            dataif.get_port_stats()
+            dataif.get_interface_stats()
+            dataif.get_pmd_stats(ctx.pmd_map)
+            dataif.get_pmd_rxqs(ctx.pmd_map)
+            self.clock.sleep(10)
+
+        dataif.update_pmd_load(ctx.pmd_map)
+        return ctx.pmd_map
+
+    # Test case:
+    #   pmd 1 overloaded by two rxqs, check its load and drops in port
+    #   are seen by ncd.
+    def test_collect_overload(self):
+        pmd_map = self.collect()
+        self.assertEqual(pmd_map[1].pmd_load, 100)
+        self.assertEqual(pmd_map[2].pmd_load, 75)
+        self.assertEqual(sorted(pmd_map[1].port_map.keys()),
+                         ["dpdk0", "dpdk1"])
+
+        port = dataif.Context.port_to_cls["dpdk0"]
+        self.assertGreater(dataif.port_drop_ppm(port)[0], 0)
+
+    # Test case:
+    #   set and remove pmd-rxq-affinity, check rxqs are reassigned.
+    def test_affinity(self):
+        self.sw("ovs-vsctl --no-wait -- set Interface dpdk1 "
+                "other_config:pmd-rxq-affinity=0:2,")
+        self.assertEqual(self.sw.port_map["dpdk1"].rxq_pmd, {0: 2})
+        self.assertEqual(self.sw.port_map["dpdk0"].rxq_pmd, {0: 1, 1: 1})
+        self.assertEqual(dataif.get_interface_affinity(),
+                         {"dpdk0": None, "dpdk1": "0:2,"})
+
+        self.sw("ovs-vsctl --no-wait -- remove Interface dpdk1 "
+                "other_config pmd-rxq-affinity")
+        self.assertEqual(self.sw.port_map["dpdk1"].rxq_pmd, {0: 1})
+        self.assertEqual(self.sw.n_reconfig, 2)
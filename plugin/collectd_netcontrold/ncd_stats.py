@@ -32,7 +32,7 @@ def read_func():
         return
 
     try:
-        sock.sendall("CTLD_REBAL_CNT")
+        sock.sendall("CTLD_REBAL_CNT\n")
         ack_len = 0
         while (ack_len < len("CTLD_DATA_ACK XXXXXX")):
             data = sock.recv(len("CTLD_DATA_ACK XXXXXX"))